@@ -1,44 +1,32 @@
-import json
 from pathlib import Path
-from collections import defaultdict
 import sys
 import argparse
 
 import matplotlib.pyplot as plt
 
 sys.path.append(str(Path(__file__).resolve().parent / 'scripts'))
-from memory_manager import extract_topic
+import memory_store
+import topic_service
 
-MEMORY_FILE = Path('data/memory/memory.json')
+MEMORY_FILE = memory_store.MEMORY_FILE
 REPORT_FILE = Path('data/analytics_report.md')
 PLOT_FILE = Path('data/topic_frequency.png')
 
-def load_entries(path: Path):
-    if not path.exists():
-        return []
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+def load_stats(path: Path):
+    """Per-topic aggregates from the store, labelling any untagged entries first."""
+    if not path.exists() and not memory_store.db_path_for(path).exists():
         return []
+    topic_service.label_pending(path)
+    return memory_store.get_store(path).topic_stats()
 
-def analyze(entries):
-    scores = defaultdict(list)
-    counts = defaultdict(int)
-    for e in entries:
-        topic = e.get('topic')
-        if not topic:
-            text = f"{e.get('question', '')} {e.get('summary', '')} {e.get('answer', '')}"
-            topic = extract_topic(text) or 'misc'
-        score = e.get('impact_score', 0)
-        scores[topic].append(score)
-        counts[topic] += 1
-    avg_scores = {t: sum(v)/len(v) for t, v in scores.items()}
+def analyze(stats):
+    avg_scores = {s['topic']: s['avg_score'] for s in stats}
+    counts = {s['topic']: s['count'] for s in stats}
     return avg_scores, counts
 
-def top_questions(entries, n=5):
-    sorted_e = sorted(entries, key=lambda x: x.get('impact_score', 0), reverse=True)
-    return [(e['question'], e.get('impact_score', 0)) for e in sorted_e[:n]]
+def top_questions(path: Path, n=5):
+    entries = memory_store.get_store(path).top_entries(n)
+    return [(e['question'], e.get('impact_score', 0)) for e in entries]
 
 def plot_counts(counts):
     topics = list(counts.keys())
@@ -77,12 +65,12 @@ def main():
     parser.add_argument('--memory-file', type=Path, default=MEMORY_FILE)
     args = parser.parse_args()
 
-    entries = load_entries(args.memory_file)
-    if not entries:
+    stats = load_stats(args.memory_file)
+    if not stats:
         print('No memory entries found.')
         return
-    avg_scores, counts = analyze(entries)
-    top_qs = top_questions(entries)
+    avg_scores, counts = analyze(stats)
+    top_qs = top_questions(args.memory_file)
     plot_counts(counts)
     write_report(avg_scores, counts, top_qs)
     print(f'Report saved to {REPORT_FILE}')
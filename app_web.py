@@ -1,16 +1,65 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from pathlib import Path
-import re
+import argparse
 import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
 
-from scripts.pdf_parser import parse_pdf_to_chunks, save_chunks_to_json
-from scripts.rag_engine import get_relevant_chunks
-from scripts.ollama_interface import query_llama
-from scripts.memory_manager import add_entry, load_log
+sys.path.append(str(Path(__file__).resolve().parent / 'scripts'))
+
+from pdf_parser import delete_document, ingest_pdf
+from rag_engine import document_files, list_documents, load_corpus, warm_up
+from ask_pipeline import get_pipeline
+from memory_manager import MEMORY_FILE
+from job_queue import Admission, JobQueue, Saturated
+from ollama_interface import llm_slots
+import memory_store
+import metrics
 
 PDF_DIR = Path('data/pdfs')
+# Uploads wait here until their job parses them; only then do they replace data/pdfs/<name>.
+INCOMING_DIR = PDF_DIR / '.incoming'
+MAX_PAGE_SIZE = 500
+
+# Uploads are parsed by background workers; beyond UPLOAD_QUEUE_SIZE waiting
+# jobs (or ASK_MAX_INFLIGHT questions being answered) the server answers 429.
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', '1'))
+UPLOAD_QUEUE_SIZE = int(os.environ.get('UPLOAD_QUEUE_SIZE', '8'))
+ASK_MAX_INFLIGHT = int(os.environ.get('ASK_MAX_INFLIGHT', '8'))
 
 app = Flask(__name__, static_folder='.')
+uploads = JobQueue(workers=UPLOAD_WORKERS, max_pending=UPLOAD_QUEUE_SIZE)
+asks = Admission(ASK_MAX_INFLIGHT)
+
+metrics.enable(os.environ.get('RAG_TRACE_FILE'))
+metrics.register_gauge('rag_llm_slots_active', lambda: llm_slots.active, 'LLM calls in progress')
+metrics.register_gauge('rag_llm_slots_waiting', lambda: llm_slots.waiting, 'LLM calls waiting for a slot')
+metrics.register_gauge('rag_asks_in_flight', lambda: asks.active, 'Questions being answered')
+metrics.register_gauge(
+    'rag_upload_jobs',
+    lambda: {(('status', k),): v for k, v in uploads.stats().items() if k not in ('workers', 'max_pending')},
+    'Upload jobs by status',
+)
+
+def busy(message, retry_after=1):
+    response = jsonify({'error': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@app.after_request
+def count_request(response):
+    metrics.inc('rag_http_requests_total', help='HTTP requests served',
+                endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
@@ -21,12 +70,58 @@ def upload_pdf():
     if 'pdf' not in request.files:
         return jsonify({'error': 'no file'}), 400
     f = request.files['pdf']
-    PDF_DIR.mkdir(parents=True, exist_ok=True)
-    path = PDF_DIR / f.filename
+    filename = Path(f.filename).name
+    if not filename:
+        return jsonify({'error': 'no file'}), 400
+    if uploads.full():
+        return busy('upload queue is full', 5)
+    INCOMING_DIR.mkdir(parents=True, exist_ok=True)
+    path = INCOMING_DIR / f'{uuid.uuid4().hex}_{filename}'
     f.save(path)
-    chunks = parse_pdf_to_chunks(path)
-    save_chunks_to_json(f.filename, chunks)
-    return jsonify({'status': 'ok', 'chunks': len(chunks)})
+    try:
+        job = uploads.submit('upload', ingest_job, path, filename)
+    except Saturated as e:
+        path.unlink()
+        return busy(str(e), e.retry_after)
+    return jsonify({'status': job.status, 'job_id': job.id, 'status_url': f'/jobs/{job.id}'}), 202
+
+def ingest_job(job, path, filename):
+    """Parse an upload from its private temp file, then move it into PDF_DIR."""
+    job.report(file=filename)
+    try:
+        count = ingest_pdf(path, filename, on_page=lambda page, pages: job.report(page=page, pages=pages))
+        os.replace(path, PDF_DIR / filename)
+    finally:
+        if path.exists():
+            path.unlink()
+    return {'chunks': count}
+
+@app.route('/documents')
+def documents():
+    return jsonify({'documents': list_documents()})
+
+@app.route('/documents/<path:source>', methods=['DELETE'])
+def delete_doc(source):
+    files = document_files(source)
+    if files is None or not delete_document(source, files):
+        return jsonify({'error': 'unknown document'}), 404
+    load_corpus()
+    return jsonify({'deleted': source})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = uploads.get(job_id)
+    if job is None:
+        return jsonify({'error': 'unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/status')
+def server_status():
+    return jsonify({
+        'uploads': uploads.stats(),
+        'asks': asks.stats(),
+        'llm': {'limit': llm_slots.limit, 'active': llm_slots.active, 'waiting': llm_slots.waiting},
+    })
 
 @app.route('/ask', methods=['POST'])
 def ask_question():
@@ -34,24 +129,152 @@ def ask_question():
     question = data.get('question')
     if not question:
         return jsonify({'error': 'no question'}), 400
-    chunks = get_relevant_chunks(question)
-    context = "\n\n".join([c['text'] for c in chunks])
-    response = query_llama(question, system_context=context)
-    summary = query_llama(f"Summarize this answer in 1 sentence:\n{response}")
-    score_str = query_llama(
-        f"Rate the importance of this answer on a scale from 1 to 10:\n{response}"
-    )
-    match = re.search(r'\b([1-9]|10)\b', score_str)
+    if not asks.try_enter():
+        return busy('too many questions in flight')
     try:
-        impact = int(match.group(1)) if match else 5
-    except Exception:
-        impact = 5
-    add_entry(question, response, summary, impact)
-    return jsonify({'answer': response, 'impact': impact})
+        result = get_pipeline().ask(
+            question, bypass_cache=bool(data.get('bypass_cache')), sources=data.get('sources') or None
+        )
+    finally:
+        asks.leave()
+    if result['error']:
+        return jsonify(result['error']), 504 if result['error']['kind'] == 'timeout' else 502
+    return jsonify({
+        'answer': result['answer'],
+        'summary': result['summary'],
+        'impact': result['impact_score'],
+        'timings': result['timings'],
+        'context_tokens': result.get('context_tokens'),
+        'tokens_saved': result.get('tokens_saved'),
+        'cached': result['cached'],
+    })
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def chunk_meta(chunk):
+    return {k: v for k, v in chunk.items() if k != 'text'}
+
+@app.route('/ask/stream', methods=['GET', 'POST'])
+def ask_stream():
+    """Server-sent events: chunks, token..., answer, summary, impact, done.
+
+    A failed LLM call ends the stream with an ``error`` event instead.
+    """
+    data = request.get_json(silent=True) or {}
+    question = data.get('question') or request.args.get('question')
+    if not question:
+        return jsonify({'error': 'no question'}), 400
+    bypass_cache = bool(data.get('bypass_cache') or request.args.get('bypass_cache'))
+    sources = data.get('sources') or request.args.getlist('source') or None
+    if not asks.try_enter():
+        return busy('too many questions in flight')
+
+    events = queue.Queue()
+    start = time.perf_counter()
+
+    def on_event(name, value):
+        if name == 'chunks':
+            events.put(('chunks', [chunk_meta(c) for c in value]))
+        elif name == 'impact_score':
+            events.put(('impact', value))
+        else:
+            events.put((name, value))
+
+    def on_token(text):
+        events.put(('token', text))
+
+    def run():
+        try:
+            result = get_pipeline().ask(
+                question, on_event=on_event, on_token=on_token, bypass_cache=bypass_cache, sources=sources
+            )
+            # A failed LLM call has already been sent as an 'error' event.
+            if not result['error']:
+                events.put(('done', {
+                    'timings': result['timings'],
+                    'context_tokens': result.get('context_tokens'),
+                    'tokens_saved': result.get('tokens_saved'),
+                    'cached': result['cached'],
+                }))
+        except Exception as e:
+            events.put(('error', {'error': str(e)}))
+        finally:
+            asks.leave()
+        events.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+
+    def generate():
+        first_token = None
+        while True:
+            item = events.get()
+            if item is None:
+                return
+            name, value = item
+            if name == 'token' and first_token is None:
+                first_token = time.perf_counter() - start
+            if name == 'done':
+                value['time_to_first_token'] = first_token
+            yield sse(name, value)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(generate(), mimetype='text/event-stream', headers=headers)
+
+@app.route('/cache/stats')
+def cache_stats():
+    cache = get_pipeline().cache
+    return jsonify(cache.stats() if cache is not None else {'enabled': False})
 
 @app.route('/memory')
 def memory():
-    return jsonify(load_log())
+    """Page through the memory log, newest first.
+
+    Query parameters: ``cursor`` (from the previous page's ``next_cursor``),
+    ``limit``, ``topic``, ``since``/``until`` (ISO timestamps),
+    ``min_score``, ``q`` (text substring) and ``fields`` (comma-separated).
+    """
+    args = request.args
+    try:
+        limit = min(max(int(args.get('limit', 50)), 1), MAX_PAGE_SIZE)
+        cursor = int(args['cursor']) if args.get('cursor') else None
+        min_score = float(args['min_score']) if args.get('min_score') else None
+    except ValueError:
+        return jsonify({'error': 'invalid limit, cursor or min_score'}), 400
+    fields = [f.strip() for f in args['fields'].split(',')] if args.get('fields') else None
+    page = memory_store.get_store(MEMORY_FILE).query(
+        cursor=cursor,
+        limit=limit,
+        topic=args.get('topic'),
+        since=args.get('since'),
+        until=args.get('until'),
+        min_score=min_score,
+        text=args.get('q'),
+        fields=fields,
+    )
+    return jsonify(page)
+
+def serve(host, port, threads):
+    """Run under waitress, a production WSGI server, if it is installed."""
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        print('⚠️ waitress is not installed; using the threaded Flask server')
+        app.run(host=host, port=port, threaded=True, debug=False)
+        return
+    print(f'🚀 Serving on http://{host}:{port} with {threads} threads')
+    waitress_serve(app, host=host, port=port, threads=threads)
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    parser = argparse.ArgumentParser(description='Research assistant web app')
+    parser.add_argument('--production', action='store_true', help='Serve with waitress instead of the debug server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=16, help='Request threads in production mode')
+    args = parser.parse_args()
+
+    warm_up()
+    if args.production:
+        serve(args.host, args.port, args.threads)
+    else:
+        app.run(host=args.host, port=args.port, debug=True)
@@ -0,0 +1,64 @@
+"""Offline stand-ins for the embedding model and the LLM.
+
+:class:`HashingModel` mimics ``SentenceTransformer.encode`` with a seeded
+hashing-trick embedding, so benchmarks exercise the real storage, indexing
+and scoring code without downloading weights or using a GPU. The fake LLM
+answers like ``scripts/fake_ollama.py``, optionally after a fixed delay.
+"""
+import time
+import zlib
+
+import numpy as np
+
+from fake_ollama import fake_completion
+
+
+class HashingModel:
+    def __init__(self, dim=384):
+        self.dim = dim
+        self._buckets = {}
+
+    def _bucket(self, word):
+        bucket = self._buckets.get(word)
+        if bucket is None:
+            h = zlib.crc32(word.encode("utf-8"))
+            bucket = self._buckets[word] = (h % self.dim, 1.0 if h & 1 << 31 else -1.0)
+        return bucket
+
+    def encode(self, texts, batch_size=64, convert_to_numpy=True, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                j, sign = self._bucket(word.strip(".,?!"))
+                out[i, j] += sign
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+
+def install(dim=384):
+    """Route every embedding call through :class:`HashingModel`."""
+    import embedding_model
+    import topic_service
+
+    embedding_model._model = HashingModel(dim)
+    embedding_model.query_cache.clear()
+    # KeyBERT cannot wrap the fake model; use the term-frequency fallback.
+    topic_service._kw_model = False
+
+
+def make_llm(delay=0.0):
+    """A deterministic ``query_llama`` replacement."""
+
+    def llm(prompt, system_context=None, on_token=None, **kwargs):
+        if delay:
+            time.sleep(delay)
+        text = fake_completion(prompt, system_context)
+        if on_token is not None:
+            for word in text.split(" "):
+                on_token(word + " ")
+        return text
+
+    return llm
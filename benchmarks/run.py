@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""Run the performance benchmarks and compare them with a baseline.
+
+Every scenario runs in a fresh temporary directory on synthetic data, with
+a hashing embedding model and a fake LLM by default, so results are
+reproducible offline on a CPU:
+
+- ``retrieval``: index build time and per-query p50/p95 latency for each
+  retrieval mode at each corpus size
+- ``ingest``:    bulk PDF ingestion throughput
+- ``add_entry``: cost of logging an answer against memory histories of
+  increasing size
+- ``analytics``: runtime of the reflection, gap and analytics aggregations
+- ``ask``:       end-to-end pipeline latency with the fake LLM
+
+    python benchmarks/run.py --preset quick --output results.json
+    python benchmarks/run.py --baseline results.json      # compare with an earlier run
+    python benchmarks/run.py retrieval --sizes 100000 1000000 --modes dense prefilter
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "scripts"))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+SCENARIOS = ["retrieval", "ingest", "add_entry", "analytics", "ask"]
+PRESETS = {
+    "quick": {"sizes": [1000], "history": [1000]},
+    "default": {"sizes": [1000, 10000], "history": [1000, 10000]},
+    "full": {"sizes": [1000, 10000, 100000, 1000000], "history": [1000, 10000, 100000]},
+}
+
+
+def percentiles(samples):
+    ms = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+@contextmanager
+def workspace():
+    """Run inside a fresh directory, so every ``data/...`` path is private."""
+    cwd = os.getcwd()
+    tmp = tempfile.mkdtemp(prefix="rag-bench-")
+    os.chdir(tmp)
+    reset_state()
+    try:
+        yield Path(tmp)
+    finally:
+        reset_state()
+        os.chdir(cwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def reset_state():
+    """Drop process-wide caches that remember the previous workspace."""
+    import topic_service
+
+    for labeler in list(topic_service._labelers.values()):
+        labeler.wait()
+
+    import ann_index
+    import answer_cache
+    import ask_pipeline
+    import embedding_model
+    import embedding_store
+    import lexical_index
+    import local_scorer
+    import memory_store
+    import rag_engine
+
+    if ask_pipeline._pipeline is not None:
+        ask_pipeline._pipeline.shutdown()
+        ask_pipeline._pipeline = None
+    answer_cache._cache = None
+    local_scorer._model = (None, None)
+    embedding_store._store = None
+    ann_index._indexes.clear()
+    lexical_index._index = None
+    lexical_index._fingerprint = None
+    rag_engine._row_lookup = (None, {})
+    rag_engine._corpus = (None, 0, {}, {})
+    for store in memory_store._stores.values():
+        store.close()
+    memory_store._stores.clear()
+    topic_service._cache.clear()
+    embedding_model.query_cache.clear()
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    value = fn(*args, **kwargs)
+    return value, time.perf_counter() - start
+
+
+# -- scenarios ------------------------------------------------------------------
+
+
+def bench_retrieval(args):
+    import embedding_model
+    import rag_engine
+    import synthetic
+
+    results = []
+    queries = synthetic.make_queries(args.queries)
+    for size in args.sizes:
+        with workspace():
+            synthetic.make_corpus(size, rag_engine.CHUNK_DIR)
+            (metadata, rows), build = timed(rag_engine.load_corpus)
+            _, resync = timed(rag_engine.load_corpus)
+            results.append({
+                "scenario": "retrieval",
+                "params": {"chunks": size, "stage": "build"},
+                "metrics": {"build_s": build, "chunks_per_s": size / build, "resync_s": resync},
+            })
+            for mode in args.modes:
+                for backend in args.backends:
+                    if mode == "lexical" and backend != args.backends[0]:
+                        continue
+                    # Warm-up builds the mode's index; then time cold query embeddings.
+                    rag_engine.get_relevant_chunks(queries[0], args.top_k, backend=backend, mode=mode)
+                    embedding_model.query_cache.clear()
+                    samples = []
+                    for q in queries:
+                        _, seconds = timed(rag_engine.get_relevant_chunks, q, args.top_k, backend=backend, mode=mode)
+                        samples.append(seconds)
+                    metrics = percentiles(samples)
+                    metrics["qps"] = len(samples) / sum(samples)
+                    params = {"chunks": size, "mode": mode}
+                    if mode != "lexical":
+                        params["backend"] = backend
+                    results.append({"scenario": "retrieval", "params": params, "metrics": metrics})
+    return results
+
+
+def bench_ingest(args):
+    import bulk_ingest
+    import pdf_parser
+    import synthetic
+
+    with workspace():
+        paths = [
+            synthetic.make_pdf(pdf_parser.PDF_DIR / f"doc{i}.pdf", args.pages, seed=i)
+            for i in range(args.pdfs)
+        ]
+        size = sum(p.stat().st_size for p in paths)
+        count, single = timed(pdf_parser.ingest_pdf, paths[0])
+        report, seconds = timed(bulk_ingest.run, workers=args.workers, force=True)
+        pages = args.pdfs * args.pages
+        return [
+            {
+                "scenario": "ingest",
+                "params": {"pdfs": 1, "pages": args.pages, "workers": 1},
+                "metrics": {"total_s": single, "pages_per_s": args.pages / single, "chunks": count},
+            },
+            {
+                "scenario": "ingest",
+                "params": {"pdfs": args.pdfs, "pages": args.pages, "workers": args.workers or os.cpu_count()},
+                "metrics": {
+                    "total_s": seconds,
+                    "pages_per_s": pages / seconds,
+                    "mb_per_s": size / 1e6 / seconds,
+                    "failed": len(report["failed"]),
+                },
+            },
+        ]
+
+
+def bench_add_entry(args):
+    import memory_manager
+    import synthetic
+    import topic_service
+
+    results = []
+    for history in args.history:
+        with workspace():
+            _, seed_time = timed(synthetic.make_memory_log, history, memory_manager.MEMORY_FILE)
+            samples = []
+            for i in range(args.adds):
+                _, seconds = timed(
+                    memory_manager.add_entry,
+                    f"Benchmark question {i} about retrieval latency?",
+                    "A synthetic answer about retrieval latency and indexing.",
+                    "Synthetic summary.",
+                    5,
+                )
+                samples.append(seconds)
+            _, drain = timed(topic_service.get_labeler(memory_manager.MEMORY_FILE).wait)
+            metrics = percentiles(samples)
+            metrics["topic_drain_s"] = drain
+            metrics["seed_s"] = seed_time
+            results.append({"scenario": "add_entry", "params": {"history": history}, "metrics": metrics})
+    return results
+
+
+def bench_analytics(args):
+    import memory_store
+    import reflect_by_topic
+    import synthetic
+    import gap_analyzer
+
+    try:
+        import analytics_dashboard
+    except ImportError:  # matplotlib is only needed for the plot
+        analytics_dashboard = None
+
+    results = []
+    for history in args.history:
+        with workspace():
+            path = memory_store.MEMORY_FILE
+            synthetic.make_memory_log(history, path)
+            _, load = timed(memory_store.load_entries, path)
+            metrics = {"load_s": load}
+
+            def reflect():
+                groups = reflect_by_topic.load_groups(path)
+                return [reflect_by_topic.topic_summary(t, items) for t, items in groups.items()]
+
+            def gaps():
+                selected = gap_analyzer.filter_by_mode(
+                    gap_analyzer.analyze_stats(gap_analyzer.load_stats(path)), "all"
+                )
+                return gap_analyzer.add_open_questions(selected, path)
+
+            _, metrics["reflect_s"] = timed(reflect)
+            _, metrics["gap_s"] = timed(gaps)
+            _, metrics["semantic_gap_s"] = timed(gap_analyzer.analyze_clusters, path)
+            if analytics_dashboard is not None:
+                def analytics():
+                    analytics_dashboard.analyze(analytics_dashboard.load_stats(path))
+                    return analytics_dashboard.top_questions(path)
+
+                _, metrics["analytics_s"] = timed(analytics)
+            results.append({"scenario": "analytics", "params": {"history": history}, "metrics": metrics})
+    return results
+
+
+def bench_ask(args):
+    import fakes
+    import rag_engine
+    import synthetic
+    import local_scorer
+    import memory_store
+    from ask_pipeline import AskPipeline
+
+    results = []
+    for post_answer in ("llm", "local"):
+        with workspace():
+            synthetic.make_corpus(args.sizes[0], rag_engine.CHUNK_DIR)
+            rag_engine.load_corpus()
+            if post_answer == "local":
+                synthetic.make_memory_log(200, memory_store.MEMORY_FILE)
+                local_scorer.train()
+            llm = fakes.make_llm(args.llm_delay)
+            calls = []
+
+            def counting_llm(*a, **kw):
+                calls.append(1)
+                return llm(*a, **kw)
+
+            pipeline = AskPipeline(llm=counting_llm, post_answer=post_answer)
+            samples = []
+            for q in synthetic.make_queries(args.asks, seed=2):
+                result = pipeline.ask(q, bypass_cache=True)
+                samples.append(result["timings"]["total"])
+            pipeline.wait()
+            pipeline.shutdown()
+            metrics = percentiles(samples)
+            metrics["llm_calls_per_question"] = len(calls) / max(len(samples), 1)
+            results.append({
+                "scenario": "ask",
+                "params": {"chunks": args.sizes[0], "llm_delay": args.llm_delay, "post_answer": post_answer},
+                "metrics": metrics,
+            })
+    return results
+
+
+BENCHES = {
+    "retrieval": bench_retrieval,
+    "ingest": bench_ingest,
+    "add_entry": bench_add_entry,
+    "analytics": bench_analytics,
+    "ask": bench_ask,
+}
+
+
+# -- results --------------------------------------------------------------------
+
+
+def environment(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "embeddings": "model" if args.real_model else "hashing",
+    }
+
+
+def result_key(result):
+    return result["scenario"] + " " + json.dumps(result["params"], sort_keys=True)
+
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s") or metric == "qps"
+
+
+def compare(results, baseline, tolerance, min_delta=0.001):
+    """Print metric changes against ``baseline``; return the list of regressions.
+
+    Timing changes smaller than ``min_delta`` seconds are treated as noise.
+    """
+    old = {result_key(r): r["metrics"] for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        before = old.get(result_key(result))
+        if before is None:
+            continue
+        for metric, value in result["metrics"].items():
+            prev = before.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(prev, (int, float)) or not prev:
+                continue
+            if not (metric.endswith(("_s", "_ms", "_per_s")) or metric == "qps"):
+                continue
+            change = value / prev - 1
+            worse = -change if higher_is_better(metric) else change
+            scale = 1e-3 if metric.endswith("_ms") else 1.0
+            noise = not higher_is_better(metric) and abs(value - prev) * scale < min_delta
+            flag = ""
+            if noise:
+                pass
+            elif worse > tolerance:
+                flag = "  ❌ regression"
+                regressions.append((result_key(result), metric, prev, value))
+            elif worse < -tolerance:
+                flag = "  ✅ faster"
+            print(f"{result_key(result)} {metric}: {prev:.4g} -> {value:.4g} ({change:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the rag-memory-llama benchmarks")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--sizes", type=int, nargs="+", help="Corpus sizes in chunks")
+    parser.add_argument("--history", type=int, nargs="+", help="Memory log sizes in entries")
+    parser.add_argument("--modes", nargs="+", default=["dense", "hybrid", "prefilter", "lexical"])
+    parser.add_argument("--backends", nargs="+", default=["exact"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--pdfs", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--adds", type=int, default=200)
+    parser.add_argument("--asks", type=int, default=50)
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="Seconds the fake LLM sleeps per call")
+    parser.add_argument("--real-model", action="store_true", help="Use the real embedding model")
+    parser.add_argument("--output", type=Path, help="Write results as JSON to this file")
+    parser.add_argument("--baseline", type=Path, help="Compare with a previous results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before flagging")
+    parser.add_argument("--min-delta", type=float, default=0.001,
+                        help="Ignore timing changes smaller than this many seconds")
+    args = parser.parse_args()
+    args.sizes = args.sizes or PRESETS[args.preset]["sizes"]
+    args.history = args.history or PRESETS[args.preset]["history"]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if not args.real_model:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        import fakes
+
+        fakes.install()
+
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        print(f"▶️ {name}")
+        for result in BENCHES[name](args):
+            results.append(result)
+            shown = ", ".join(f"{k} {v:.4g}" for k, v in result["metrics"].items() if isinstance(v, (int, float)))
+            print(f"   {json.dumps(result['params'], sort_keys=True)}: {shown}")
+
+    report = {"environment": environment(args), "results": results}
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results saved to {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta)
+        if regressions:
+            print(f"❌ {len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Deterministic synthetic data for the benchmarks.
+
+Text is drawn from a fixed vocabulary with a Zipf-like word distribution,
+so term statistics resemble real prose closely enough for retrieval and
+chunking costs to be representative. Everything is seeded.
+"""
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+VOCAB_SIZE = 20000
+WORDS_PER_CHUNK = 120
+CHUNKS_PER_FILE = 1000
+TOPICS = [
+    "retrieval", "embeddings", "transformers", "attention", "memory", "indexing",
+    "latency", "quantization", "clustering", "evaluation", "tokenization", "ranking",
+]
+
+
+def vocabulary(size=VOCAB_SIZE):
+    return [f"term{i}" for i in range(size)]
+
+
+def _word_sampler(rng, size=VOCAB_SIZE):
+    weights = 1.0 / np.arange(1, size + 1) ** 1.07
+    weights /= weights.sum()
+    words = np.array(vocabulary(size))
+    return lambda n: words[rng.choice(size, size=n, p=weights)]
+
+
+def sentences(rng, sample, n_words):
+    words = sample(n_words)
+    out, i = [], 0
+    while i < n_words:
+        length = int(rng.integers(8, 20))
+        piece = words[i:i + length]
+        out.append(" ".join(piece).capitalize() + ".")
+        i += length
+    return " ".join(out)
+
+
+def make_corpus(n_chunks, chunk_dir, seed=0, words_per_chunk=WORDS_PER_CHUNK, chunks_per_file=CHUNKS_PER_FILE):
+    """Write ``n_chunks`` chunks as ``synthetic_NNNN_chunks.json`` files; returns the file count."""
+    rng = np.random.default_rng(seed)
+    sample = _word_sampler(rng)
+    chunk_dir = Path(chunk_dir)
+    chunk_dir.mkdir(parents=True, exist_ok=True)
+    files = 0
+    for start in range(0, n_chunks, chunks_per_file):
+        source = f"synthetic_{files:04d}.pdf"
+        chunks = [
+            {"id": f"c{i}", "source": source, "text": sentences(rng, sample, words_per_chunk)}
+            for i in range(start, min(start + chunks_per_file, n_chunks))
+        ]
+        with open(chunk_dir / f"synthetic_{files:04d}_chunks.json", "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        files += 1
+    return files
+
+
+def make_queries(n, seed=1, words=8):
+    rng = np.random.default_rng(seed)
+    sample = _word_sampler(rng)
+    return [" ".join(sample(words)) + "?" for _ in range(n)]
+
+
+def memory_entries(n, seed=0, start=datetime(2025, 1, 1)):
+    """Yield ``n`` memory-log entries spread over the last year, with topics."""
+    rng = np.random.default_rng(seed)
+    sample = _word_sampler(rng)
+    for i in range(n):
+        topic = TOPICS[int(rng.integers(len(TOPICS)))]
+        yield {
+            "id": f"m{i}",
+            "timestamp": (start + timedelta(minutes=int(i * 525600 / max(n, 1)))).isoformat(),
+            "question": f"How does {topic} relate to " + " ".join(sample(6)) + "?",
+            "answer": sentences(rng, sample, 80),
+            "summary": sentences(rng, sample, 15),
+            "impact_score": int(rng.integers(1, 11)),
+            "topic": topic,
+        }
+
+
+def make_memory_log(n, memory_file, seed=0):
+    """Create a memory database with ``n`` entries next to ``memory_file``."""
+    import memory_store
+
+    store = memory_store.get_store(memory_file)
+    conn = store._connect()
+    rows = [store._to_row(e) for e in memory_entries(n, seed)]
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany(
+        "INSERT INTO entries (id, timestamp, question, answer, summary, impact_score, topic, extra) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.execute("COMMIT")
+    return store
+
+
+def make_pdf(path, pages, seed=0, words_per_page=400):
+    """Write a ``pages``-page PDF of synthetic prose."""
+    import fitz
+
+    rng = np.random.default_rng(seed)
+    sample = _word_sampler(rng)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        rect = fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50)
+        page.insert_textbox(rect, sentences(rng, sample, words_per_page), fontsize=7)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc.save(path)
+    doc.close()
+    return path
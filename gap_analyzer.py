@@ -1,62 +1,84 @@
-import json
 import re
-from collections import defaultdict, Counter
+import sys
 from datetime import datetime, timedelta
 from pathlib import Path
 import argparse
-from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
 
-MEMORY_FILE = Path("data/memory/memory.json")
+sys.path.append(str(Path(__file__).resolve().parent / "scripts"))
+import memory_store
+import topic_service
+import topic_clusters
+
+MEMORY_FILE = memory_store.MEMORY_FILE
 
 OPEN_PROMPT_WORDS = re.compile(r"\b(what|how|why|should)\b", re.IGNORECASE)
 
 
-def load_entries(path: Path):
-    if not path.exists():
-        return []
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+def load_stats(path: Path):
+    """Per-topic aggregates from the store, labelling any untagged entries first."""
+    if not path.exists() and not memory_store.db_path_for(path).exists():
         return []
+    topic_service.label_pending(path)
+    return memory_store.get_store(path).topic_stats()
 
 
-def extract_topic(text: str) -> str:
-    words = re.findall(r"\b[a-zA-Z]{3,}\b", text.lower())
-    words = [w for w in words if w not in ENGLISH_STOP_WORDS]
-    if not words:
-        return "misc"
-    return Counter(words).most_common(1)[0][0]
-
-
-def group_by_topic(entries):
-    groups = defaultdict(list)
-    for e in entries:
-        topic = e.get("topic")
-        if not topic:
-            text = f"{e.get('question', '')} {e.get('summary', '')} {e.get('answer', '')}"
-            topic = extract_topic(text)
-        groups[topic].append(e)
-    return groups
-
-
-def analyze_groups(groups):
+def analyze_stats(stats):
     now = datetime.utcnow()
     gap_info = {}
-    for topic, items in groups.items():
-        total = len(items)
-        high_impact = [e for e in items if e.get("impact_score", 0) > 7]
-        open_questions = [e["question"] for e in items if OPEN_PROMPT_WORDS.search(e.get("question", ""))]
-        latest_ts = max(datetime.fromisoformat(e["timestamp"]) for e in items)
-        gap_info[topic] = {
-            "total": total,
-            "high_impact": len(high_impact),
-            "open_questions": open_questions,
+    for s in stats:
+        latest_ts = datetime.fromisoformat(s["last_timestamp"])
+        gap_info[s["topic"]] = {
+            "total": s["count"],
+            "high_impact": s["high_impact"],
             "stale": (now - latest_ts).days > 10,
         }
     return gap_info
 
 
+def add_open_questions(gaps, path: Path):
+    """Attach each selected topic's open-ended questions, read per topic."""
+    store = memory_store.get_store(path)
+    for topic, info in gaps.items():
+        entries = store.topic_entries(topic, fields=["question"])
+        info["open_questions"] = [
+            e["question"] for e in entries if OPEN_PROMPT_WORDS.search(e.get("question") or "")
+        ]
+    return gaps
+
+
+def analyze_clusters(path: Path, threshold=topic_clusters.THRESHOLD):
+    """Gap info per semantic cluster, named by its centroid keywords."""
+    clusters, _ = topic_clusters.update(path, threshold=threshold)
+    labels = clusters.labels()
+    names, info = {}, {}
+    fields = ["id", "question", "timestamp", "impact_score"]
+    for e in memory_store.get_store(path).iter_entries(fields=fields):
+        known = clusters.entries.get(e["id"])
+        if known is None:
+            continue
+        cluster = known[0]
+        name = names.get(cluster)
+        if name is None:
+            name = labels.get(cluster, f"cluster {cluster}")
+            if name in info:
+                name = f"{name} ({cluster})"
+            names[cluster] = name
+            info[name] = {"total": 0, "high_impact": 0, "open_questions": [], "latest": None}
+        item = info[name]
+        item["total"] += 1
+        if (e.get("impact_score") or 0) > 7:
+            item["high_impact"] += 1
+        if OPEN_PROMPT_WORDS.search(e.get("question") or ""):
+            item["open_questions"].append(e["question"])
+        ts = datetime.fromisoformat(e["timestamp"])
+        if item["latest"] is None or ts > item["latest"]:
+            item["latest"] = ts
+    now = datetime.utcnow()
+    for item in info.values():
+        item["stale"] = (now - item.pop("latest")).days > 10
+    return info
+
+
 def filter_by_mode(gap_info, mode):
     if mode == "focused":
         def cond(v):
@@ -104,18 +126,30 @@ def main():
     parser = argparse.ArgumentParser(description="Analyze learning gaps")
     parser.add_argument("--memory-file", type=Path, default=MEMORY_FILE)
     parser.add_argument("--mode", choices=["all", "focused", "explore"], default="all")
+    parser.add_argument(
+        "--topics",
+        choices=["keyword", "semantic"],
+        default="keyword",
+        help="Group by keyword topic or by embedding clusters (see scripts/topic_clusters.py)",
+    )
+    parser.add_argument("--threshold", type=float, default=topic_clusters.THRESHOLD,
+                        help="With --topics semantic: similarity needed to join a cluster")
     args = parser.parse_args()
 
-    entries = load_entries(args.memory_file)
-    if not entries:
+    if args.topics == "semantic":
+        exists = args.memory_file.exists() or memory_store.db_path_for(args.memory_file).exists()
+        gap_info = analyze_clusters(args.memory_file, args.threshold) if exists else {}
+    else:
+        gap_info = analyze_stats(load_stats(args.memory_file))
+    if not gap_info:
         print("No memory entries found.")
         return
-    groups = group_by_topic(entries)
-    gap_info = analyze_groups(groups)
     selected = filter_by_mode(gap_info, args.mode)
     if not selected:
         print("No gaps found for mode", args.mode)
         return
+    if args.topics == "keyword":
+        add_open_questions(selected, args.memory_file)
     output_markdown(selected)
 
 
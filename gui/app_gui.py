@@ -1,28 +1,39 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
+from tkinter import filedialog, scrolledtext, ttk
 import shutil
 import os
-import threading
+import queue
 import sys
+import time
 from pathlib import Path
-import re
 
 sys.path.append(str(Path(__file__).resolve().parent.parent / "scripts"))
 
-from memory_manager import add_entry
-
-from pdf_parser import parse_pdf_to_chunks, save_chunks_to_json
-from rag_engine import get_relevant_chunks
-from ollama_interface import query_llama
+from pdf_parser import ingest_pdf
+from rag_engine import warm_up
+from ask_pipeline import get_pipeline, format_timings
+from job_queue import Cancelled, JobQueue, Saturated
 
 PDF_DIR = Path("data/pdfs")
 CHUNK_DIR = Path("data/text_chunks")
 
+# Worker threads never touch Tk: they post messages to a queue that the main
+# loop drains every FRAME_MS, spending at most FRAME_BUDGET_MS per frame.
+FRAME_MS = 16
+FRAME_BUDGET_MS = 8
+MAX_QUEUED_JOBS = 32
+
 class PDFUploaderApp:
     def __init__(self, root):
         self.root = root
         self.root.title("📚 PDF Upload & Chunker + Query")
-        self.root.geometry("650x550")
+        self.root.geometry("650x600")
+
+        # Separate workers, so questions are not stuck behind a long PDF parse.
+        self.ingest_jobs = JobQueue(workers=1, max_pending=MAX_QUEUED_JOBS)
+        self.ask_jobs = JobQueue(workers=1, max_pending=MAX_QUEUED_JOBS)
+        self.messages = queue.Queue()
+        self.questions = []     # question jobs queued or running, oldest first
 
         self.upload_button = tk.Button(root, text="📁 Upload PDF", command=self.upload_pdf)
         self.upload_button.pack(pady=10)
@@ -31,79 +42,191 @@ class PDFUploaderApp:
         self.status_area.pack(padx=10, pady=10)
         self.status_area.insert(tk.END, "📋 Upload a PDF to begin processing...\n")
 
+        self.progress = ttk.Progressbar(root, length=400, mode="determinate")
+        self.progress.pack()
+        self.progress_label = tk.Label(root, text="")
+        self.progress_label.pack()
+
         self.query_label = tk.Label(root, text="Ask a question about your research:")
         self.query_label.pack()
 
         self.query_entry = tk.Entry(root, width=80)
         self.query_entry.pack(pady=4)
+        self.query_entry.bind("<Return>", lambda event: self.ask_question())
 
-        self.ask_button = tk.Button(root, text="🧠 Ask", command=self.ask_question)
-        self.ask_button.pack()
+        buttons = tk.Frame(root)
+        buttons.pack()
+        self.ask_button = tk.Button(buttons, text="🧠 Ask", command=self.ask_question)
+        self.ask_button.pack(side=tk.LEFT, padx=4)
+        self.cancel_button = tk.Button(buttons, text="🛑 Cancel", command=self.cancel_question, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=4)
 
         PDF_DIR.mkdir(parents=True, exist_ok=True)
         CHUNK_DIR.mkdir(parents=True, exist_ok=True)
+        self.root.after(FRAME_MS, self.drain)
+
+    # -- main thread -----------------------------------------------------------
 
     def log(self, message):
         self.status_area.insert(tk.END, f"{message}\n")
         self.status_area.see(tk.END)
 
+    def post(self, kind, *args):
+        """Queue a UI update; safe to call from any thread."""
+        self.messages.put((kind, args))
+
+    def drain(self):
+        deadline = time.perf_counter() + FRAME_BUDGET_MS / 1000
+        tokens = []
+        while time.perf_counter() < deadline:
+            try:
+                kind, args = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "token":
+                tokens.append(args[0])
+                continue
+            if tokens:
+                self.write("".join(tokens))
+                tokens = []
+            getattr(self, f"on_{kind}")(*args)
+        if tokens:
+            self.write("".join(tokens))
+        self.root.after(FRAME_MS, self.drain)
+
+    def write(self, text):
+        self.status_area.insert(tk.END, text)
+        self.status_area.see(tk.END)
+
+    def on_log(self, message):
+        self.log(message)
+
+    def on_progress(self, filename, page, pages):
+        self.progress["maximum"] = pages
+        self.progress["value"] = page
+        self.progress_label.config(text=f"🔍 Parsing {filename}: page {page}/{pages}")
+
+    def on_progress_done(self):
+        self.progress["value"] = 0
+        self.progress_label.config(text="")
+
+    def on_question_finished(self, job):
+        if job in self.questions:
+            self.questions.remove(job)
+        if not self.questions:
+            self.cancel_button.config(state=tk.DISABLED)
+
+    def submit(self, jobs, kind, fn, *args):
+        try:
+            return jobs.submit(kind, fn, *args)
+        except Saturated as e:
+            self.log(f"⚠️ Too much work queued ({e}); try again shortly.")
+            return None
+
     def upload_pdf(self):
         file_path = filedialog.askopenfilename(filetypes=[("PDF files", "*.pdf")])
         if not file_path:
             return
-        filename = os.path.basename(file_path)
-        dest_path = PDF_DIR / filename
-        try:
-            shutil.copy(file_path, dest_path)
-            self.log(f"✅ PDF uploaded: {filename}")
-            threading.Thread(target=self.process_pdf, args=(filename,)).start()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to upload PDF: {e}")
-
-    def process_pdf(self, filename):
-        try:
-            pdf_path = PDF_DIR / filename
-            self.log(f"🔍 Parsing: {filename}")
-            chunks = parse_pdf_to_chunks(pdf_path)
-            save_chunks_to_json(filename, chunks)
-            self.log(f"✅ Extracted {len(chunks)} chunks from {filename}")
-        except Exception as e:
-            self.log(f"❌ Error parsing {filename}: {e}")
+        if self.submit(self.ingest_jobs, "ingest", self.process_pdf, file_path) is not None:
+            self.log(f"📥 Queued {os.path.basename(file_path)}")
 
     def ask_question(self):
         query = self.query_entry.get().strip()
         if not query:
             self.log("⚠️ Enter a question first.")
             return
-
-        self.log(f"\n🔍 Query: {query}")
-        chunks = get_relevant_chunks(query)
-        context = "\n\n".join([c['text'] for c in chunks])
-
-        self.log("📚 Retrieved top relevant chunks...")
-        response = query_llama(query, system_context=context)
-        self.log(f"🤖 LLaMA Response:\n{response}")
-
-        summary_prompt = f"Summarize this answer in 1 sentence:\n{response}"
-        summary = query_llama(summary_prompt)
-        self.log(f"📌 Summary: {summary}")
-
-        score_prompt = f"Rate the importance of this answer on a scale from 1 to 10:\n{response}"
-        score_str = query_llama(score_prompt)
+        job = self.submit(self.ask_jobs, "ask", self.answer, query)
+        if job is not None:
+            self.questions.append(job)
+            self.cancel_button.config(state=tk.NORMAL)
+            self.query_entry.delete(0, tk.END)
+            self.log(f"📥 Queued question: {query}")
+
+    def cancel_question(self):
+        """Cancel the running question and every question still queued."""
+        cancelled = 0
+        for job in list(self.questions):
+            if self.ask_jobs.cancel(job.id):
+                cancelled += 1
+                if job.status == "cancelled":
+                    # Never started, so no question_finished will arrive for it.
+                    self.on_question_finished(job)
+        if cancelled:
+            self.log(f"\n🛑 Cancelling {cancelled} question(s)...")
+
+    # -- worker threads --------------------------------------------------------
+
+    def process_pdf(self, job, file_path):
+        filename = os.path.basename(file_path)
+        dest_path = PDF_DIR / filename
         try:
-            match = re.search(r'\b([1-9]|10)\b', score_str)
-            impact_score = int(match.group(1)) if match else 5
-        except:
-            impact_score = 5
-
-        self.log(f"⭐️ Impact Score: {impact_score}")
-        self.save_to_memory_log(query, response, summary, impact_score)
+            if Path(file_path).resolve() != dest_path.resolve():
+                shutil.copy(file_path, dest_path)
+            self.post("log", f"✅ PDF uploaded: {filename}")
+            self.post("log", f"🔍 Parsing: {filename}")
+
+            def on_page(page, pages):
+                job.check()
+                job.report(page=page, pages=pages)
+                self.post("progress", filename, page, pages)
+
+            count = ingest_pdf(dest_path, filename, on_page=on_page)
+            self.post("log", f"✅ Extracted {count} chunks from {filename}")
+            return {"chunks": count}
+        except Cancelled:
+            self.post("log", f"🛑 Stopped parsing {filename}")
+            raise
+        except Exception as e:
+            self.post("log", f"❌ Error parsing {filename}: {e}")
+            raise
+        finally:
+            self.post("progress_done")
+
+    def answer(self, job, query):
+        self.post("log", f"\n🔍 Query: {query}")
+
+        def on_token(text):
+            job.check()
+            self.post("token", text)
+
+        def on_event(name, value):
+            job.check()
+            if name == "chunks":
+                self.post("log", "📚 Retrieved top relevant chunks...")
+                self.post("log", "🤖 LLaMA Response:")
+            elif name == "answer":
+                self.post("log", "")
+            elif name == "summary":
+                self.post("log", f"📌 Summary: {value}")
+            elif name == "impact_score":
+                self.post("log", f"⭐️ Impact Score: {value}")
+            elif name == "error":
+                self.post("log", f"\n❌ LLM call failed ({value['kind']}): {value['error']}")
 
-    def save_to_memory_log(self, question, answer, summary, impact_score=5):
-        add_entry(question, answer, summary, impact_score)
-        self.log("💾 Memory log updated.")
+        try:
+            result = get_pipeline().ask(query, on_event=on_event, on_token=on_token)
+        except Cancelled:
+            self.post("log", "🛑 Question cancelled; nothing was saved.")
+            raise
+        except Exception as e:
+            self.post("log", f"❌ Error answering: {e}")
+            raise
+        finally:
+            self.post("question_finished", job)
+        if result["error"]:
+            self.post("log", "⚠️ Nothing was saved.")
+            return {"error": result["error"]}
+        if result["cached"]:
+            self.post("log", f"♻️ Answered from memory (similarity {result['cached']['similarity']:.2f})")
+        else:
+            result["persisted"].add_done_callback(lambda f: self.post("log", "💾 Memory log updated."))
+        if result.get("tokens_saved"):
+            self.post("log", f"✂️ Context packing saved {result['tokens_saved']} tokens")
+        self.post("log", f"⏱️ {format_timings(result['timings'])}")
+        return {"answer": result["answer"]}
 
 if __name__ == "__main__":
+    warm_up()
     root = tk.Tk()
     app = PDFUploaderApp(root)
     root.mainloop()
@@ -1,45 +1,157 @@
 import sys
-import re
+import json
+import argparse
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parent / "scripts"))
 
-from rag_engine import get_relevant_chunks
-from ollama_interface import query_llama
-from memory_manager import add_entry
+from rag_engine import get_relevant_chunks_batch, warm_up
+from ask_pipeline import ASK_POST_ANSWER, get_pipeline, format_timings
+import answer_cache
+import metrics
 
 
-def main():
-    question = input("Ask a question: ").strip()
-    if not question:
-        print("No question entered.")
-        return
+def answer_question(question, chunks=None, verbose=True, bypass_cache=False):
+    def on_event(name, value):
+        if not verbose:
+            return
+        if name == "chunks" and value:
+            print("\nRetrieved top relevant chunks...\n")
+        elif name == "answer":
+            print(f"Response:\n{value}\n")
+        elif name == "summary":
+            print(f"Summary: {value}")
+        elif name == "impact_score":
+            print(f"Impact Score: {value}")
+        elif name == "error":
+            print(f"❌ LLM call failed ({value['kind']}): {value['error']}")
 
-    chunks = get_relevant_chunks(question)
-    context = "\n\n".join([c["text"] for c in chunks])
-    if context:
-        print("\nRetrieved top relevant chunks...\n")
-    response = query_llama(question, system_context=context)
-    print(f"Response:\n{response}\n")
+    result = get_pipeline().ask(question, chunks=chunks, on_event=on_event, bypass_cache=bypass_cache)
+    if verbose:
+        if result["cached"]:
+            hit = result["cached"]
+            print(f"(Answered from memory: \"{hit['question']}\", similarity {hit['similarity']:.2f})")
+        if result.get("context_tokens") is not None:
+            print(f"Context: {result['context_tokens']} tokens ({result['tokens_saved']} saved by packing)")
+        print(f"Timings: {format_timings(result['timings'])}")
+    return {
+        "question": question,
+        "answer": result["answer"],
+        "summary": result["summary"],
+        "impact_score": result["impact_score"],
+        "sources": [c.get("source") for c in result["chunks"]],
+        "timings": result["timings"],
+        "context_tokens": result.get("context_tokens"),
+        "tokens_saved": result.get("tokens_saved"),
+        "cached": result["cached"],
+        "error": result["error"],
+    }
 
-    summary_prompt = f"Summarize this answer in 1 sentence:\n{response}"
-    summary = query_llama(summary_prompt)
-    print(f"Summary: {summary}")
 
-    score_prompt = (
-        f"Rate the importance of this answer on a scale from 1 to 10:\n{response}"
+def run_batch(batch_file: Path, output=None, top_k=5, bypass_cache=False):
+    """Answer every non-empty line of ``batch_file``, retrieving for all at once."""
+    questions = [
+        line.strip()
+        for line in batch_file.read_text(encoding="utf-8").splitlines()
+        if line.strip()
+    ]
+    if not questions:
+        print("No questions found in batch file.")
+        return
+    print(f"Retrieving context for {len(questions)} questions...")
+    all_chunks = get_relevant_chunks_batch(questions, top_k=top_k)
+    out = open(output, "w", encoding="utf-8") if output else None
+    try:
+        for i, (question, chunks) in enumerate(zip(questions, all_chunks), 1):
+            print(f"[{i}/{len(questions)}] {question}")
+            result = answer_question(question, chunks, verbose=False, bypass_cache=bypass_cache)
+            if out:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+            elif result["error"]:
+                print(f"❌ {result['error']['error']}\n")
+            else:
+                print(f"Response:\n{result['answer']}\n")
+    finally:
+        if out:
+            out.close()
+    get_pipeline().wait()
+    if output:
+        print(f"Answers saved to {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ask questions about your research")
+    parser.add_argument(
+        "--batch-file",
+        type=Path,
+        help="Answer a file of questions (one per line) instead of prompting",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="With --batch-file: write answers as JSON lines to this file",
+    )
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Answer near-duplicate questions from memory (same as ANSWER_CACHE=1)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always run the full pipeline even if the answer cache is enabled",
     )
-    score_str = query_llama(score_prompt)
-    match = re.search(r"\b([1-9]|10)\b", score_str)
+    parser.add_argument(
+        "--post-answer",
+        choices=["llm", "local"],
+        default=ASK_POST_ANSWER,
+        help="Summarise and score with the LLM, or locally (one LLM call per question; see local_scorer.py)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a per-stage timing breakdown when done",
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        help="Append one JSON line per timed stage to this file",
+    )
+    args = parser.parse_args()
+
+    if args.profile or args.trace:
+        metrics.enable(args.trace)
     try:
-        impact_score = int(match.group(1)) if match else 5
-    except Exception:
-        impact_score = 5
+        run(args)
+    finally:
+        if args.profile:
+            print("\n⏱️ Stage breakdown:")
+            print(metrics.stage_table())
+
+
+def run(args):
+    cache = answer_cache.get_cache() if args.cache else None
+    pipeline = get_pipeline(top_k=args.top_k, cache=cache, post_answer=args.post_answer)
 
-    print(f"Impact Score: {impact_score}")
+    if args.batch_file:
+        run_batch(args.batch_file, args.output, args.top_k, args.no_cache)
+        if pipeline.cache is not None:
+            print(f"Answer cache: {pipeline.cache.stats()}")
+        return
+
+    # Load the embedding model while the user is typing.
+    warm_up()
+    question = input("Ask a question: ").strip()
+    if not question:
+        print("No question entered.")
+        return
 
-    add_entry(question, response, summary, impact_score)
-    print("Memory log updated.")
+    result = answer_question(question, bypass_cache=args.no_cache)
+    pipeline.wait()
+    if not result["cached"] and not result["error"]:
+        print("Memory log updated.")
 
 
 if __name__ == "__main__":
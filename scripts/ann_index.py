@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+"""Nearest-neighbour backends for chunk retrieval.
+
+All backends work on the unit-length vectors of the embedding store and
+return store row ids, so cosine similarity is a plain dot product.
+
+- ``exact``: brute-force scoring, the default and the fallback.
+- ``ivf``:   inverted-file index over a NumPy spherical k-means; search
+             time is tuned with ``nprobe`` (lists visited per query).
+- ``hnsw``:  graph index via the optional ``hnswlib`` package; search time
+             is tuned with ``ef``.
+- ``int8`` / ``float16``: exact search over a compact copy of the vectors
+             (a memory-mapped sidecar file, 4x / 2x smaller), then an exact
+             float32 rescoring of a shortlist of ``rescore`` x k candidates.
+             Only the shortlist touches the float32 file, so processes keep
+             just the compact pages resident.
+
+:func:`search_shards` is exact search restricted to some ranges of the
+corpus (one per document), with the ranges scored in parallel threads and
+merged into one global top-k; ``rag_engine`` uses it for source-scoped
+queries.
+
+Run ``python scripts/ann_index.py recall`` to measure recall@k of the
+approximate backends against exact search for a range of settings.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from embedding_store import LOCK_FILENAME, STORE_DIR, FileLock, write_json_atomic
+
+try:
+    import hnswlib
+except ImportError:  # optional dependency
+    hnswlib = None
+
+DEFAULT_BACKEND = "exact"
+SHARD_WORKERS = int(os.environ.get("RAG_SHARD_WORKERS", str(min(8, os.cpu_count() or 1))))
+# Below this many chunks an approximate index is not worth its overhead.
+MIN_ANN_SIZE = 2000
+
+
+def top_k_indices(scores, k):
+    """Indices of the ``k`` largest scores per row, best first."""
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+class ExactIndex:
+    name = "exact"
+
+    def __init__(self, block_size=65536):
+        self.block_size = block_size
+        self.vectors = None
+        self.rows = None
+
+    def update(self, vectors, rows, generation=None):
+        self.vectors = vectors
+        self.rows = np.asarray(rows, dtype=np.int64)
+        # Skip the gather when the live rows are simply the whole store.
+        self.contiguous = len(self.rows) == len(vectors) and np.array_equal(self.rows, np.arange(len(self.rows)))
+
+    def search(self, queries, k, block_size=None, **params):
+        """Score ``queries`` against the corpus one block of rows at a time.
+
+        Only ``block_size`` rows of the corpus (and one block of scores per
+        query) are materialised at once; a running top-k is merged per block.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        block_size = block_size or self.block_size
+        best_pos = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self.rows), block_size):
+            stop = min(start + block_size, len(self.rows))
+            if self.contiguous:
+                block = self.vectors[start:stop]
+            else:
+                block = self.vectors[self.rows[start:stop]]
+            scores = np.asarray(queries @ np.asarray(block, dtype=np.float32).T, dtype=np.float32)
+            idx = top_k_indices(scores, k)
+            best_pos = np.concatenate([best_pos, idx + start], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, idx, axis=1)], axis=1)
+            keep = top_k_indices(best_scores, k)
+            best_pos = np.take_along_axis(best_pos, keep, axis=1)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        return self.rows[best_pos], best_scores
+
+
+class CompactIndex(ExactIndex):
+    """Exact search over int8- or float16-quantized vectors with float32 rescoring.
+
+    int8 uses one scale per dimension, taken from the rows present when the
+    sidecar is built; rows appended later are clipped to it. The sidecar is
+    extended as the store grows and rebuilt when the store is.
+    """
+
+    DTYPES = {"int8": np.int8, "float16": np.float16}
+
+    def __init__(self, fmt="int8", default_rescore=4, block_size=16384):
+        super().__init__(block_size=block_size)
+        self.name = fmt
+        self.dtype = self.DTYPES[fmt]
+        self.default_rescore = default_rescore
+        self.path = STORE_DIR / f"vectors.{fmt}"
+        self.meta_path = STORE_DIR / f"vectors.{fmt}.json"
+        self.full = None
+        self.scale = None
+
+    def _quantize(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dtype is np.float16:
+            return vectors.astype(np.float16)
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def _read_meta(self):
+        try:
+            return json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _sync_file(self, vectors, generation):
+        """Make the sidecar hold every row of ``vectors``; returns its metadata."""
+        meta = self._read_meta()
+        if meta and meta["generation"] == generation and meta["count"] == len(vectors):
+            return meta
+        with FileLock(STORE_DIR / f".{self.name}.lock"):
+            meta = self._read_meta()
+            dim = vectors.shape[1]
+            if not meta or meta["generation"] != generation or meta["count"] > len(vectors):
+                scale = np.ones(dim, dtype=np.float32)
+                if self.dtype is np.int8 and len(vectors):
+                    peak = np.zeros(dim, dtype=np.float32)
+                    for start in range(0, len(vectors), self.block_size):
+                        block = np.abs(np.asarray(vectors[start:start + self.block_size], dtype=np.float32))
+                        peak = np.maximum(peak, block.max(axis=0))
+                    scale = np.where(peak > 0, peak / 127, 1.0).astype(np.float32)
+                meta = {"generation": generation, "count": 0, "scale": scale.tolist()}
+                if self.path.exists():
+                    self.path.unlink()
+            self.scale = np.asarray(meta["scale"], dtype=np.float32)
+            start = meta["count"]
+            if start < len(vectors):
+                STORE_DIR.mkdir(parents=True, exist_ok=True)
+                row_bytes = dim * np.dtype(self.dtype).itemsize
+                with open(self.path, "r+b" if self.path.exists() else "w+b") as f:
+                    f.truncate(start * row_bytes)
+                    f.seek(start * row_bytes)
+                    for block_start in range(start, len(vectors), self.block_size):
+                        block = vectors[block_start:block_start + self.block_size]
+                        f.write(np.ascontiguousarray(self._quantize(block)).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                meta["count"] = len(vectors)
+                write_json_atomic(self.meta_path, meta)
+            return meta
+
+    def update(self, vectors, rows, generation=None):
+        meta = self._sync_file(vectors, generation)
+        self.scale = np.asarray(meta["scale"], dtype=np.float32)
+        self.full = vectors
+        if len(vectors):
+            compact = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(len(vectors), vectors.shape[1]))
+        else:
+            compact = np.zeros((0, vectors.shape[1] if vectors.ndim == 2 else 0), dtype=self.dtype)
+        super().update(compact, rows, generation)
+
+    def memory(self):
+        """Bytes of the compact vectors and of the float32 vectors they stand in for."""
+        return {"compact_bytes": int(self.vectors.nbytes), "float32_bytes": int(self.full.nbytes)}
+
+    def search(self, queries, k, rescore=None, block_size=None, **params):
+        queries = np.asarray(queries, dtype=np.float32)
+        shortlist = max(k, k * (rescore or self.default_rescore))
+        cand, _ = super().search(queries * self.scale, shortlist, block_size=block_size)
+        all_ids, all_scores = [], []
+        for q, rows in zip(queries, cand):
+            rows = np.sort(rows[rows >= 0])
+            scores = np.asarray(self.full[rows], dtype=np.float32) @ q
+            idx = top_k_indices(scores, k)[0]
+            all_ids.append(rows[idx])
+            all_scores.append(scores[idx])
+        return _pad(all_ids, all_scores, k)
+
+
+def _merge_top_k(ids, scores, k):
+    """Merge per-part ``(ids, scores)`` column blocks into the overall top ``k``."""
+    ids = np.concatenate(ids, axis=1)
+    scores = np.concatenate(scores, axis=1)
+    keep = top_k_indices(scores, k)
+    return np.take_along_axis(ids, keep, axis=1), np.take_along_axis(scores, keep, axis=1)
+
+
+def _search_ranges(vectors, rows, ranges, queries, k, block_size):
+    best_ids = [np.zeros((len(queries), 0), dtype=np.int64)]
+    best_scores = [np.zeros((len(queries), 0), dtype=np.float32)]
+    for start, stop in ranges:
+        for lo in range(start, stop, block_size):
+            part = rows[lo:min(stop, lo + block_size)]
+            first = int(part[0])
+            if int(part[-1]) - first == len(part) - 1 and np.all(np.diff(part) == 1):
+                block = vectors[first:first + len(part)]  # one document's rows are usually contiguous
+            else:
+                block = vectors[part]
+            scores = np.asarray(queries @ np.asarray(block, dtype=np.float32).T, dtype=np.float32)
+            idx = top_k_indices(scores, k)
+            best_ids.append(part[idx])
+            best_scores.append(np.take_along_axis(scores, idx, axis=1))
+        if len(best_ids) > 8:
+            merged = _merge_top_k(best_ids, best_scores, k)
+            best_ids, best_scores = [merged[0]], [merged[1]]
+    return _merge_top_k(best_ids, best_scores, k)
+
+
+_shard_pool = None
+_shard_pool_lock = threading.Lock()
+
+
+def search_shards(vectors, rows, ranges, queries, k, workers=None, block_size=65536, min_task_rows=16384):
+    """Exact top-k over ``rows[start:stop]`` for each ``(start, stop)`` in ``ranges``.
+
+    Ranges are split or packed into tasks of roughly equal size, at least
+    ``min_task_rows`` rows each (so many small documents do not each cost a
+    thread hop); the tasks are scored in parallel and their results merged. Returns ``(store rows, scores)``.
+    """
+    global _shard_pool
+    queries = np.asarray(queries, dtype=np.float32)
+    ranges = [(start, stop) for start, stop in ranges if stop > start]
+    total = sum(stop - start for start, stop in ranges)
+    if not total:
+        empty = np.zeros((len(queries), 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    workers = workers or SHARD_WORKERS
+    target = max(min_task_rows, -(-total // workers))
+    pieces = [(lo, min(stop, lo + target)) for start, stop in ranges for lo in range(start, stop, target)]
+    tasks, current, size = [], [], 0
+    for r in pieces:
+        current.append(r)
+        size += r[1] - r[0]
+        if size >= target:
+            tasks.append(current)
+            current, size = [], 0
+    if current:
+        tasks.append(current)
+    if len(tasks) == 1 or workers == 1:
+        parts = [_search_ranges(vectors, rows, t, queries, k, block_size) for t in tasks]
+    else:
+        with _shard_pool_lock:
+            if _shard_pool is None:
+                _shard_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard")
+        parts = list(_shard_pool.map(lambda t: _search_ranges(vectors, rows, t, queries, k, block_size), tasks))
+    return _merge_top_k([p[0] for p in parts], [p[1] for p in parts], k)
+
+
+def spherical_kmeans(train, nlist, iters=10, seed=0):
+    rng = np.random.default_rng(seed)
+    train = np.asarray(train, dtype=np.float32)
+    centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(train @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = train[rng.choice(len(train), size=int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = sums / norms
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    name = "ivf"
+    path = STORE_DIR / "ivf.npz"
+
+    def __init__(self, nlist=None, default_nprobe=8, block=65536):
+        self.nlist = nlist
+        self.default_nprobe = default_nprobe
+        self.block = block
+        self.centroids = None
+        self.ids = np.zeros(0, dtype=np.int64)     # store rows, grouped by list
+        self.offsets = None                         # CSR offsets into ids
+        self.trained_on = 0
+        self.generation = None
+        self.vectors = None
+        self.live = None
+
+    def _assign(self, vectors):
+        out = []
+        for start in range(0, len(vectors), self.block):
+            block = np.asarray(vectors[start:start + self.block], dtype=np.float32)
+            out.append(np.argmax(block @ self.centroids.T, axis=1))
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+
+    def _set_lists(self, ids, lists):
+        order = np.argsort(lists, kind="stable")
+        self.ids = ids[order]
+        counts = np.bincount(lists, minlength=len(self.centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def _list_of(self):
+        lists = np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+        return lists
+
+    def train(self, vectors, rows, sample=50000, seed=0):
+        n = len(rows)
+        nlist = self.nlist or max(1, min(4096, int(np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        picked = np.sort(rng.choice(rows, size=min(n, sample), replace=False))
+        self.centroids = spherical_kmeans(vectors[picked], min(nlist, len(picked)), seed=seed)
+        self._set_lists(rows, self._assign(vectors[rows]))
+        self.trained_on = n
+
+    def update(self, vectors, rows, generation=None):
+        rows = np.asarray(rows, dtype=np.int64)
+        self.vectors = vectors
+        self.live = np.zeros(len(vectors), dtype=bool)
+        self.live[rows] = True
+        stale = self.generation != generation or (len(self.ids) and self.ids.max() >= len(vectors))
+        if self.centroids is None or stale or len(rows) > 2 * max(self.trained_on, 1):
+            self.generation = generation
+            self.train(vectors, rows)
+            self.save()
+            return
+        new = rows[~np.isin(rows, self.ids)]
+        if len(new):
+            ids = np.concatenate([self.ids, new])
+            lists = np.concatenate([self._list_of(), self._assign(vectors[new])])
+            self._set_lists(ids, lists)
+            self.save()
+
+    def search(self, queries, k, nprobe=None, **params):
+        nprobe = min(nprobe or self.default_nprobe, len(self.centroids))
+        probes = top_k_indices(queries @ self.centroids.T, nprobe)
+        all_ids, all_scores = [], []
+        for q, lists in zip(queries, probes):
+            cand = np.concatenate([self.ids[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+            cand = np.sort(cand[self.live[cand]])
+            scores = np.asarray(self.vectors[cand] @ q, dtype=np.float32)
+            idx = top_k_indices(scores, k)[0]
+            all_ids.append(cand[idx])
+            all_scores.append(scores[idx])
+        return _pad(all_ids, all_scores, k)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with FileLock(STORE_DIR / LOCK_FILENAME):
+            with open(tmp, "wb") as f:
+                np.savez(f, centroids=self.centroids, ids=self.ids, offsets=self.offsets,
+                         trained_on=self.trained_on, generation=str(self.generation))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+    @classmethod
+    def load(cls, **kwargs):
+        index = cls(**kwargs)
+        if cls.path.exists():
+            try:
+                data = np.load(cls.path)
+                index.centroids = data["centroids"]
+                index.ids = data["ids"]
+                index.offsets = data["offsets"]
+                index.trained_on = int(data["trained_on"])
+                index.generation = str(data["generation"])
+            except (OSError, KeyError, ValueError):
+                index.centroids = None
+        return index
+
+
+class HNSWIndex:
+    name = "hnsw"
+    path = STORE_DIR / "hnsw.bin"
+    meta_path = STORE_DIR / "hnsw.json"
+
+    def __init__(self, m=16, ef_construction=200, default_ef=64):
+        if hnswlib is None:
+            raise ImportError("hnswlib is not installed")
+        self.m = m
+        self.ef_construction = ef_construction
+        self.default_ef = default_ef
+        self.index = None
+        self.generation = None
+        self.ids = set()
+        self.live = set()
+
+    def update(self, vectors, rows, generation=None):
+        rows = [int(r) for r in rows]
+        dim = vectors.shape[1]
+        if self.index is None or self.generation != generation:
+            self.index = hnswlib.Index(space="ip", dim=dim)
+            self.ids, self.live = set(), set()
+            meta = None
+            if self.path.exists() and self.meta_path.exists():
+                meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            if meta and meta.get("generation") == generation:
+                self.index.load_index(str(self.path))
+                self.ids = set(meta["ids"])
+                self.live = self.ids - set(meta.get("deleted", ()))
+            else:
+                self.index.init_index(max_elements=max(len(rows), 1), ef_construction=self.ef_construction, M=self.m)
+            self.generation = generation
+        new = [r for r in rows if r not in self.ids]
+        changed = bool(new)
+        if new:
+            needed = len(self.ids) + len(new)
+            if needed > self.index.get_max_elements():
+                self.index.resize_index(needed)
+            self.index.add_items(np.asarray(vectors[new], dtype=np.float32), np.asarray(new))
+            self.ids.update(new)
+        live = set(rows)
+        for r in (self.live if self.live else self.ids) - live:
+            try:
+                self.index.mark_deleted(r)
+                changed = True
+            except RuntimeError:
+                pass
+        # Rows that were deleted earlier and have come back (e.g. a re-ingested document).
+        for r in (live - self.live) & (self.ids - set(new)):
+            try:
+                self.index.unmark_deleted(r)
+                changed = True
+            except RuntimeError:
+                pass
+        self.live = live
+        if changed:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with FileLock(STORE_DIR / LOCK_FILENAME):
+                self.index.save_index(str(tmp))
+                os.replace(tmp, self.path)
+                write_json_atomic(self.meta_path, {
+                    "generation": generation,
+                    "ids": sorted(self.ids),
+                    "deleted": sorted(self.ids - live),
+                })
+
+    def search(self, queries, k, ef=None, **params):
+        k = min(k, len(self.live))
+        if k <= 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.int64), empty
+        self.index.set_ef(max(ef or self.default_ef, k))
+        labels, distances = self.index.knn_query(np.asarray(queries, dtype=np.float32), k=k)
+        return labels.astype(np.int64), (1.0 - distances).astype(np.float32)
+
+
+def _pad(all_ids, all_scores, k):
+    width = min(k, max((len(i) for i in all_ids), default=0))
+    ids = np.full((len(all_ids), width), -1, dtype=np.int64)
+    scores = np.full((len(all_ids), width), -np.inf, dtype=np.float32)
+    for i, (row_ids, row_scores) in enumerate(zip(all_ids, all_scores)):
+        ids[i, :len(row_ids)] = row_ids[:width]
+        scores[i, :len(row_scores)] = row_scores[:width]
+    return ids, scores
+
+
+BACKENDS = {
+    "exact": ExactIndex,
+    "ivf": IVFIndex.load,
+    "hnsw": HNSWIndex,
+    "int8": lambda: CompactIndex("int8"),
+    "float16": lambda: CompactIndex("float16"),
+}
+_indexes = {}
+# Request threads share the cached indexes; creation and updates are serialised.
+_indexes_lock = threading.RLock()
+
+
+def get_index(backend, vectors, rows, fingerprint, generation=None):
+    """Return an up-to-date index, falling back to exact search when needed."""
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown retrieval backend: {backend}")
+    if backend != "exact" and len(rows) < MIN_ANN_SIZE:
+        backend = "exact"
+    with _indexes_lock:
+        cached = _indexes.get(backend)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        try:
+            index = cached[1] if cached is not None else BACKENDS[backend]()
+            index.update(vectors, rows, generation)
+        except ImportError:
+            return get_index("exact", vectors, rows, fingerprint, generation)
+        _indexes[backend] = (fingerprint, index)
+        return index
+
+
+def recall_at_k(exact_ids, approx_ids):
+    """Mean fraction of the exact top-k found by the approximate search."""
+    hits = [len(set(e[e >= 0]) & set(a[a >= 0])) / max(1, len(e[e >= 0])) for e, a in zip(exact_ids, approx_ids)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def measure_recall(index, queries, k, settings, exact=None, param="nprobe"):
+    """Return ``[{param: value, recall, ms_per_query}, ...]`` for each setting."""
+    exact_ids, _ = exact.search(queries, k)
+    results = []
+    for value in settings:
+        start = time.perf_counter()
+        ids, _ = index.search(queries, k, **{param: value})
+        elapsed = (time.perf_counter() - start) * 1000 / max(1, len(queries))
+        results.append({param: value, "recall": recall_at_k(exact_ids, ids), "ms_per_query": elapsed})
+    start = time.perf_counter()
+    exact.search(queries, k)
+    results.append({param: "exact", "recall": 1.0,
+                    "ms_per_query": (time.perf_counter() - start) * 1000 / max(1, len(queries))})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ANN recall@k against exact search")
+    parser.add_argument("command", choices=["recall"])
+    parser.add_argument("--backend", choices=["ivf", "hnsw", "int8", "float16"], default="ivf")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--settings", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                        help="nprobe values for ivf, ef values for hnsw, rescore factors for int8/float16")
+    parser.add_argument("--queries", type=int, default=200, help="Number of sampled queries")
+    parser.add_argument("--questions-file", type=Path,
+                        help="Text file with one question per line to use as queries")
+    args = parser.parse_args()
+
+    import rag_engine
+
+    metadata, rows = rag_engine.get_store().sync(rag_engine.encode_texts, rag_engine.CHUNK_DIR)
+    if not metadata:
+        print("No chunks to index.")
+        return
+    store = rag_engine.get_store()
+    vectors = store.vectors()
+    if args.questions_file:
+        questions = [l.strip() for l in args.questions_file.read_text(encoding="utf-8").splitlines() if l.strip()]
+        queries = rag_engine.encode_queries(questions)
+    else:
+        # Perturbed corpus vectors stand in for real questions.
+        rng = np.random.default_rng(0)
+        picked = rows[rng.choice(len(rows), size=min(args.queries, len(rows)), replace=False)]
+        queries = np.asarray(vectors[np.sort(picked)], dtype=np.float32)
+        queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    exact = ExactIndex()
+    exact.update(vectors, rows)
+    try:
+        index = BACKENDS[args.backend]()
+    except ImportError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    index.update(vectors, rows, store.generation)
+    param = {"ivf": "nprobe", "hnsw": "ef"}.get(args.backend, "rescore")
+    print(f"{args.backend} over {len(rows)} chunks, {len(queries)} queries, k={args.k}")
+    if isinstance(index, CompactIndex):
+        mem = index.memory()
+        saved = 1 - mem["compact_bytes"] / max(1, mem["float32_bytes"])
+        print(f"Vectors: {mem['compact_bytes'] / 2**20:.1f} MB {args.backend} vs "
+              f"{mem['float32_bytes'] / 2**20:.1f} MB float32 ({saved:.0%} less)")
+    print(f"| {param} | recall@{args.k} | ms/query |")
+    print("|---:|---:|---:|")
+    for r in measure_recall(index, queries, args.k, args.settings, exact=exact, param=param):
+        print(f"| {r[param]} | {r['recall']:.3f} | {r['ms_per_query']:.2f} |")
+
+
+if __name__ == "__main__":
+    main()
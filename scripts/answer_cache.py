@@ -0,0 +1,205 @@
+"""Opt-in semantic cache of past answers.
+
+Incoming questions are embedded and compared with the questions already in
+the memory log. When a past question is similar enough (cosine similarity
+at or above ``threshold``) and every chunk its answer was built from is
+still in the corpus unchanged, the stored answer, summary and impact score
+are returned instead of running retrieval and three LLM calls.
+
+Only entries that recorded their ``sources`` (content hashes of the
+retrieved chunks) can be served from the cache, and never ones whose answer
+is an LLM error message. Entries expire after
+``ttl`` seconds and the least recently used ones are evicted beyond
+``maxsize``.
+
+Enable with ``ANSWER_CACHE=1``; tune with ``ANSWER_CACHE_THRESHOLD``,
+``ANSWER_CACHE_TTL`` and ``ANSWER_CACHE_SIZE``.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+from embedding_model import encode_queries
+from embedding_store import content_hash
+from memory_manager import MEMORY_FILE
+from ollama_interface import is_error_text
+import memory_store
+import rag_engine
+
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE", "0").lower() in ("1", "true", "yes")
+DEFAULT_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.92"))
+DEFAULT_TTL = float(os.environ.get("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_MAXSIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "5000"))
+
+
+def chunk_sources(chunks):
+    """Content hashes identifying the exact chunk texts an answer used."""
+    return [content_hash(c["text"]) for c in chunks]
+
+
+def cacheable(entry):
+    return bool(entry.get("sources") and entry.get("question") and entry.get("answer")
+                and not is_error_text(entry["answer"]))
+
+
+def _entry_time(entry):
+    try:
+        ts = datetime.fromisoformat(entry["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+    if ts.tzinfo is None:
+        # Memory timestamps are naive UTC.
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class AnswerCache:
+    def __init__(self, threshold=DEFAULT_THRESHOLD, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE,
+                 memory_file=MEMORY_FILE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.memory_file = memory_file
+        self._items = OrderedDict()     # entry id -> (vector, entry, created)
+        self._matrix = None
+        self._ids = []
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expired = 0
+
+    # -- population ----------------------------------------------------------
+
+    def _load(self):
+        """Seed the cache from the most recent cacheable memory entries.
+
+        Reading the log and encoding the questions happen without holding
+        ``_lock``; only merging the result in does.
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            entries = []
+            for entry in memory_store.load_entries(self.memory_file):
+                if cacheable(entry):
+                    entries.append(entry)
+            entries = entries[-self.maxsize:] if self.maxsize else []
+            now = time.time()
+            entries = [e for e in entries if now - _entry_time(e) < self.ttl]
+            vectors = encode_queries([e["question"] for e in entries]) if entries else []
+            with self._lock:
+                seeded = OrderedDict(
+                    (entry["id"], (vec, entry, _entry_time(entry))) for entry, vec in zip(entries, vectors)
+                )
+                # Entries added while we were reading are newer than the log we read.
+                for key, item in self._items.items():
+                    seeded[key] = item
+                    seeded.move_to_end(key)
+                while len(seeded) > self.maxsize:
+                    seeded.popitem(last=False)
+                self._items = seeded
+                self._matrix = None
+                self._loaded = True
+
+    def _put(self, entry, vector, created):
+        self._items[entry["id"]] = (vector, entry, created)
+        self._items.move_to_end(entry["id"])
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        self._matrix = None
+
+    def add(self, entry):
+        """Make a freshly persisted entry available to later lookups."""
+        if not cacheable(entry):
+            return
+        vector = encode_queries([entry["question"]])[0]
+        with self._lock:
+            self._put(entry, vector, time.time())
+
+    # -- lookup --------------------------------------------------------------
+
+    def _expire(self, now):
+        dead = [k for k, (_, _, created) in self._items.items() if now - created >= self.ttl]
+        for k in dead:
+            del self._items[k]
+        if dead:
+            self.expired += len(dead)
+            self._matrix = None
+
+    def lookup(self, question):
+        """Return ``(entry, similarity)`` for a usable cached answer, else ``None``."""
+        query = encode_queries([question])[0]
+        self._load()
+        with self._lock:
+            self._expire(time.time())
+            if not self._items:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._ids = list(self._items)
+                self._matrix = np.stack([self._items[k][0] for k in self._ids])
+            sims = self._matrix @ query
+            candidates = [(self._ids[i], float(sims[i])) for i in np.argsort(-sims) if sims[i] >= self.threshold]
+            if not candidates:
+                self.misses += 1
+                return None
+        # Syncing the corpus may encode new chunks; other lookups go on meanwhile.
+        rag_engine.load_corpus()
+        live = rag_engine.get_store().live_hashes()
+        with self._lock:
+            for key, sim in candidates:
+                item = self._items.get(key)
+                if item is None:
+                    continue    # evicted or found stale by another lookup meanwhile
+                if all(h in live for h in item[1]["sources"]):
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return item[1], sim
+                # The answer was built from chunks that changed or were removed.
+                self.stale += 1
+                del self._items[key]
+                self._matrix = None
+            self.misses += 1
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._matrix = None
+            self._loaded = False
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": True,
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "expired": self.expired,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+        return _cache
@@ -0,0 +1,324 @@
+"""Shared question-answering pipeline used by the CLI, web app and GUI.
+
+A question goes through retrieval and the answer call, then the summary and
+impact-score calls run concurrently (they only depend on the answer), and
+the memory write happens in the background so it never delays the reply.
+
+``executor`` selects how the post-answer stages run: ``"thread"`` uses a
+thread pool, ``"asyncio"`` runs them as coroutines gathered on an event
+loop (the blocking LLM calls still execute on the pipeline's thread pool).
+
+``post_answer="local"`` (``ASK_POST_ANSWER=local``) replaces both calls with
+an extractive summary and a scorer trained on the memory log
+(``local_scorer``), so a question costs a single LLM call.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rag_engine import get_relevant_chunks
+from ollama_interface import OllamaError, query_llama
+from memory_manager import add_entry
+from context_packer import CONTEXT_TOKEN_BUDGET, pack
+import answer_cache
+import local_scorer
+import metrics
+
+SUMMARY_PROMPT = "Summarize this answer in 1 sentence:\n{answer}"
+SCORE_PROMPT = "Rate the importance of this answer on a scale from 1 to 10:\n{answer}"
+ASK_EXECUTOR = os.environ.get("ASK_EXECUTOR", "thread")
+ASK_POST_ANSWER = os.environ.get("ASK_POST_ANSWER", "llm")
+
+
+def parse_impact_score(text, default=5):
+    match = re.search(r"\b([1-9]|10)\b", text or "")
+    try:
+        return int(match.group(1)) if match else default
+    except Exception:
+        return default
+
+
+class _Timer:
+    """Records a stage in the result's ``timings`` and as a metrics span."""
+
+    def __init__(self, timings, stage):
+        self.timings = timings
+        self.stage = stage
+
+    def __enter__(self):
+        self.span = metrics.span(self.stage)
+        self.span.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings[self.stage] = time.perf_counter() - self.start
+        self.span.__exit__(*exc)
+
+
+class AskPipeline:
+    def __init__(
+        self,
+        executor=ASK_EXECUTOR,
+        max_workers=4,
+        top_k=5,
+        context_tokens=CONTEXT_TOKEN_BUDGET,
+        retrieve=get_relevant_chunks,
+        llm=query_llama,
+        persist=add_entry,
+        cache=None,
+        post_answer=ASK_POST_ANSWER,
+    ):
+        if executor not in ("thread", "asyncio"):
+            raise ValueError(f"Unknown executor: {executor}")
+        if post_answer not in ("llm", "local"):
+            raise ValueError(f"Unknown post_answer mode: {post_answer}")
+        self.executor = executor
+        self.post_answer = post_answer
+        self.top_k = top_k
+        self.context_tokens = context_tokens
+        self.retrieve = retrieve
+        self.llm = llm
+        self.persist = persist
+        if cache is None and answer_cache.ANSWER_CACHE_ENABLED:
+            cache = answer_cache.get_cache()
+        self.cache = cache or None
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ask")
+        # A single writer keeps memory writes in order.
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ask-persist")
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    # -- stages --------------------------------------------------------------
+
+    def _summary(self, answer):
+        return self.llm(SUMMARY_PROMPT.format(answer=answer), raise_errors=True)
+
+    def _score(self, answer):
+        return parse_impact_score(self.llm(SCORE_PROMPT.format(answer=answer), raise_errors=True))
+
+    def _post_answer_local(self, answer, timings):
+        """Summary and score without the LLM; returns ``(summary, score, scored_by)``."""
+        with _Timer(timings, "summary"):
+            summary, vector = local_scorer.summarize(answer)
+        with _Timer(timings, "score"):
+            impact = local_scorer.score(vector)
+            if impact is not None:
+                return summary, impact, "local"
+            # No trained scorer yet: the LLM still scores, and the entry can train one.
+            return summary, self._score(answer), "llm"
+
+    def _post_answer_threads(self, answer, timings):
+        def timed(stage, fn):
+            with _Timer(timings, stage):
+                return fn(answer)
+
+        summary = self._pool.submit(timed, "summary", self._summary)
+        score = self._pool.submit(timed, "score", self._score)
+        return summary.result(), score.result()
+
+    async def _post_answer_async(self, answer, timings):
+        loop = asyncio.get_running_loop()
+
+        async def timed(stage, fn):
+            with _Timer(timings, stage):
+                return await loop.run_in_executor(self._pool, fn, answer)
+
+        return await asyncio.gather(timed("summary", self._summary), timed("score", self._score))
+
+    def _persist(self, result):
+        def write():
+            start = time.perf_counter()
+            with metrics.span("persist"):
+                extra = {"scored_by": "local"} if result.get("scored_by") == "local" else {}
+                entry = self.persist(
+                    result["question"],
+                    result["answer"],
+                    result["summary"],
+                    result["impact_score"],
+                    sources=answer_cache.chunk_sources(result["chunks"]),
+                    **extra,
+                )
+                if self.cache is not None and entry:
+                    self.cache.add(entry)
+            return time.perf_counter() - start
+
+        future = self._writer.submit(write)
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+        if future.exception() is not None:
+            print(f"❌ Failed to save memory entry: {future.exception()}")
+
+    # -- public API ----------------------------------------------------------
+
+    def _from_cache(self, question, emit, on_token, timings, start):
+        with _Timer(timings, "cache_lookup"):
+            found = self.cache.lookup(question)
+        if found is None:
+            return None
+        entry, similarity = found
+        emit("chunks", [])
+        if on_token is not None:
+            on_token(entry["answer"])
+        emit("answer", entry["answer"])
+        emit("summary", entry.get("summary", ""))
+        emit("impact_score", entry.get("impact_score", 5))
+        timings["total"] = time.perf_counter() - start
+        metrics.inc("rag_questions_total", help="Questions answered", cached="true")
+        metrics.observe("rag_answer_seconds", timings["total"], help="End-to-end answer time")
+        return {
+            "question": question,
+            "answer": entry["answer"],
+            "summary": entry.get("summary", ""),
+            "impact_score": entry.get("impact_score", 5),
+            "chunks": [],
+            "timings": timings,
+            "persisted": None,
+            "cached": {"id": entry["id"], "question": entry["question"], "similarity": similarity},
+            "error": None,
+        }
+
+    def ask(self, question, chunks=None, on_event=None, on_token=None, persist=True, bypass_cache=False,
+            sources=None):
+        """Answer ``question`` and return a result dict.
+
+        With an answer cache configured, a near-duplicate of an earlier
+        question is answered from memory (the result's ``cached`` says which
+        entry) unless ``bypass_cache`` is set.
+        ``chunks`` skips retrieval when the caller already has context;
+        ``sources`` limits retrieval to those documents (and skips the cache,
+        whose answers were drawn from the whole library).
+        Retrieved chunks are packed into the prompt by ``context_packer``;
+        the result's ``chunks`` are the ones actually used, and
+        ``context_tokens``/``tokens_saved`` report the packing. These are
+        LLM tokens only when ``PROMPT_TOKENIZER_NAME`` names the model's
+        tokenizer; otherwise they are embedding-tokenizer counts scaled by
+        ``PROMPT_TOKEN_MARGIN``, an estimate.
+        ``on_event(name, value)`` is called as each stage finishes with
+        ``chunks``, ``answer``, ``summary`` and ``impact_score``;
+        ``on_token`` receives answer text as it streams. The result's
+        ``timings`` maps stage name to seconds; ``persisted`` is a future
+        for the background memory write that resolves to its duration.
+
+        If an LLM call fails, ``error`` holds :meth:`OllamaError.to_dict`
+        (also emitted as an ``error`` event), the remaining stages are
+        skipped and nothing is saved; otherwise ``error`` is ``None``.
+        """
+        emit = on_event or (lambda name, value: None)
+        timings = {}
+        start = time.perf_counter()
+
+        if self.cache is not None and not bypass_cache and sources is None:
+            cached = self._from_cache(question, emit, on_token, timings, start)
+            if cached is not None:
+                return cached
+
+        if chunks is None:
+            with _Timer(timings, "retrieve"):
+                if sources is None:
+                    chunks = self.retrieve(question, top_k=self.top_k)
+                else:
+                    chunks = self.retrieve(question, top_k=self.top_k, sources=sources)
+        with _Timer(timings, "pack"):
+            packed = pack(question, chunks, self.context_tokens)
+        chunks = packed["chunks"]
+        context = packed["context"]
+        emit("chunks", chunks)
+
+        answer = None
+        scored_by = "llm"
+        try:
+            with _Timer(timings, "answer"):
+                if on_token is not None:
+                    answer = self.llm(question, system_context=context, on_token=on_token, raise_errors=True)
+                else:
+                    answer = self.llm(question, system_context=context, raise_errors=True)
+            emit("answer", answer)
+
+            with _Timer(timings, "post_answer"):
+                if self.post_answer == "local":
+                    summary, impact, scored_by = self._post_answer_local(answer, timings)
+                elif self.executor == "asyncio":
+                    summary, impact = asyncio.run(self._post_answer_async(answer, timings))
+                else:
+                    summary, impact = self._post_answer_threads(answer, timings)
+        except OllamaError as e:
+            error = e.to_dict()
+            emit("error", error)
+            timings["total"] = time.perf_counter() - start
+            return {
+                "question": question,
+                "answer": answer,
+                "summary": None,
+                "impact_score": None,
+                "chunks": chunks,
+                "timings": timings,
+                "context_tokens": packed["tokens"],
+                "tokens_saved": packed["tokens_saved"],
+                "persisted": None,
+                "cached": None,
+                "error": error,
+            }
+        emit("summary", summary)
+        emit("impact_score", impact)
+        timings["total"] = time.perf_counter() - start
+        metrics.inc("rag_questions_total", help="Questions answered", cached="false")
+        metrics.observe("rag_answer_seconds", timings["total"], help="End-to-end answer time")
+
+        result = {
+            "question": question,
+            "answer": answer,
+            "summary": summary,
+            "impact_score": impact,
+            "scored_by": scored_by,
+            "chunks": chunks,
+            "timings": timings,
+            "context_tokens": packed["tokens"],
+            "tokens_saved": packed["tokens_saved"],
+            "persisted": None,
+            "cached": None,
+            "error": None,
+        }
+        if persist:
+            result["persisted"] = self._persist(result)
+        return result
+
+    def wait(self, timeout=None):
+        """Block until every background memory write has finished."""
+        with self._pending_lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.result(timeout=timeout)
+
+    def shutdown(self):
+        self.wait()
+        self._pool.shutdown()
+        self._writer.shutdown()
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline(**kwargs):
+    """Return the process-wide pipeline, creating it with ``kwargs`` on first use."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = AskPipeline(**kwargs)
+        return _pipeline
+
+
+def format_timings(timings):
+    order = ["retrieve", "pack", "answer", "summary", "score", "post_answer", "total"]
+    keys = [k for k in order if k in timings] + [k for k in timings if k not in order]
+    return ", ".join(f"{k} {timings[k]:.2f}s" for k in keys)
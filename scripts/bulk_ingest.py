@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Ingest a directory of PDFs in parallel.
+
+Files are parsed across a process pool. A manifest remembers the content
+hash of every PDF that was ingested successfully, so re-running over a
+library only parses files that are new or changed. Chunk files are written
+atomically, so an interrupted run never leaves a half-written
+``*_chunks.json`` behind.
+
+    python scripts/bulk_ingest.py data/pdfs --workers 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from embedding_store import write_json_atomic
+from pdf_parser import CHUNK_DIR, PDF_DIR, chunk_path_for, chunker_signature, ingest_pdf
+
+MANIFEST_FILE = Path("data/ingest_manifest.json")
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path=MANIFEST_FILE):
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return {}
+
+
+def plan(pdf_dir, manifest, chunk_dir=CHUNK_DIR, force=False):
+    """Split PDFs into ``(todo, skipped)``; ``todo`` holds ``(path, stat, hash)``."""
+    todo, skipped = [], []
+    signature = chunker_signature()
+    for path in sorted(Path(pdf_dir).glob("*.pdf")):
+        st = path.stat()
+        known = manifest.get(path.name)
+        if known and known.get("chunker") != signature:
+            known = None
+        have_chunks = chunk_path_for(path.name, chunk_dir).exists()
+        if not force and known and have_chunks and known["size"] == st.st_size and known["mtime_ns"] == st.st_mtime_ns:
+            skipped.append(path)
+            continue
+        digest = file_hash(path)
+        if not force and known and have_chunks and known["sha256"] == digest:
+            # Touched but unchanged: remember the new mtime and move on.
+            known.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+            skipped.append(path)
+            continue
+        todo.append((path, st, digest))
+    return todo, skipped
+
+
+def ingest_one(pdf_path, chunk_dir=CHUNK_DIR):
+    """Parse one PDF and write its chunk file. Runs in a worker process."""
+    start = time.perf_counter()
+    n_chunks = ingest_pdf(pdf_path, Path(pdf_path).name, chunk_dir)
+    return n_chunks, time.perf_counter() - start
+
+
+def run(pdf_dir=PDF_DIR, chunk_dir=CHUNK_DIR, workers=None, force=False, manifest_file=MANIFEST_FILE,
+        on_result=None):
+    """Ingest every new or changed PDF in ``pdf_dir`` and return a report dict."""
+    manifest = load_manifest(manifest_file)
+    todo, skipped = plan(pdf_dir, manifest, chunk_dir, force)
+    report = {"parsed": [], "failed": [], "skipped": [p.name for p in skipped]}
+    start = time.perf_counter()
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+            futures = {pool.submit(ingest_one, str(path), str(chunk_dir)): (path, st, digest)
+                       for path, st, digest in todo}
+            try:
+                for i, future in enumerate(as_completed(futures), 1):
+                    path, st, digest = futures[future]
+                    try:
+                        n_chunks, seconds = future.result()
+                    except Exception as e:
+                        result = {"file": path.name, "error": f"{type(e).__name__}: {e}"}
+                        report["failed"].append(result)
+                    else:
+                        result = {
+                            "file": path.name,
+                            "chunks": n_chunks,
+                            "seconds": seconds,
+                            "mb_per_s": st.st_size / 1e6 / seconds if seconds else None,
+                        }
+                        report["parsed"].append(result)
+                        manifest[path.name] = {
+                            "sha256": digest,
+                            "size": st.st_size,
+                            "mtime_ns": st.st_mtime_ns,
+                            "chunks": n_chunks,
+                            "chunker": chunker_signature(),
+                        }
+                    if on_result:
+                        on_result(result, i, len(todo))
+                    if i % 25 == 0:
+                        write_json_atomic(manifest_file, manifest, indent=2)
+            finally:
+                write_json_atomic(manifest_file, manifest, indent=2)
+    elif skipped:
+        write_json_atomic(manifest_file, manifest, indent=2)
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse a directory of PDFs into chunk files")
+    parser.add_argument("pdf_dir", type=Path, nargs="?", default=PDF_DIR)
+    parser.add_argument("--chunk-dir", type=Path, default=CHUNK_DIR)
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Re-parse files even if unchanged")
+    parser.add_argument("--report", type=Path, help="Write the run report as JSON to this file")
+    args = parser.parse_args()
+
+    def show(result, i, total):
+        if "error" in result:
+            print(f"[{i}/{total}] ❌ {result['file']}: {result['error']}")
+        else:
+            rate = f", {result['mb_per_s']:.1f} MB/s" if result["mb_per_s"] else ""
+            print(f"[{i}/{total}] ✅ {result['file']}: {result['chunks']} chunks in {result['seconds']:.2f}s{rate}")
+
+    report = run(args.pdf_dir, args.chunk_dir, args.workers, args.force, on_result=show)
+    print(
+        f"Parsed {len(report['parsed'])}, skipped {len(report['skipped'])} unchanged, "
+        f"failed {len(report['failed'])} in {report['seconds']:.1f}s"
+    )
+    if args.report:
+        write_json_atomic(args.report, report, indent=2)
+    if report["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Assemble the prompt context from retrieved chunks.
+
+Retrieved chunks often overlap (neighbouring chunks share sentences, the
+same passage appears in two PDFs). Sending all of them costs prompt-eval
+time on the local model for no extra information, so before the answer call
+the chunks are:
+
+1. re-ranked with maximal marginal relevance (MMR): each pick balances
+   similarity to the question against similarity to what is already picked,
+   weighted by ``CONTEXT_MMR_LAMBDA`` (1.0 = relevance only);
+2. dropped when they are near-duplicates (cosine similarity of at least
+   ``CONTEXT_DUP_THRESHOLD``) of a chunk already picked;
+3. packed in that order until ``CONTEXT_TOKEN_BUDGET`` tokens are used.
+
+The budget is in LLM prompt tokens (see ``token_budget``): exact with
+``PROMPT_TOKENIZER_NAME``, otherwise embedding-tokenizer counts plus a
+``PROMPT_TOKEN_MARGIN`` safety margin.
+
+Chunk vectors come from the embedding store, so packing normally needs no
+model call beyond the (cached) question embedding.
+"""
+import os
+
+import numpy as np
+
+from embedding_model import MODEL_NAME, encode_queries, encode_texts
+from embedding_store import get_store, normalize
+from token_budget import PROMPT_TOKENIZER_NAME, count_prompt_tokens, prompt_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", "0.7"))
+DUP_THRESHOLD = float(os.environ.get("CONTEXT_DUP_THRESHOLD", "0.95"))
+SEPARATOR = "\n\n"
+# WordPiece tokenizers drop whitespace entirely, but the LLM spends at least
+# one token on each paragraph break between chunks.
+MIN_SEPARATOR_TOKENS = 1
+
+
+def chunk_tokens(chunk):
+    """Prompt tokens for ``chunk``, reusing the chunker's embedding-token count when possible."""
+    tokens = chunk.get("tokens")
+    if isinstance(tokens, int) and not PROMPT_TOKENIZER_NAME:
+        return prompt_tokens(tokens)
+    return count_prompt_tokens(chunk["text"])
+
+
+def chunk_vectors(chunks):
+    """Unit vectors for ``chunks``, from the store where possible."""
+    texts = [c["text"] for c in chunks]
+    vectors = get_store(MODEL_NAME).vectors_for(texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        encoded = normalize(encode_texts([texts[i] for i in missing]))
+        for i, vec in zip(missing, encoded):
+            vectors[i] = vec
+    return np.stack(vectors).astype(np.float32)
+
+
+def mmr_order(query_vec, vectors, lambda_=MMR_LAMBDA, dup_threshold=DUP_THRESHOLD):
+    """Return ``(order, duplicates)``: MMR pick order and the indices dropped as near-duplicates."""
+    relevance = vectors @ query_vec
+    pairwise = vectors @ vectors.T
+    remaining = list(range(len(vectors)))
+    order, duplicates = [], []
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    while remaining:
+        if order:
+            scores = lambda_ * relevance[remaining] - (1 - lambda_) * redundancy[remaining]
+        else:
+            scores = relevance[remaining]
+        best = remaining.pop(int(np.argmax(scores)))
+        if order and redundancy[best] >= dup_threshold:
+            duplicates.append(best)
+            continue
+        order.append(best)
+        redundancy = np.maximum(redundancy, pairwise[best])
+    return order, duplicates
+
+
+def pack(question, chunks, max_tokens=CONTEXT_TOKEN_BUDGET, lambda_=MMR_LAMBDA,
+         dup_threshold=DUP_THRESHOLD, query_vec=None):
+    """Select and order ``chunks`` for the prompt.
+
+    Returns a dict with the packed ``chunks``, the joined ``context``, its
+    ``tokens``, ``tokens_in`` (all retrieved chunks joined naively),
+    ``tokens_saved`` and the number of ``duplicates`` dropped.
+    """
+    sep_tokens = max(count_prompt_tokens(SEPARATOR), MIN_SEPARATOR_TOKENS)
+    sizes = [chunk_tokens(c) for c in chunks]
+    tokens_in = sum(sizes) + sep_tokens * max(len(chunks) - 1, 0)
+    if len(chunks) > 1:
+        if query_vec is None:
+            query_vec = encode_queries([question])[0]
+        order, duplicates = mmr_order(query_vec, chunk_vectors(chunks), lambda_, dup_threshold)
+    else:
+        order, duplicates = list(range(len(chunks))), []
+
+    packed, used = [], 0
+    for i in order:
+        cost = sizes[i] + (sep_tokens if packed else 0)
+        if used + cost > max_tokens:
+            continue
+        packed.append(chunks[i])
+        used += cost
+    return {
+        "chunks": packed,
+        "context": SEPARATOR.join(c["text"] for c in packed),
+        "tokens": used,
+        "tokens_in": tokens_in,
+        "tokens_saved": tokens_in - used,
+        "duplicates": len(duplicates),
+    }
@@ -0,0 +1,112 @@
+"""Process-wide, lazily loaded sentence-embedding model.
+
+``rag_engine`` and ``memory_manager`` (via KeyBERT) share the one MiniLM
+instance returned by :func:`get_model`, and nothing is loaded until the
+first call. Query embeddings go through a bounded LRU cache so repeated
+questions skip the model entirely.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_store import normalize
+import metrics
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+QUERY_CACHE_SIZE = int(os.environ.get("RAG_QUERY_CACHE_SIZE", "1024"))
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+
+                _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+
+def warm_up(background=True):
+    """Load the model ahead of the first question.
+
+    With ``background=True`` the load happens on a daemon thread so servers
+    and GUIs can start accepting input immediately.
+    """
+    if background:
+        thread = threading.Thread(target=get_model, daemon=True)
+        thread.start()
+        return thread
+    get_model()
+    return None
+
+
+class QueryCache:
+    """Bounded LRU cache of normalised query embeddings."""
+
+    def __init__(self, maxsize=QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, queries, encode):
+        queries = list(queries)
+        found = {}
+        with self._lock:
+            for q in queries:
+                vec = self._data.get(q)
+                if vec is not None:
+                    self._data.move_to_end(q)
+                    found[q] = vec
+            misses = sum(1 for q in queries if q not in found)
+            self.hits += len(queries) - misses
+            self.misses += misses
+        missing = list(dict.fromkeys(q for q in queries if q not in found))
+        if missing:
+            fresh = normalize(encode(missing))
+            with self._lock:
+                for q, vec in zip(missing, fresh):
+                    found[q] = vec
+                    if self.maxsize > 0:
+                        self._data[q] = vec
+                        self._data.move_to_end(q)
+                        while len(self._data) > self.maxsize:
+                            self._data.popitem(last=False)
+        return np.stack([found[q] for q in queries])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+query_cache = QueryCache()
+
+
+def encode_texts(texts, batch_size=64):
+    with metrics.span("encode_chunks"):
+        return get_model().encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+
+
+def encode_queries(queries):
+    """Return unit-length embeddings for ``queries``, using the LRU cache."""
+    with metrics.span("encode_query"):
+        return query_cache.encode(queries, lambda qs: get_model().encode(qs, convert_to_numpy=True))
@@ -0,0 +1,587 @@
+#!/usr/bin/env python3
+"""Persistent on-disk store of chunk embeddings.
+
+Vectors are kept as L2-normalised float32 rows in a flat file that is
+memory-mapped for reading, and are keyed by a content hash of the chunk
+text so a chunk is only ever encoded once. The index maps hashes to rows
+and remembers the size/mtime of every ``*_chunks.json`` file that has been
+synced, so unchanged files are not even re-read.
+
+The index is a snapshot (``index.json``) plus an append-only log
+(``index.log``) of the rows and file manifests written since. A sync
+appends only what changed and other processes only read the new tail of
+the log. The log is folded back into the snapshot once it outgrows it;
+``compact`` also drops the vectors of chunks that no longer exist.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+
+import numpy as np
+
+STORE_DIR = Path("data/embeddings")
+CHUNK_DIR = Path("data/text_chunks")
+VECTOR_FILENAME = "vectors.f32"
+INDEX_FILENAME = "index.json"
+LOG_FILENAME = "index.log"
+LOCK_FILENAME = ".lock"
+# The log is folded into index.json once it is larger than both it and this.
+FOLD_MIN_BYTES = 1 << 20
+COPY_BATCH = 4096
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class FileLock:
+    """Tiny cross-process lock based on exclusive file creation."""
+
+    def __init__(self, path: Path, timeout=60.0, stale_after=300.0):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.stale_after = stale_after
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - self.path.stat().st_mtime > self.stale_after:
+                        self.path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for lock {self.path}")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def write_json_atomic(path: Path, data, **kwargs):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class EmbeddingStore:
+    def __init__(self, store_dir=STORE_DIR, model_name=None):
+        self.store_dir = Path(store_dir)
+        self.index_file = self.store_dir / INDEX_FILENAME
+        self.log_file = self.store_dir / LOG_FILENAME
+        self.model_name = model_name
+        self._lock = threading.RLock()
+        self._index = self._empty_index()
+        # (index.json stat, index.log inode, bytes of the log applied so far)
+        self._index_stamp = None
+        # Whether index.log belongs to the loaded snapshot and can be appended to
+        self._log_ok = False
+        self._vectors = None
+        # name -> (mtime_ns, size, entries, rows); parsed chunk files kept in-process
+        self._file_cache = {}
+        self._assembled = None
+        self._live = None
+
+    def _empty_index(self):
+        return {
+            "model": self.model_name,
+            "generation": uuid4().hex,
+            "vectors": VECTOR_FILENAME,
+            "dim": None,
+            "count": 0,
+            "rows": {},
+            "files": {},
+        }
+
+    @property
+    def generation(self):
+        """Changes whenever row numbers are reassigned (i.e. on rebuild)."""
+        return self._index.get("generation")
+
+    @property
+    def vector_file(self):
+        return self.store_dir / self._index.get("vectors", VECTOR_FILENAME)
+
+    @property
+    def dim(self):
+        return self._index["dim"]
+
+    @property
+    def count(self):
+        return self._index["count"]
+
+    # -- loading -----------------------------------------------------------------
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def refresh(self):
+        """Catch up with index changes written by other processes.
+
+        Only the part of ``index.log`` appended since the last call is read;
+        ``index.json`` is re-read only after it has been rewritten.
+        """
+        with self._lock:
+            snapshot, log = self._stat(self.index_file), self._stat(self.log_file)
+            stamp = self._index_stamp
+            if stamp is not None and stamp[0] == snapshot:
+                if log is None and stamp[1] is None:
+                    return
+                if log is not None and stamp[1] == log[2] and log[1] >= stamp[2]:
+                    if log[1] > stamp[2]:
+                        self._read_log(stamp[2], log[2])
+                    return
+            for _ in range(5):
+                self._load(snapshot, log)
+                # A compaction between reading the snapshot and the log could
+                # pair an old snapshot with a new log; read both again.
+                current = self._stat(self.index_file)
+                if current == snapshot:
+                    break
+                snapshot, log = current, self._stat(self.log_file)
+
+    def _load(self, snapshot, log):
+        index = self._empty_index()
+        if snapshot is not None:
+            try:
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                index = self._empty_index()
+        self._index = index
+        self._index_stamp = (snapshot, None, 0)
+        self._vectors = None
+        self._log_ok = False
+        if self.model_name and index.get("model") not in (None, self.model_name):
+            # Vectors from a different model are useless; start over.
+            self._index = self._empty_index()
+            self._index_stamp = (snapshot, log and log[2], log[1] if log else 0)
+        elif log is not None:
+            self._read_log(0, log[2])
+
+    def _read_log(self, offset, inode):
+        try:
+            with open(self.log_file, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1   # a writer may be half way through a line
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "generation" in record:
+                # A log left over from before a compaction describes other rows.
+                self._log_ok = record["generation"] == self._index.get("generation")
+            elif self._log_ok:
+                self._apply(record)
+        if end:
+            self._vectors = None
+        self._index_stamp = (self._index_stamp[0], inode, offset + end)
+
+    def _apply(self, record):
+        index = self._index
+        if "rows" in record:
+            index["dim"] = record.get("dim", index["dim"])
+            for h, row in record["rows"]:
+                index["rows"][h] = row
+                index["count"] = max(index["count"], row + 1)
+        elif "file" in record:
+            index["files"][record["file"]] = {k: record[k] for k in ("mtime_ns", "size", "hashes")}
+        elif "drop" in record:
+            index["files"].pop(record["drop"], None)
+
+    def vectors(self):
+        """Return a read-only (count, dim) view of all stored vectors."""
+        with self._lock:
+            self.refresh()
+            if self._vectors is None:
+                count, dim = self.count, self.dim
+                if not count or not dim:
+                    self._vectors = np.zeros((0, dim or 0), dtype=np.float32)
+                else:
+                    self._vectors = np.memmap(
+                        self.vector_file, dtype=np.float32, mode="r", shape=(count, dim)
+                    )
+            return self._vectors
+
+    # -- writing -----------------------------------------------------------------
+
+    def _append(self, hashes, vectors):
+        """Append vectors for new hashes and return their log record.
+
+        Caller must hold the file lock.
+        """
+        vectors = normalize(vectors)
+        index = self._index
+        if index["dim"] is None:
+            index["dim"] = int(vectors.shape[1])
+        elif vectors.shape[1] != index["dim"]:
+            raise ValueError(f"Expected {index['dim']}-d vectors, got {vectors.shape[1]}")
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        row_bytes = index["dim"] * 4
+        mode = "r+b" if self.vector_file.exists() else "w+b"
+        with open(self.vector_file, mode) as f:
+            # Drop any partial tail left by a crashed writer before appending.
+            f.truncate(index["count"] * row_bytes)
+            f.seek(index["count"] * row_bytes)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        added = []
+        for h in hashes:
+            index["rows"][h] = index["count"]
+            added.append([h, index["count"]])
+            index["count"] += 1
+        self._vectors = None
+        return {"dim": index["dim"], "rows": added}
+
+    def _commit(self, records):
+        """Persist ``records``, already applied in memory. Caller must hold the file lock."""
+        self._index["model"] = self.model_name or self._index.get("model")
+        snapshot, _, log_size = self._index_stamp
+        if not self._log_ok or log_size > max(snapshot[1] if snapshot else 0, FOLD_MIN_BYTES):
+            self._write_snapshot()
+            return
+        data = b"".join(json.dumps(r, ensure_ascii=False).encode("utf-8") + b"\n" for r in records)
+        with open(self.log_file, "r+b") as f:
+            # Drop any partial line left by a crashed writer before appending.
+            f.truncate(log_size)
+            f.seek(log_size)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._index_stamp = (snapshot, self._stat(self.log_file)[2], log_size + len(data))
+
+    def _write_snapshot(self):
+        """Write the whole index to ``index.json`` and start an empty log."""
+        self._index["model"] = self.model_name or self._index.get("model")
+        write_json_atomic(self.index_file, self._index)
+        header = (json.dumps({"generation": self.generation}) + "\n").encode("utf-8")
+        tmp = self.log_file.with_name(f"{self.log_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.log_file)
+        self._log_ok = True
+        self._index_stamp = (self._stat(self.index_file), self._stat(self.log_file)[2], len(header))
+
+    def sync(self, encode, chunk_dir=CHUNK_DIR, spans=False):
+        """Bring the store up to date with ``chunk_dir``.
+
+        ``encode`` is called once with the list of texts that have no vector
+        yet. Returns ``(metadata, rows)`` where ``rows[i]`` is the vector row
+        of ``metadata[i]``; with ``spans`` also a list of ``(file name,
+        start, stop)`` giving the metadata positions of each chunk file.
+        """
+        chunk_dir = Path(chunk_dir)
+        with self._lock:
+            self.refresh()
+            files = sorted(chunk_dir.glob("*.json"))
+            stats = {}
+            for path in files:
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                stats[path.name] = (path, st.st_mtime_ns, st.st_size)
+
+            manifest = self._index["files"]
+            dirty = set(manifest) - set(stats)
+            for name, (path, mtime_ns, size) in stats.items():
+                cached = self._file_cache.get(name)
+                known = manifest.get(name)
+                if cached and cached[:2] == (mtime_ns, size) and known and known["mtime_ns"] == mtime_ns:
+                    continue
+                entries = self._read_chunk_file(path)
+                hashes = [content_hash(e["text"]) for e in entries]
+                self._file_cache[name] = (mtime_ns, size, entries, hashes)
+                if not known or known["mtime_ns"] != mtime_ns or known["size"] != size or known["hashes"] != hashes:
+                    dirty.add(name)
+            for name in set(self._file_cache) - set(stats):
+                del self._file_cache[name]
+
+            if dirty:
+                with FileLock(self.store_dir / LOCK_FILENAME):
+                    # Another process may have appended while we were reading.
+                    self._index_stamp = None
+                    self.refresh()
+                    rows = self._index["rows"]
+                    missing, seen = [], set()
+                    for name in stats:
+                        _, _, entries, hashes = self._file_cache[name]
+                        for entry, h in zip(entries, hashes):
+                            if h not in rows and h not in seen:
+                                seen.add(h)
+                                missing.append((h, entry["text"]))
+                    records = []
+                    if missing:
+                        vecs = encode([text for _, text in missing])
+                        records.append(self._append([h for h, _ in missing], vecs))
+                    manifest = self._index["files"]
+                    for name in sorted(set(manifest) - set(stats)):
+                        del manifest[name]
+                        records.append({"drop": name})
+                    for name in stats:
+                        mtime_ns, size, _, hashes = self._file_cache[name]
+                        info = {"mtime_ns": mtime_ns, "size": size, "hashes": hashes}
+                        if manifest.get(name) != info:
+                            manifest[name] = info
+                            records.append({"file": name, **info})
+                    if records:
+                        self._commit(records)
+
+            key = (self._index_stamp, tuple(stats))
+            if dirty or self._assembled is None or self._assembled[0] != key:
+                metadata, row_ids, file_spans = [], [], []
+                rows = self._index["rows"]
+                for name in stats:
+                    _, _, entries, hashes = self._file_cache[name]
+                    file_spans.append((name, len(metadata), len(metadata) + len(entries)))
+                    metadata.extend(entries)
+                    row_ids.extend(rows[h] for h in hashes)
+                self._assembled = (key, metadata, np.asarray(row_ids, dtype=np.int64), file_spans)
+            if spans:
+                return self._assembled[1:]
+            return self._assembled[1], self._assembled[2]
+
+    @staticmethod
+    def _read_chunk_file(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return []
+        return [e for e in data if isinstance(e, dict) and e.get("text")]
+
+    def rebuild(self, encode, chunk_dir=CHUNK_DIR):
+        """Drop every stored vector and re-encode the whole corpus."""
+        with self._lock:
+            with FileLock(self.store_dir / LOCK_FILENAME):
+                for path in [self.index_file, self.log_file, *self.store_dir.glob("vectors*.f32")]:
+                    if path.exists():
+                        path.unlink()
+                self._index = self._empty_index()
+                self._index_stamp = None
+                self._vectors = None
+                self._file_cache.clear()
+                self._assembled = None
+            return self.sync(encode, chunk_dir)
+
+    def compact(self):
+        """Drop the vectors no chunk refers to and fold the log into ``index.json``.
+
+        Surviving vectors keep their order but move to a new file. When rows
+        move the generation changes, so ANN and lexical indexes rebuild.
+        Returns ``(rows before, rows after)``.
+        """
+        with self._lock:
+            with FileLock(self.store_dir / LOCK_FILENAME):
+                self._index_stamp = None
+                self.refresh()
+                index = self._index
+                before = index["count"]
+                live = {h for info in index["files"].values() for h in info["hashes"]}
+                keep = sorted((row, h) for h, row in index["rows"].items() if h in live)
+                if len(keep) < before:
+                    old_file, vectors = self.vector_file, self.vectors()
+                    generation = uuid4().hex
+                    name = f"vectors.{generation[:12]}.f32"
+                    tmp = self.store_dir / f"{name}.tmp"
+                    with open(tmp, "wb") as f:
+                        for start in range(0, len(keep), COPY_BATCH):
+                            batch = [row for row, _ in keep[start:start + COPY_BATCH]]
+                            f.write(np.ascontiguousarray(vectors[batch], dtype=np.float32).tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp, self.store_dir / name)
+                    index.update(generation=generation, vectors=name, count=len(keep),
+                                 rows={h: i for i, (_, h) in enumerate(keep)})
+                    self._vectors = None
+                    self._write_snapshot()
+                    # Readers that already mapped the old file keep their view.
+                    old_file.unlink(missing_ok=True)
+                else:
+                    self._write_snapshot()
+                self._assembled = None
+                return before, index["count"]
+
+    def verify(self, encode=None, sample=0, chunk_dir=CHUNK_DIR):
+        """Return a list of problems found in the store (empty when healthy)."""
+        problems = []
+        with self._lock:
+            self._index_stamp = None
+            self.refresh()
+            index = self._index
+            count, dim = index["count"], index["dim"]
+            if count and not dim:
+                problems.append("index has rows but no dimension")
+                return problems
+            expected = count * (dim or 0) * 4
+            actual = self.vector_file.stat().st_size if self.vector_file.exists() else 0
+            if actual < expected:
+                problems.append(f"vector file has {actual} bytes, expected {expected}")
+                return problems
+            if any(not 0 <= r < count for r in index["rows"].values()):
+                problems.append("index points at rows beyond the vector file")
+            vecs = self.vectors()
+            if count:
+                norms = np.linalg.norm(vecs, axis=1)
+                bad = int(np.sum(~np.isfinite(norms) | (np.abs(norms - 1.0) > 1e-3)))
+                if bad:
+                    problems.append(f"{bad} vectors are not unit length")
+            names = {p.name for p in Path(chunk_dir).glob("*.json")}
+            for name, info in index["files"].items():
+                if name not in names:
+                    problems.append(f"{name} is indexed but no longer exists")
+                missing = [h for h in info["hashes"] if h not in index["rows"]]
+                if missing:
+                    problems.append(f"{name} has {len(missing)} chunks without vectors")
+            for name in sorted(names - set(index["files"])):
+                problems.append(f"{name} has not been synced")
+            if encode is not None and sample and count:
+                texts = {}
+                for name, info in index["files"].items():
+                    path = Path(chunk_dir) / name
+                    for entry in self._read_chunk_file(path):
+                        texts.setdefault(content_hash(entry["text"]), entry["text"])
+                keys = [h for h in texts if h in index["rows"]]
+                rng = np.random.default_rng(0)
+                picked = rng.choice(len(keys), size=min(sample, len(keys)), replace=False) if keys else []
+                picked = [keys[i] for i in picked]
+                if picked:
+                    fresh = normalize(encode([texts[h] for h in picked]))
+                    stored = vecs[[index["rows"][h] for h in picked]]
+                    sims = np.sum(fresh * stored, axis=1)
+                    drift = int(np.sum(sims < 0.999))
+                    if drift:
+                        problems.append(f"{drift}/{len(picked)} sampled vectors differ from a fresh encode")
+        return problems
+
+    def vectors_for(self, texts):
+        """Stored vectors for ``texts``, with ``None`` for texts not encoded yet."""
+        with self._lock:
+            vectors = self.vectors()
+            rows = self._index["rows"]
+            out = []
+            for text in texts:
+                row = rows.get(content_hash(text))
+                out.append(np.array(vectors[row]) if row is not None and row < len(vectors) else None)
+            return out
+
+    def live_hashes(self):
+        """Content hashes of every chunk in the last synced corpus."""
+        with self._lock:
+            self.refresh()
+            if self._live is None or self._live[0] != self._index_stamp:
+                live = frozenset(h for info in self._index["files"].values() for h in info["hashes"])
+                self._live = (self._index_stamp, live)
+            return self._live[1]
+
+    def stats(self):
+        with self._lock:
+            live = self.live_hashes()
+            return {
+                "model": self._index.get("model"),
+                "dim": self.dim,
+                "rows": self.count,
+                "live_rows": len(live),
+                "files": len(self._index["files"]),
+                "bytes": self.vector_file.stat().st_size if self.vector_file.exists() else 0,
+                "log_bytes": self._index_stamp[2] if self._index_stamp else 0,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store(model_name=None):
+    """Return the process-wide store shared by the CLI, web app and GUI."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EmbeddingStore(model_name=model_name)
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the chunk embedding store")
+    parser.add_argument("command", choices=["sync", "rebuild", "verify", "compact", "stats"])
+    parser.add_argument("--chunk-dir", type=Path, default=CHUNK_DIR)
+    parser.add_argument(
+        "--sample",
+        type=int,
+        default=0,
+        help="With verify: re-encode this many random chunks and compare",
+    )
+    args = parser.parse_args()
+
+    import rag_engine
+
+    store = rag_engine.get_store()
+    encode = rag_engine.encode_texts
+    if args.command == "sync":
+        metadata, _ = store.sync(encode, args.chunk_dir)
+        print(f"✅ Store covers {len(metadata)} chunks ({store.count} vectors)")
+    elif args.command == "rebuild":
+        metadata, _ = store.rebuild(encode, args.chunk_dir)
+        print(f"✅ Rebuilt store with {store.count} vectors for {len(metadata)} chunks")
+    elif args.command == "verify":
+        problems = store.verify(encode if args.sample else None, args.sample, args.chunk_dir)
+        if problems:
+            for p in problems:
+                print(f"❌ {p}")
+            sys.exit(1)
+        stats = store.stats()
+        print(f"✅ Store OK ({store.count} vectors)")
+        if stats["rows"] > stats["live_rows"]:
+            print(f"ℹ️ {stats['rows'] - stats['live_rows']} vectors belong to deleted chunks; run compact to reclaim them")
+    elif args.command == "compact":
+        before, after = store.compact()
+        print(f"✅ Compacted store from {before} to {after} vectors")
+    else:
+        print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Deterministic stand-in for the Ollama HTTP API.
+
+Serves ``/api/generate`` (streaming and non-streaming), ``/api/version`` and
+``/api/tags`` with canned, prompt-dependent answers so the client and the
+apps built on it can be exercised without a real model::
+
+    python scripts/fake_ollama.py --port 11555 --delay 0.01
+    OLLAMA_HOST=http://127.0.0.1:11555 python main_cli.py
+
+or from Python::
+
+    server, url = start_fake_server()
+    set_client(OllamaClient(url))
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_completion(prompt, system=None):
+    """Return a canned answer that depends only on the prompt."""
+    if prompt.startswith("Rate the importance"):
+        digest = hashlib.sha1(prompt.encode("utf-8")).digest()
+        return f"I would rate this a {digest[0] % 10 + 1}."
+    if prompt.startswith("Summarize this answer"):
+        body = prompt.split("\n", 1)[-1].strip()
+        first = re.split(r"(?<=[.?!])\s+", body, maxsplit=1)[0]
+        return first or "No answer to summarize."
+    context = f" using {len(system.split())} words of context" if system else ""
+    return f"This is a fake answer to: {prompt.strip()}{context}. It is deterministic for testing."
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0          # seconds between streamed tokens
+    fail_next = 0        # respond 500 to this many upcoming requests
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-fake"})
+        elif self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "llama3.2:latest"}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+        cls = type(self)
+        if cls.fail_next > 0:
+            cls.fail_next -= 1
+            self._send_json(500, {"error": "injected failure"})
+            return
+        if not payload.get("model"):
+            self._send_json(400, {"error": "model is required"})
+            return
+        text = fake_completion(payload.get("prompt", ""), payload.get("system"))
+        model = payload["model"]
+        if not payload.get("stream", True):
+            time.sleep(self.delay * len(text.split()))
+            self._send_json(200, {"model": model, "response": text, "done": True})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        tokens = re.findall(r"\S+\s*", text)
+        for token in tokens:
+            self._chunk({"model": model, "response": token, "done": False})
+            if self.delay:
+                time.sleep(self.delay)
+        self._chunk({"model": model, "response": "", "done": True, "eval_count": len(tokens)})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _chunk(self, data):
+        line = json.dumps(data).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+
+def start_fake_server(host="127.0.0.1", port=0, delay=0.0):
+    """Start the fake server on a daemon thread; return ``(server, url)``."""
+    handler = type("Handler", (FakeOllamaHandler,), {"delay": delay, "fail_next": 0})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11555)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+    handler = type("Handler", (FakeOllamaHandler,), {"delay": args.delay, "fail_next": 0})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Bounded background jobs and admission control for the web server.
+
+:class:`JobQueue` runs slow work (PDF ingestion) on a fixed number of worker
+threads. Jobs get an ID that can be polled for status and progress; when
+``max_pending`` jobs are already waiting, :meth:`JobQueue.submit` raises
+:class:`Saturated` so the caller can answer "429 Too Many Requests" instead
+of letting requests pile up. :meth:`JobQueue.cancel` drops a queued job;
+a running job stops the next time it calls :meth:`Job.check`.
+
+:class:`Admission` does the same for work that runs inside the request
+(answering questions): at most ``limit`` requests are let in at once.
+"""
+import queue
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+
+
+class Saturated(Exception):
+    """Raised when there is no room for more work; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Cancelled(Exception):
+    """Raised by :meth:`Job.check` once the job has been cancelled."""
+
+
+class Job:
+    def __init__(self, kind, fn, args, kwargs):
+        self.id = uuid4().hex
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.status = "queued"
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        """Raise :class:`Cancelled` if the job was cancelled; call between steps."""
+        if self._cancel.is_set():
+            raise Cancelled(f"{self.kind} job cancelled")
+
+    def report(self, **progress):
+        """Called by the job function to publish progress."""
+        self.progress = dict(self.progress, **progress)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers=1, max_pending=8, keep=1000):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.keep = keep
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start(self):
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._run, name=f"job-worker-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _pending(self):
+        return sum(1 for j in self._jobs.values() if j.status == "queued")
+
+    def full(self):
+        with self._lock:
+            return self._pending() >= self.max_pending
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Queue ``fn(job, *args, **kwargs)`` and return the :class:`Job`."""
+        with self._lock:
+            pending = self._pending()
+            if pending >= self.max_pending:
+                raise Saturated(f"{pending} {kind} jobs already queued", retry_after=5)
+            job = Job(kind, fn, args, kwargs)
+            self._jobs[job.id] = job
+            finished = [k for k, j in self._jobs.items() if j.finished is not None]
+            for k in finished[:max(0, len(self._jobs) - self.keep)]:
+                del self._jobs[k]
+            self._start()
+        self._queue.put(job)
+        return job
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if job.status == "cancelled":
+                    self._queue.task_done()
+                    continue
+                job.status = "running"
+                job.started = time.time()
+            try:
+                job.result = job.fn(job, *job.args, **job.kwargs)
+                job.status = "done"
+            except Cancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = "failed"
+            finally:
+                job.finished = time.time()
+                self._queue.task_done()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns ``False`` if it already finished."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished is not None:
+                return False
+            job._cancel.set()
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished = time.time()
+            return True
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "max_pending": self.max_pending, **counts}
+
+    def wait(self):
+        self._queue.join()
+
+
+class Admission:
+    """Non-blocking cap on concurrent requests."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_enter(self):
+        with self._lock:
+            if self.limit and self.active >= self.limit:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"limit": self.limit, "active": self.active, "rejected": self.rejected}
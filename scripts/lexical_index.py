@@ -0,0 +1,261 @@
+"""BM25 inverted index over chunk text.
+
+Documents are keyed by embedding-store row, like the vector indexes in
+``ann_index``, so lexical and dense results can be fused directly. The
+index is updated incrementally: each sync only tokenizes chunks whose row is
+new and drops rows that are no longer in the corpus. Term counts are saved
+to ``data/embeddings/lexical.json`` so a restart does not re-tokenize
+everything; like the embedding store's index, each save only appends the
+added and removed rows to ``lexical.log``, which is folded back into the
+snapshot once it outgrows it.
+
+Postings are turned into NumPy arrays on first use per term, so scoring a
+query costs the length of its terms' postings rather than the corpus size.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from embedding_store import FOLD_MIN_BYTES, LOCK_FILENAME, STORE_DIR, FileLock, write_json_atomic
+
+LEXICAL_FILE = STORE_DIR / "lexical.json"
+LEXICAL_LOG = STORE_DIR / "lexical.log"
+
+# Words, numbers and joined codes such as "x-200" or "v2.1".
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return [t for t in _TOKEN.findall(text.lower()) if t not in ENGLISH_STOP_WORDS]
+
+
+class LexicalIndex:
+    def __init__(self, k1=1.2, b=0.75, path=LEXICAL_FILE, log_path=LEXICAL_LOG):
+        self.k1 = k1
+        self.b = b
+        self.path = path
+        self.log_path = log_path
+        self.generation = None
+        self.docs = {}          # row -> Counter of terms
+        self.postings = {}      # term -> {row: tf}
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.total_len = 0
+        self._arrays = {}       # term -> (rows, tf) cached from postings
+        self._pending = None    # log records not saved yet; None forces a full snapshot
+        self._lock = threading.RLock()
+
+    # -- maintenance ---------------------------------------------------------
+
+    def _reset(self, generation):
+        self.generation = generation
+        self.docs = {}
+        self.postings = {}
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.total_len = 0
+        self._arrays = {}
+        self._pending = None
+
+    def _add(self, row, terms):
+        self.docs[row] = terms
+        if row >= len(self.doc_len):
+            grown = np.zeros(max(row + 1, 2 * len(self.doc_len)), dtype=np.float32)
+            grown[:len(self.doc_len)] = self.doc_len
+            self.doc_len = grown
+        length = sum(terms.values())
+        self.doc_len[row] = length
+        self.total_len += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[row] = tf
+            self._arrays.pop(term, None)
+
+    def _remove(self, row):
+        terms = self.docs.pop(row)
+        self.total_len -= int(self.doc_len[row])
+        self.doc_len[row] = 0
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(row, None)
+                if not posting:
+                    del self.postings[term]
+            self._arrays.pop(term, None)
+
+    def update(self, metadata, rows, generation=None):
+        """Index ``metadata[i]["text"]`` under ``rows[i]``; returns whether anything changed."""
+        with self._lock:
+            return self._update(metadata, rows, generation)
+
+    def _update(self, metadata, rows, generation):
+        if generation != self.generation:
+            self._reset(generation)
+        live = {}
+        for entry, row in zip(metadata, rows.tolist()):
+            live.setdefault(row, entry)
+        removed = [r for r in self.docs if r not in live]
+        for row in removed:
+            self._remove(row)
+        added = []
+        for row, entry in live.items():
+            if row not in self.docs:
+                terms = Counter(tokenize(entry["text"]))
+                self._add(row, terms)
+                added.append({"row": row, "terms": dict(terms)})
+        if self._pending is not None:
+            if removed:
+                self._pending.append({"remove": removed})
+            self._pending.extend(added)
+        return bool(removed or added)
+
+    # -- persistence ---------------------------------------------------------
+
+    def save(self):
+        """Append the changes since the last save to the log (or rewrite the snapshot)."""
+        with self._lock:
+            with FileLock(self.path.parent / LOCK_FILENAME):
+                try:
+                    log_size = os.path.getsize(self.log_path)
+                    snapshot_size = os.path.getsize(self.path)
+                    with open(self.log_path, "r", encoding="utf-8") as f:
+                        header = json.loads(f.readline())
+                except (OSError, json.JSONDecodeError):
+                    self._pending = None
+                else:
+                    # Another process may have reset the index since we loaded it.
+                    if header.get("generation") != self.generation or log_size > max(snapshot_size, FOLD_MIN_BYTES):
+                        self._pending = None
+                if self._pending is None:
+                    self._write_snapshot()
+                elif self._pending:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        for record in self._pending:
+                            f.write(json.dumps(record) + "\n")
+                self._pending = []
+
+    def _write_snapshot(self):
+        docs = {str(row): dict(terms) for row, terms in self.docs.items()}
+        write_json_atomic(self.path, {"generation": self.generation, "docs": docs})
+        tmp = self.log_path.with_name(f"{self.log_path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"generation": self.generation}) + "\n")
+        os.replace(tmp, self.log_path)
+
+    @classmethod
+    def load(cls, **kwargs):
+        index = cls(**kwargs)
+        try:
+            with open(index.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return index
+        index.generation = data.get("generation")
+        for row, terms in data.get("docs", {}).items():
+            index._add(int(row), Counter(terms))
+        try:
+            with open(index.log_path, "r", encoding="utf-8") as f:
+                lines = f.read().split("\n")[:-1]   # the last line may be half written
+        except OSError:
+            return index
+        try:
+            header = json.loads(lines[0]) if lines else {}
+        except json.JSONDecodeError:
+            header = {}
+        if header.get("generation") != index.generation:
+            return index
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Processes sharing the store may log the same change twice.
+            for row in record.get("remove", ()):
+                if row in index.docs:
+                    index._remove(row)
+            if "row" in record:
+                if record["row"] in index.docs:
+                    index._remove(record["row"])
+                index._add(record["row"], Counter(record["terms"]))
+        index._pending = []
+        return index
+
+    # -- search --------------------------------------------------------------
+
+    def _term_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            posting = self.postings.get(term, {})
+            arrays = (
+                np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)),
+                np.fromiter(posting.values(), dtype=np.float32, count=len(posting)),
+            )
+            self._arrays[term] = arrays
+        return arrays
+
+    def score(self, query):
+        """Return ``(rows, scores)`` for every document containing a query term."""
+        with self._lock:
+            return self._score(query)
+
+    def _score(self, query):
+        n_docs = len(self.docs)
+        terms = [t for t in set(tokenize(query)) if t in self.postings]
+        if not n_docs or not terms:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        avgdl = self.total_len / n_docs or 1.0
+        all_rows, all_scores = [], []
+        for term in terms:
+            rows, tf = self._term_arrays(term)
+            df = len(rows)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[rows] / avgdl)
+            all_rows.append(rows)
+            all_scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        rows = np.concatenate(all_rows)
+        scores = np.concatenate(all_scores)
+        unique, inverse = np.unique(rows, return_inverse=True)
+        return unique, np.bincount(inverse, weights=scores).astype(np.float32)
+
+    def search(self, query, k, allowed=None):
+        """Top ``k`` rows by BM25, best first; ``allowed`` (sorted rows) restricts the result."""
+        rows, scores = self.score(query)
+        if allowed is not None:
+            keep = np.isin(rows, allowed, assume_unique=True)
+            rows, scores = rows[keep], scores[keep]
+        if len(rows) > k:
+            part = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[part], scores[part]
+        order = np.argsort(-scores, kind="stable")
+        return rows[order], scores[order]
+
+
+def rrf(rankings, k, c=60):
+    """Reciprocal-rank fusion of several best-first row lists; returns the top ``k`` rows."""
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            if row >= 0:
+                fused[row] = fused.get(row, 0.0) + 1.0 / (c + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)[:k]
+
+
+_index = None
+_fingerprint = None
+_lock = threading.Lock()
+
+
+def get_lexical_index(metadata, rows, fingerprint, generation=None):
+    """Return the shared index, brought up to date with the corpus."""
+    global _index, _fingerprint
+    with _lock:
+        if _index is None:
+            _index = LexicalIndex.load()
+        if _fingerprint != fingerprint:
+            if _index.update(metadata, rows, generation):
+                _index.save()
+            _fingerprint = fingerprint
+        return _index
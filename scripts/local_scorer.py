@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Local summaries and impact scores, so a question needs one LLM call.
+
+After every answer the pipeline normally asks the LLM twice more: once for
+a one-sentence summary and once for a 1-10 impact score. With
+``ASK_POST_ANSWER=local`` both are computed here instead, from a single
+embedding-model call:
+
+* the summary is extractive: the answer sentence closest to the answer as
+  a whole;
+* the score comes from a ridge regression over answer embeddings, trained
+  on the ``(answer, impact_score)`` history in the memory log.
+
+Entries scored locally are stored with ``"scored_by": "local"`` and never
+used for training, so the model only learns from LLM scores. Until a model
+has been trained the pipeline still asks the LLM for the score.
+
+    python scripts/local_scorer.py train      # fit the scorer on the log
+    python scripts/local_scorer.py report     # cross-validated agreement with the LLM
+"""
+import argparse
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from embedding_model import encode_texts
+from embedding_store import normalize
+from ollama_interface import is_error_text
+import memory_store
+import metrics
+
+MODEL_FILE = Path("data/memory/impact_model.npz")
+ALPHA = float(os.environ.get("IMPACT_RIDGE_ALPHA", "1.0"))
+MAX_SENTENCES = 40
+MIN_SENTENCE_CHARS = 20
+BATCH_SIZE = 256
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_sentences(text):
+    sentences = [s.strip() for s in _SENTENCE_END.split(text or "")]
+    sentences = [s for s in sentences if s]
+    long_enough = [s for s in sentences if len(s) >= MIN_SENTENCE_CHARS]
+    return (long_enough or sentences)[:MAX_SENTENCES]
+
+
+def summarize(answer):
+    """Return ``(summary, answer vector)`` with one embedding call.
+
+    The summary is the sentence most similar to the whole answer, with a
+    small bonus for appearing early (answers tend to lead with the point).
+    """
+    sentences = split_sentences(answer)
+    with metrics.span("local_summary"):
+        vectors = normalize(encode_texts([answer or ""] + sentences))
+    if not sentences:
+        return "", vectors[0]
+    sims = vectors[1:] @ vectors[0] - 0.01 * np.arange(len(sentences))
+    return sentences[int(sims.argmax())], vectors[0]
+
+
+def answer_vectors(answers, batch_size=BATCH_SIZE):
+    return normalize(encode_texts(answers, batch_size=batch_size)) if answers else np.zeros((0, 0), dtype=np.float32)
+
+
+# -- scorer ---------------------------------------------------------------------
+
+
+def fit(vectors, scores, alpha=ALPHA):
+    """Ridge regression; returns ``(weights, bias)``."""
+    x = np.asarray(vectors, dtype=np.float64)
+    y = np.asarray(scores, dtype=np.float64)
+    x_mean, y_mean = x.mean(axis=0), y.mean()
+    xc = x - x_mean
+    weights = np.linalg.solve(xc.T @ xc + alpha * np.eye(x.shape[1]), xc.T @ (y - y_mean))
+    return weights, y_mean - x_mean @ weights
+
+
+def to_scores(raw):
+    return np.clip(np.rint(raw), 1, 10).astype(np.int64)
+
+
+class ImpactModel:
+    def __init__(self, weights, bias, trained_on=0, alpha=ALPHA):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.trained_on = int(trained_on)
+        self.alpha = float(alpha)
+
+    def predict(self, vectors):
+        """Integer 1-10 scores for unit answer vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        return to_scores(vectors @ self.weights + self.bias)
+
+    def save(self, path=MODEL_FILE):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(tmp, weights=self.weights, bias=self.bias, trained_on=self.trained_on, alpha=self.alpha)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=MODEL_FILE):
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"], data["trained_on"], data["alpha"])
+
+
+_model = (None, None)   # (mtime, model)
+_model_lock = threading.Lock()
+
+
+def get_model(path=MODEL_FILE):
+    """The trained scorer, reloaded when the file changes; ``None`` if untrained."""
+    global _model
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    with _model_lock:
+        if _model[0] != mtime:
+            _model = (mtime, ImpactModel.load(path))
+        return _model[1]
+
+
+def score(vector, path=MODEL_FILE):
+    """Predicted impact score for one answer vector, or ``None`` without a model."""
+    model = get_model(path)
+    if model is None or model.weights.shape[0] != np.shape(vector)[-1]:
+        return None
+    return int(model.predict(vector)[0])
+
+
+# -- training -------------------------------------------------------------------
+
+
+def training_data(memory_file=memory_store.MEMORY_FILE):
+    """``(answers, scores)`` for every real answer the LLM scored.
+
+    Error messages stored as answers by older versions are skipped: their
+    score was parsed out of the error text.
+    """
+    answers, scores = [], []
+    for entry in memory_store.get_store(memory_file).iter_entries():
+        if entry.get("scored_by") == "local" or not entry.get("answer") or is_error_text(entry["answer"]):
+            continue
+        try:
+            value = int(entry.get("impact_score"))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= value <= 10:
+            answers.append(entry["answer"])
+            scores.append(value)
+    return answers, np.asarray(scores, dtype=np.int64)
+
+
+def train(memory_file=memory_store.MEMORY_FILE, path=MODEL_FILE, alpha=ALPHA):
+    """Fit the scorer on the log and save it; returns the model (``None`` if no data)."""
+    answers, scores = training_data(memory_file)
+    if not answers:
+        return None
+    with metrics.span("impact_train"):
+        weights, bias = fit(answer_vectors(answers), scores, alpha)
+    model = ImpactModel(weights, bias, len(answers), alpha)
+    model.save(path)
+    return model
+
+
+def agreement(memory_file=memory_store.MEMORY_FILE, alpha=ALPHA, folds=5, seed=0):
+    """Cross-validated agreement between the local scorer and the LLM scores."""
+    answers, scores = training_data(memory_file)
+    n = len(answers)
+    if n < folds:
+        return {"entries": n}
+    vectors = answer_vectors(answers)
+    predicted = np.zeros(n, dtype=np.int64)
+    baseline = np.zeros(n, dtype=np.int64)
+    for test in np.array_split(np.random.default_rng(seed).permutation(n), folds):
+        train_mask = np.ones(n, dtype=bool)
+        train_mask[test] = False
+        weights, bias = fit(vectors[train_mask], scores[train_mask], alpha)
+        predicted[test] = to_scores(vectors[test] @ weights + bias)
+        baseline[test] = to_scores(scores[train_mask].mean())
+    diff = np.abs(predicted - scores)
+    corr = np.corrcoef(predicted, scores)[0, 1] if predicted.std() and scores.std() else 0.0
+    return {
+        "entries": n,
+        "exact": float((diff == 0).mean()),
+        "within_1": float((diff <= 1).mean()),
+        "mae": float(diff.mean()),
+        "baseline_mae": float(np.abs(baseline - scores).mean()),
+        "correlation": float(corr),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and check the local impact scorer")
+    parser.add_argument("command", choices=["train", "report"])
+    parser.add_argument("--memory-file", type=Path, default=memory_store.MEMORY_FILE)
+    parser.add_argument("--model-file", type=Path, default=MODEL_FILE)
+    parser.add_argument("--alpha", type=float, default=ALPHA, help="Ridge regularisation strength")
+    parser.add_argument("--folds", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        model = train(args.memory_file, args.model_file, args.alpha)
+        if model is None:
+            print("⚠️ No LLM-scored entries to train on.")
+        else:
+            print(f"✅ Trained impact scorer on {model.trained_on} entries -> {args.model_file}")
+        return
+
+    report = agreement(args.memory_file, args.alpha, args.folds)
+    if report["entries"] < args.folds:
+        print(f"⚠️ Only {report['entries']} LLM-scored entries; need at least {args.folds}.")
+        return
+    print(f"📊 Local scorer vs LLM scores ({report['entries']} entries, {args.folds}-fold cross-validation)")
+    print(f"  exact match     {report['exact']:.1%}")
+    print(f"  within ±1       {report['within_1']:.1%}")
+    print(f"  mean abs error  {report['mae']:.2f}  (always-the-mean baseline: {report['baseline_mae']:.2f})")
+    print(f"  correlation     {report['correlation']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,141 @@
+#!/usr/bin/env python3
+"""Turn the memory log into searchable chunks in ``memory_chunks_NNNNN.json``.
+
+Chunking is incremental: each chunk's ID is derived from the ID of the
+memory entry it came from, and a watermark (the log's ``rev`` counter, see
+``memory_store``) records how far the chunk files are up to date. Chunks
+are stored in segments of ``SEGMENT_SIZE`` entries by insertion order, so a
+run only reads entries added or edited since the watermark and rewrites the
+segments holding them. Unchanged chunks keep their IDs and text, and the
+embedding store does not even re-read the untouched segments.
+
+    python scripts/memory_chunker.py          # catch up
+    python scripts/memory_chunker.py --full   # rebuild from the whole log
+"""
+import argparse
 import json
+import re
 from pathlib import Path
-from uuid import uuid4
 
-MEMORY_LOG = Path("data/memory/memory.json")
+from embedding_store import FileLock, write_json_atomic
+import memory_store
+
+MEMORY_LOG = memory_store.MEMORY_FILE
 CHUNK_DIR = Path("data/text_chunks")
+# Older versions kept every chunk in this one file; it names the segments now.
 OUTPUT_FILE = CHUNK_DIR / "memory_chunks.json"
+SEGMENT_SIZE = 1000
 
-def load_memory_entries():
-    if not MEMORY_LOG.exists():
-        print("⚠️ No memory log found.")
+
+def watermark_path(output_file=OUTPUT_FILE):
+    # Not ``.json``: everything matching ``*.json`` in the chunk dir is indexed.
+    return Path(output_file).with_suffix(".watermark")
+
+
+def segment_path(segment, output_file=OUTPUT_FILE):
+    output_file = Path(output_file)
+    return output_file.with_name(f"{output_file.stem}_{segment:05d}.json")
+
+
+def is_memory_chunk_file(name, output_file=OUTPUT_FILE):
+    """True for the memory chunk segments (and the old single chunk file)."""
+    stem = Path(output_file).stem
+    return name == Path(output_file).name or re.fullmatch(rf"{re.escape(stem)}_\d{{5}}\.json", name) is not None
+
+
+def _segments(output_file):
+    output_file = Path(output_file)
+    return [p for p in output_file.parent.glob(f"{output_file.stem}_*.json") if is_memory_chunk_file(p.name, output_file)]
+
+
+def chunk_id(entry_id):
+    return f"memory:{entry_id}"
+
+
+def create_chunk(entry):
+    context = f"Q: {entry['question']}\nA: {entry['answer']}"
+    return {
+        "id": chunk_id(entry["id"]),
+        "entry_id": entry["id"],
+        "source": "memory_log",
+        "text": context,
+        "summary": entry.get("summary", ""),
+        "impact_score": entry.get("impact_score", 5)
+    }
+
+
+def _read_watermark(output_file):
+    """The last chunked ``rev``; 0 (start over) if missing or unreadable."""
+    try:
+        with open(watermark_path(output_file), "r", encoding="utf-8") as f:
+            return int(json.load(f).get("rev", 0))
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _read_segment(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
         return []
-    with open(MEMORY_LOG, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def create_chunks_from_memory(entries):
-    chunks = []
-    for entry in entries:
-        if isinstance(entry, str):
-            try:
-                entry = json.loads(entry)
-            except Exception as e:
-                print(f"❌ Skipping invalid entry: {e}")
-                continue
-        context = f"Q: {entry['question']}\nA: {entry['answer']}"
-        chunk = {
-            "id": str(uuid4()),
-            "source": "memory_log",
-            "text": context,
-            "summary": entry.get("summary", ""),
-            "impact_score": entry.get("impact_score", 5)
-        }
-        chunks.append(chunk)
-    return chunks
-
-def save_chunks(chunks):
-    CHUNK_DIR.mkdir(parents=True, exist_ok=True)
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, indent=2, ensure_ascii=False)
-    print(f"✅ Saved {len(chunks)} memory chunks to {OUTPUT_FILE}")
+
+
+def update_chunks(memory_file=MEMORY_LOG, output_file=OUTPUT_FILE, full=False):
+    """Bring the memory chunk segments up to date with the memory log.
+
+    Returns the number of chunks added or replaced. Each segment is written
+    atomically before the watermark, so a crash in between only means the
+    same entries are re-chunked next time.
+    """
+    output_file = Path(output_file)
+    store = memory_store.get_store(memory_file)
+    with FileLock(output_file.with_suffix(".lock")):
+        legacy = output_file.exists()
+        full = full or legacy
+        watermark = 0 if full else _read_watermark(output_file)
+        if watermark == 0:
+            full = True
+        touched = {}    # segment -> {chunk id: (seq, chunk)}
+        for rev, seq, entry in store.changes_since(watermark, with_seq=True):
+            chunk = create_chunk(entry)
+            touched.setdefault(seq // SEGMENT_SIZE, {})[chunk["id"]] = (seq, chunk)
+            watermark = max(watermark, rev)
+        if full:
+            for path in _segments(output_file):
+                if path.name not in {segment_path(s, output_file).name for s in touched}:
+                    path.unlink()
+        changed = 0
+        for segment, updates in sorted(touched.items()):
+            path = segment_path(segment, output_file)
+            chunks = [] if full else _read_segment(path)
+            by_id = {c.get("id"): i for i, c in enumerate(chunks)}
+            for _, chunk in sorted(updates.values(), key=lambda item: item[0]):
+                if chunk["id"] in by_id:
+                    chunks[by_id[chunk["id"]]] = chunk
+                else:
+                    by_id[chunk["id"]] = len(chunks)
+                    chunks.append(chunk)
+            write_json_atomic(path, chunks, indent=2)
+            changed += len(updates)
+        if legacy:
+            output_file.unlink()
+        if changed or full:
+            write_json_atomic(watermark_path(output_file), {"rev": watermark})
+    return changed
+
 
 def main():
-    entries = load_memory_entries()
-    chunks = create_chunks_from_memory(entries)
-    save_chunks(chunks)
+    parser = argparse.ArgumentParser(description="Chunk the memory log for retrieval")
+    parser.add_argument("--full", action="store_true", help="Rebuild from the whole log")
+    args = parser.parse_args()
+
+    if not MEMORY_LOG.exists() and not memory_store.db_path_for(MEMORY_LOG).exists():
+        print("⚠️ No memory log found.")
+        return
+    changed = update_chunks(full=args.full)
+    print(f"✅ Updated {changed} memory chunks in {OUTPUT_FILE.parent}")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+"""SQLite-backed memory log.
+
+Entries live in ``data/memory/memory.db`` in WAL mode, so each question is
+one atomic ``INSERT`` instead of a rewrite of the whole history, and the
+threaded web server, the GUI and the CLI can all write at the same time
+without losing entries. The first time a store is opened next to an
+existing ``memory.json`` it imports that file once.
+
+Everything that reads the whole log (``memory_manager.load_log``, the
+chunker) goes through :func:`load_entries`, which accepts either the
+database path or the legacy JSON path. The reflection, analytics and gap
+scripts read the ``topic_stats`` table instead: per-topic counts, score
+sums, high-impact counts and latest timestamps kept current by triggers on
+every insert, edit and topic label, so a report costs O(topics).
+"""
+import argparse
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from uuid import uuid4
+
+import metrics
+
+MEMORY_FILE = Path("data/memory/memory.json")
+DB_FILE = Path("data/memory/memory.db")
+
+# Known fields in their original JSON order; anything else goes to ``extra``.
+FIELDS = ["id", "timestamp", "question", "answer", "summary", "impact_score", "topic"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    timestamp TEXT,
+    question TEXT,
+    answer TEXT,
+    summary TEXT,
+    impact_score,
+    topic TEXT,
+    extra TEXT,
+    rev INTEGER
+);
+CREATE INDEX IF NOT EXISTS entries_topic ON entries (topic, seq);
+CREATE INDEX IF NOT EXISTS entries_timestamp ON entries (timestamp);
+CREATE INDEX IF NOT EXISTS entries_score ON entries (impact_score);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# ``rev`` is a log-wide change counter: every insert or edit stamps the row
+# with the next value, so consumers can ask for "everything since rev N".
+# Topic labels are written back after the fact by the labeller and do not
+# count as edits (the topic aggregates have their own triggers).
+REV_SCHEMA = """
+CREATE INDEX IF NOT EXISTS entries_rev ON entries (rev);
+CREATE TRIGGER IF NOT EXISTS entries_rev_insert AFTER INSERT ON entries
+BEGIN
+    UPDATE entries SET rev = (SELECT COALESCE(MAX(rev), 0) + 1 FROM entries) WHERE seq = NEW.seq;
+END;
+DROP TRIGGER IF EXISTS entries_rev_update;
+CREATE TRIGGER IF NOT EXISTS entries_rev_edit
+AFTER UPDATE OF timestamp, question, answer, summary, impact_score, extra ON entries
+BEGIN
+    UPDATE entries SET rev = (SELECT COALESCE(MAX(rev), 0) + 1 FROM entries) WHERE seq = NEW.seq;
+END;
+"""
+
+# Per-topic aggregates. Adding an entry to a topic is an O(1) upsert; taking
+# one out subtracts, and re-reads MIN(seq)/MAX(timestamp) through the
+# (topic, ...) indexes only if it was the topic's first or latest entry.
+# Entries without a topic are not counted.
+TOPIC_STATS_SCHEMA = """
+CREATE INDEX IF NOT EXISTS entries_topic_time ON entries (topic, timestamp);
+CREATE TABLE IF NOT EXISTS topic_stats (
+    topic TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    score_sum NOT NULL,
+    high_impact INTEGER NOT NULL,
+    first_seq INTEGER,
+    last_timestamp TEXT
+);
+CREATE TRIGGER IF NOT EXISTS topic_stats_insert AFTER INSERT ON entries
+WHEN NEW.topic IS NOT NULL AND NEW.topic != ''
+BEGIN
+    INSERT INTO topic_stats (topic, count, score_sum, high_impact, first_seq, last_timestamp)
+    VALUES (NEW.topic, 1, COALESCE(NEW.impact_score, 0), COALESCE(NEW.impact_score, 0) > 7,
+            NEW.seq, NEW.timestamp)
+    ON CONFLICT (topic) DO UPDATE SET
+        count = count + 1,
+        score_sum = score_sum + COALESCE(NEW.impact_score, 0),
+        high_impact = high_impact + (COALESCE(NEW.impact_score, 0) > 7),
+        first_seq = MIN(first_seq, NEW.seq),
+        last_timestamp = CASE
+            WHEN last_timestamp IS NULL OR NEW.timestamp > last_timestamp THEN NEW.timestamp
+            ELSE last_timestamp END;
+END;
+CREATE TRIGGER IF NOT EXISTS topic_stats_update
+AFTER UPDATE OF topic, impact_score, timestamp ON entries
+BEGIN
+    UPDATE topic_stats SET
+        count = count - 1,
+        score_sum = score_sum - COALESCE(OLD.impact_score, 0),
+        high_impact = high_impact - (COALESCE(OLD.impact_score, 0) > 7),
+        first_seq = CASE WHEN first_seq = OLD.seq
+            THEN (SELECT MIN(seq) FROM entries WHERE topic = OLD.topic AND seq > OLD.seq)
+            ELSE first_seq END,
+        last_timestamp = CASE WHEN last_timestamp IS OLD.timestamp
+            THEN (SELECT MAX(timestamp) FROM entries WHERE topic = OLD.topic AND seq != OLD.seq)
+            ELSE last_timestamp END
+    WHERE topic = OLD.topic;
+    DELETE FROM topic_stats WHERE topic = OLD.topic AND count <= 0;
+    INSERT INTO topic_stats (topic, count, score_sum, high_impact, first_seq, last_timestamp)
+    SELECT NEW.topic, 1, COALESCE(NEW.impact_score, 0), COALESCE(NEW.impact_score, 0) > 7,
+           NEW.seq, NEW.timestamp
+    WHERE NEW.topic IS NOT NULL AND NEW.topic != ''
+    ON CONFLICT (topic) DO UPDATE SET
+        count = count + 1,
+        score_sum = score_sum + COALESCE(NEW.impact_score, 0),
+        high_impact = high_impact + (COALESCE(NEW.impact_score, 0) > 7),
+        first_seq = MIN(COALESCE(first_seq, NEW.seq), NEW.seq),
+        last_timestamp = CASE
+            WHEN last_timestamp IS NULL OR NEW.timestamp > last_timestamp THEN NEW.timestamp
+            ELSE last_timestamp END;
+END;
+CREATE TRIGGER IF NOT EXISTS topic_stats_delete AFTER DELETE ON entries
+WHEN OLD.topic IS NOT NULL AND OLD.topic != ''
+BEGIN
+    UPDATE topic_stats SET
+        count = count - 1,
+        score_sum = score_sum - COALESCE(OLD.impact_score, 0),
+        high_impact = high_impact - (COALESCE(OLD.impact_score, 0) > 7),
+        first_seq = (SELECT MIN(seq) FROM entries WHERE topic = OLD.topic),
+        last_timestamp = (SELECT MAX(timestamp) FROM entries WHERE topic = OLD.topic)
+    WHERE topic = OLD.topic;
+    DELETE FROM topic_stats WHERE topic = OLD.topic AND count <= 0;
+END;
+"""
+
+
+def db_path_for(path):
+    """Map a ``--memory-file`` argument (JSON or DB) to its database path."""
+    path = Path(path)
+    return path if path.suffix == ".db" else path.with_suffix(".db")
+
+
+class MemoryStore:
+    def __init__(self, db_path=DB_FILE, legacy_json=None):
+        self.db_path = Path(db_path)
+        self.legacy_json = Path(legacy_json) if legacy_json else self.db_path.with_suffix(".json")
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialised = False
+
+    # -- connections ---------------------------------------------------------
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialised:
+            with self._init_lock:
+                if not self._initialised:
+                    conn.executescript(SCHEMA)
+                    self._add_rev(conn)
+                    self._migrate(conn)
+                    self._add_topic_stats(conn)
+                    self._initialised = True
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # -- conversion ----------------------------------------------------------
+
+    @staticmethod
+    def _to_row(entry):
+        extra = {k: v for k, v in entry.items() if k not in FIELDS}
+        return (
+            entry.get("id") or str(uuid4()),
+            entry.get("timestamp"),
+            entry.get("question"),
+            entry.get("answer"),
+            entry.get("summary"),
+            entry.get("impact_score"),
+            entry.get("topic"),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+        )
+
+    @staticmethod
+    def _to_entry(row, fields=FIELDS):
+        entry = {}
+        for field in fields:
+            value = row[field]
+            if value is None and field == "topic":
+                continue
+            entry[field] = value
+        if "extra" in row.keys() and row["extra"]:
+            entry.update(json.loads(row["extra"]))
+        return entry
+
+    # -- migration -----------------------------------------------------------
+
+    def _add_rev(self, conn):
+        """Add the ``rev`` column to databases created before it existed."""
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(entries)")}
+        if "rev" not in columns:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(entries)")}
+                if "rev" not in columns:
+                    conn.execute("ALTER TABLE entries ADD COLUMN rev INTEGER")
+                    conn.execute("UPDATE entries SET rev = seq")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        conn.executescript(REV_SCHEMA)
+
+    def _add_topic_stats(self, conn):
+        """Create the aggregates and fill them once for an existing log."""
+        conn.executescript(TOPIC_STATS_SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT value FROM meta WHERE key = 'topic_stats'").fetchone()
+            if done is None:
+                self._fill_topic_stats(conn)
+                conn.execute("INSERT INTO meta (key, value) VALUES ('topic_stats', '1')")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _fill_topic_stats(conn):
+        conn.execute("DELETE FROM topic_stats")
+        conn.execute(
+            "INSERT INTO topic_stats (topic, count, score_sum, high_impact, first_seq, last_timestamp) "
+            "SELECT topic, COUNT(*), SUM(COALESCE(impact_score, 0)), "
+            "SUM(COALESCE(impact_score, 0) > 7), MIN(seq), MAX(timestamp) "
+            "FROM entries WHERE topic IS NOT NULL AND topic != '' GROUP BY topic"
+        )
+
+    def _migrate(self, conn):
+        """Import the legacy JSON log once, on first open."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone()
+            if done is None:
+                count = 0
+                if self.legacy_json.exists():
+                    count = self._import_json(conn, self.legacy_json)
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('migrated_from', ?)",
+                    (json.dumps({"path": str(self.legacy_json), "entries": count}),),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _import_json(self, conn, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except json.JSONDecodeError:
+            return 0
+        rows = []
+        for entry in data:
+            if isinstance(entry, str):
+                try:
+                    entry = json.loads(entry)
+                except json.JSONDecodeError:
+                    continue
+            if isinstance(entry, dict):
+                rows.append(self._to_row(entry))
+        conn.executemany(
+            "INSERT OR IGNORE INTO entries (id, timestamp, question, answer, summary, impact_score, topic, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        return len(rows)
+
+    # -- public API ----------------------------------------------------------
+
+    def add(self, entry):
+        """Append one entry atomically and return it."""
+        conn = self._connect()
+        row = self._to_row(entry)
+        with metrics.span("memory_write"):
+            conn.execute(
+                "INSERT INTO entries (id, timestamp, question, answer, summary, impact_score, topic, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+        return dict(entry, id=row[0])
+
+    def update(self, entry_id, **fields):
+        """Edit fields of an existing entry; returns ``False`` if it is unknown."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT * FROM entries WHERE id = ?", (entry_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            entry = self._to_entry(row)
+            entry.update(fields)
+            new = self._to_row(entry)
+            conn.execute(
+                "UPDATE entries SET timestamp = ?, question = ?, answer = ?, summary = ?, "
+                "impact_score = ?, topic = ?, extra = ? WHERE id = ?",
+                new[1:] + (entry_id,),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def set_topics(self, pairs):
+        """Store ``(entry_id, topic)`` labels in one transaction."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "UPDATE entries SET topic = ? WHERE id = ? AND topic IS NOT ?",
+                [(t, i, t) for i, t in pairs],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def changes_since(self, rev=0, batch_size=1000, with_seq=False):
+        """Yield ``(rev, entry)`` for entries added or edited after ``rev``, oldest change first.
+
+        With ``with_seq`` the items are ``(rev, seq, entry)``; ``seq`` is the
+        entry's insertion position.
+        """
+        cursor = self._connect().execute(
+            "SELECT * FROM entries WHERE rev > ? ORDER BY rev", (rev,)
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                if with_seq:
+                    yield row["rev"], row["seq"], self._to_entry(row)
+                else:
+                    yield row["rev"], self._to_entry(row)
+
+    def last_rev(self):
+        return self._connect().execute("SELECT COALESCE(MAX(rev), 0) FROM entries").fetchone()[0]
+
+    # -- topic aggregates ----------------------------------------------------
+
+    def topic_stats(self):
+        """Per-topic aggregates in order of each topic's first entry.
+
+        Each item has ``topic``, ``count``, ``avg_score``, ``high_impact``
+        (entries scoring above 7) and ``last_timestamp``.
+        """
+        rows = self._connect().execute(
+            "SELECT topic, count, score_sum, high_impact, last_timestamp "
+            "FROM topic_stats ORDER BY first_seq"
+        ).fetchall()
+        return [
+            {
+                "topic": r["topic"],
+                "count": r["count"],
+                "avg_score": r["score_sum"] / r["count"],
+                "high_impact": r["high_impact"],
+                "last_timestamp": r["last_timestamp"],
+            }
+            for r in rows
+        ]
+
+    def rebuild_topic_stats(self):
+        """Recompute the aggregates from the log (after manual edits to the DB)."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._fill_topic_stats(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def unlabelled(self):
+        """Entries that have no topic yet."""
+        rows = self._connect().execute(
+            "SELECT * FROM entries WHERE topic IS NULL OR topic = '' ORDER BY seq"
+        ).fetchall()
+        return [self._to_entry(r) for r in rows]
+
+    def topic_entries(self, topic, min_score=None, fields=None):
+        """Entries of one topic in insertion order, read through the topic index."""
+        fields = [f for f in (fields or FIELDS) if f in FIELDS] or ["id"]
+        columns = fields + (["extra"] if fields == FIELDS else [])
+        sql = f"SELECT {', '.join(columns)} FROM entries WHERE topic = ?"
+        params = [topic]
+        if min_score is not None:
+            sql += " AND impact_score >= ?"
+            params.append(min_score)
+        rows = self._connect().execute(sql + " ORDER BY seq", params).fetchall()
+        return [self._to_entry(r, fields) for r in rows]
+
+    def topic_groups(self, min_score=None):
+        """``{topic: entries}`` ordered by each topic's first (matching) entry."""
+        if min_score is None:
+            return {s["topic"]: self.topic_entries(s["topic"]) for s in self.topic_stats()}
+        rows = self._connect().execute(
+            "SELECT topic FROM entries WHERE topic IS NOT NULL AND topic != '' AND impact_score >= ? "
+            "GROUP BY topic ORDER BY MIN(seq)",
+            (min_score,),
+        ).fetchall()
+        return {r["topic"]: self.topic_entries(r["topic"], min_score) for r in rows}
+
+    def top_entries(self, n=5):
+        """The ``n`` highest-scoring entries, earliest first among ties."""
+        rows = self._connect().execute(
+            "SELECT * FROM entries ORDER BY impact_score DESC, seq LIMIT ?", (n,)
+        ).fetchall()
+        return [self._to_entry(r) for r in rows]
+
+    def iter_entries(self, batch_size=1000, fields=None):
+        """Yield every entry in insertion order without loading them all."""
+        if fields is None:
+            fields, columns = FIELDS, "*"
+        else:
+            fields = [f for f in fields if f in FIELDS] or ["id"]
+            columns = ", ".join(fields)
+        cursor = self._connect().execute(f"SELECT {columns} FROM entries ORDER BY seq")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield self._to_entry(row, fields)
+
+    def all(self):
+        return list(self.iter_entries())
+
+    def query(self, cursor=None, limit=50, topic=None, since=None, until=None,
+              min_score=None, text=None, fields=None, newest_first=True):
+        """Return one page of entries matching the filters.
+
+        Pages are keyed on the insertion sequence, so each call costs the
+        size of the page rather than the size of the log. Pass the returned
+        ``next_cursor`` back in to get the following page; it is ``None``
+        on the last page. ``fields`` limits which entry fields are returned.
+        """
+        fields = [f for f in (fields or FIELDS) if f in FIELDS] or ["id"]
+        columns = ["seq"] + fields
+        if fields == FIELDS:
+            columns.append("extra")
+        where, params = [], []
+        if cursor is not None:
+            where.append("seq < ?" if newest_first else "seq > ?")
+            params.append(int(cursor))
+        if topic is not None:
+            where.append("topic = ?")
+            params.append(topic)
+        if since is not None:
+            where.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("timestamp < ?")
+            params.append(until)
+        if min_score is not None:
+            where.append("impact_score >= ?")
+            params.append(min_score)
+        if text:
+            like = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where.append(
+                "(question LIKE ? ESCAPE '\\' OR summary LIKE ? ESCAPE '\\' OR answer LIKE ? ESCAPE '\\')"
+            )
+            params.extend([like, like, like])
+        sql = f"SELECT {', '.join(columns)} FROM entries"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY seq {'DESC' if newest_first else 'ASC'} LIMIT ?"
+        params.append(limit + 1)
+        rows = self._connect().execute(sql, params).fetchall()
+        page = rows[:limit]
+        next_cursor = page[-1]["seq"] if len(rows) > limit and page else None
+        return {
+            "entries": [self._to_entry(r, fields) for r in page],
+            "next_cursor": str(next_cursor) if next_cursor is not None else None,
+        }
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def export_json(self, path):
+        """Write the whole log in the legacy ``memory.json`` format."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.all(), f, indent=2, ensure_ascii=False)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path=MEMORY_FILE):
+    """Return the shared store for ``path`` (legacy JSON or ``.db``)."""
+    path = Path(path)
+    db_path = db_path_for(path)
+    key = str(db_path.resolve())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            legacy = path if path.suffix == ".json" else None
+            store = _stores[key] = MemoryStore(db_path, legacy)
+        return store
+
+
+def load_entries(path=MEMORY_FILE):
+    """Return every memory entry, in insertion order, as plain dicts."""
+    path = Path(path)
+    if not path.exists() and not db_path_for(path).exists():
+        return []
+    return get_store(path).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the memory log database")
+    parser.add_argument("command", choices=["migrate", "export", "stats", "rebuild-stats"])
+    parser.add_argument("--memory-file", type=Path, default=MEMORY_FILE)
+    parser.add_argument("--output", type=Path, help="With export: JSON file to write")
+    args = parser.parse_args()
+
+    store = get_store(args.memory_file)
+    if args.command == "migrate":
+        print(f"✅ {store.db_path} holds {store.count()} entries")
+    elif args.command == "export":
+        out = args.output or args.memory_file.with_suffix(".export.json")
+        store.export_json(out)
+        print(f"✅ Exported {store.count()} entries to {out}")
+    elif args.command == "rebuild-stats":
+        store.rebuild_topic_stats()
+        print(f"✅ Rebuilt topic aggregates for {len(store.topic_stats())} topics")
+    else:
+        print(json.dumps({
+            "db": str(store.db_path),
+            "entries": store.count(),
+            "topics": len(store.topic_stats()),
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""Lightweight stage timing, Prometheus metrics and JSONL traces.
+
+Code marks its stages with :func:`span`::
+
+    with metrics.span("encode_query"):
+        ...
+
+When metrics are enabled each span feeds the ``rag_stage_seconds``
+histogram, the ``rag_stage_in_flight`` gauge and, on exceptions,
+``rag_stage_errors_total``; with a trace file every finished span is also
+appended as one JSON line. While disabled (the default) :func:`span`
+returns a shared no-op object, so instrumented code pays one attribute
+lookup and a function call.
+
+Enable with :func:`enable` or ``RAG_METRICS=1``; ``RAG_TRACE_FILE`` sets the
+trace file. :func:`render` produces the Prometheus text format served at
+``/metrics`` by ``app_web``; :func:`stage_table` is the ``--profile`` report.
+"""
+import json
+import os
+import threading
+import time
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_counters = {}      # (name, labels) -> value
+_gauges = {}        # (name, labels) -> value
+_gauge_fns = {}     # name -> (help, fn returning {labels: value})
+_histograms = {}    # (name, labels) -> [bucket counts..., sum, count]
+_help = {
+    "rag_stage_seconds": "Time spent in each pipeline stage",
+    "rag_stage_in_flight": "Stages currently running",
+    "rag_stage_errors_total": "Stages that raised an exception",
+}
+_enabled = os.environ.get("RAG_METRICS", "0").lower() in ("1", "true", "yes")
+_trace = None
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def enable(trace_file=None):
+    """Start recording; with ``trace_file`` also append spans to it as JSON lines."""
+    global _enabled, _trace
+    _enabled = True
+    if trace_file:
+        with _lock:
+            if _trace is not None:
+                _trace.close()
+            _trace = open(trace_file, "a", encoding="utf-8")
+
+
+def disable():
+    global _enabled, _trace
+    _enabled = False
+    with _lock:
+        if _trace is not None:
+            _trace.close()
+            _trace = None
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+# -- primitives -----------------------------------------------------------------
+
+
+def inc(name, value=1, help=None, **labels):
+    if not _enabled:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+        if help:
+            _help.setdefault(name, help)
+
+
+def set_gauge(name, value, help=None, **labels):
+    if not _enabled:
+        return
+    with _lock:
+        _gauges[(name, _labels(labels))] = value
+        if help:
+            _help.setdefault(name, help)
+
+
+def _add_gauge(name, delta, labels):
+    key = (name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def register_gauge(name, fn, help=""):
+    """Sample ``fn()`` at scrape time; it returns a value or ``{labels dict as tuple: value}``."""
+    with _lock:
+        _gauge_fns[name] = (help, fn)
+
+
+def observe(name, seconds, help=None, **labels):
+    if not _enabled:
+        return
+    _observe(name, _labels(labels), seconds)
+    if help:
+        _help.setdefault(name, help)
+
+
+def _observe(name, labels, seconds):
+    key = (name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+        hist[-2] += seconds
+        hist[-1] += 1
+
+
+# -- spans ----------------------------------------------------------------------
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("stage", "labels", "start")
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        _add_gauge("rag_stage_in_flight", 1, self.labels)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        _add_gauge("rag_stage_in_flight", -1, self.labels)
+        _observe("rag_stage_seconds", self.labels, seconds)
+        if exc_type is not None:
+            with _lock:
+                key = ("rag_stage_errors_total", self.labels)
+                _counters[key] = _counters.get(key, 0) + 1
+        if _trace is not None:
+            record = {
+                "ts": time.time(),
+                "seconds": seconds,
+                "thread": threading.current_thread().name,
+                **dict(self.labels),
+            }
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            with _lock:
+                if _trace is not None:
+                    _trace.write(line)
+                    _trace.flush()
+        return False
+
+
+def span(stage, **labels):
+    """Context manager timing one stage (no-op while metrics are disabled)."""
+    if not _enabled:
+        return _NO_SPAN
+    labels["stage"] = stage
+    return _Span(stage, _labels(labels))
+
+
+# -- reporting ------------------------------------------------------------------
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    body = ",".join(
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in items
+    )
+    return "{" + body + "}"
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        gauge_fns = dict(_gauge_fns)
+    for name, (help_text, fn) in gauge_fns.items():
+        try:
+            value = fn()
+        except Exception:
+            continue
+        values = value if isinstance(value, dict) else {(): value}
+        for labels, v in values.items():
+            gauges[(name, tuple(labels))] = v
+        _help.setdefault(name, help_text)
+
+    def header(name, kind, seen):
+        if name not in seen:
+            seen.add(name)
+            if _help.get(name):
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        header(name, "counter", seen)
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    for (name, labels), value in sorted(gauges.items()):
+        header(name, "gauge", seen)
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    for (name, labels), hist in sorted(histograms.items()):
+        header(name, "histogram", seen)
+        for bound, count in zip(BUCKETS, hist):
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {hist[-1]}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {hist[-2]}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {hist[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def stage_stats():
+    """``{stage: {"count", "total", "mean"}}`` from the stage histogram."""
+    stats = {}
+    with _lock:
+        for (name, labels), hist in _histograms.items():
+            if name != "rag_stage_seconds":
+                continue
+            stage = dict(labels).get("stage")
+            s = stats.setdefault(stage, {"count": 0, "total": 0.0})
+            s["count"] += hist[-1]
+            s["total"] += hist[-2]
+    for s in stats.values():
+        s["mean"] = s["total"] / s["count"] if s["count"] else 0.0
+    return stats
+
+
+def stage_table():
+    """Per-stage breakdown, slowest total first, as printable text."""
+    stats = stage_stats()
+    if not stats:
+        return "No stages recorded."
+    width = max(len(stage) for stage in stats)
+    lines = [f"{'stage'.ljust(width)}  {'calls':>6}  {'total s':>9}  {'mean s':>9}"]
+    for stage, s in sorted(stats.items(), key=lambda kv: -kv[1]["total"]):
+        lines.append(f"{stage.ljust(width)}  {s['count']:>6}  {s['total']:>9.3f}  {s['mean']:>9.4f}")
+    return "\n".join(lines)
+
+
+if os.environ.get("RAG_TRACE_FILE"):
+    enable(os.environ["RAG_TRACE_FILE"])
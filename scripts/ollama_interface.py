@@ -1,18 +1,378 @@
+"""Client for the local Ollama server.
+
+Requests go to the Ollama HTTP API over a small pool of keep-alive
+connections, with token streaming, per-call timeouts, retries and
+:class:`OllamaError` for failures. When the server cannot be reached the
+old ``ollama run`` subprocess path is used as a fallback.
+
+Configuration via environment:
+
+- ``OLLAMA_HOST``: server URL (default ``http://127.0.0.1:11434``)
+- ``OLLAMA_BACKEND``: ``auto`` (default), ``http`` or ``subprocess``
+- ``OLLAMA_CONCURRENCY``: most :func:`query_llama` calls in flight at once
+  (default 2; ``0`` for no limit). Set it to what the server can run in
+  parallel (Ollama's ``OLLAMA_NUM_PARALLEL``); extra calls wait their turn.
+"""
+import http.client
+import json
+import os
+import queue
 import subprocess
+import threading
+import time
+from urllib.parse import urlparse
+
+import metrics
+
+DEFAULT_MODEL = "llama3.2"
+DEFAULT_TIMEOUT = 120
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+OLLAMA_BACKEND = os.environ.get("OLLAMA_BACKEND", "auto")
+OLLAMA_CONCURRENCY = int(os.environ.get("OLLAMA_CONCURRENCY", "2"))
+ERROR_PREFIX = "❌ Error calling LLaMA"
+
+
+class OllamaError(Exception):
+    """A failed LLM call.
+
+    ``kind`` is one of ``connection``, ``timeout``, ``http``, ``model`` or
+    ``subprocess``; ``retryable`` says whether repeating the call may help.
+    """
+
+    def __init__(self, message, kind="http", status=None, retryable=False):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+        self.retryable = retryable
+
+    def to_dict(self):
+        return {"error": str(self), "kind": self.kind, "status": self.status}
+
+
+class OllamaClient:
+    def __init__(self, host=OLLAMA_HOST, pool_size=4, timeout=DEFAULT_TIMEOUT, retries=2, backoff=0.5):
+        url = urlparse(host if "://" in host else f"http://{host}")
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or 11434
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    # -- connection pool -----------------------------------------------------
+
+    def _acquire(self, timeout):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
 
-def query_llama(prompt, system_context=None, model="llama3.2"):
+    def _open(self, method, path, payload, timeout, retries=None):
+        """Send a request and return ``(conn, response)`` with retries."""
+        retries = self.retries if retries is None else retries
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body else {}
+        attempt = 0
+        while True:
+            conn = self._acquire(timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+            except (ConnectionError, http.client.HTTPException, OSError) as e:
+                conn.close()
+                if isinstance(e, TimeoutError) or "timed out" in str(e):
+                    err = OllamaError(f"Ollama request timed out after {timeout}s", "timeout")
+                else:
+                    err = OllamaError(f"Cannot reach Ollama at {self.host}:{self.port}: {e}", "connection", retryable=True)
+            else:
+                if resp.status < 400:
+                    return conn, resp
+                detail = resp.read().decode("utf-8", "replace")
+                self._release(conn)
+                try:
+                    detail = json.loads(detail).get("error", detail)
+                except (ValueError, AttributeError):
+                    pass
+                err = OllamaError(
+                    f"Ollama returned {resp.status}: {detail}",
+                    "model" if resp.status == 404 else "http",
+                    status=resp.status,
+                    retryable=resp.status >= 500 or resp.status == 429,
+                )
+            if not err.retryable or attempt >= retries:
+                raise err
+            attempt += 1
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+
+    # -- API -----------------------------------------------------------------
+
+    def is_available(self, timeout=2):
+        try:
+            conn, resp = self._open("GET", "/api/version", None, timeout, retries=0)
+        except OllamaError:
+            return False
+        resp.read()
+        self._release(conn)
+        return True
+
+    def _payload(self, prompt, system, model, stream, options):
+        payload = {"model": model, "prompt": prompt, "stream": stream}
+        if system:
+            payload["system"] = system
+        if options:
+            payload["options"] = options
+        return payload
+
+    def generate(self, prompt, system=None, model=DEFAULT_MODEL, timeout=None, options=None):
+        """Return the full completion for ``prompt``."""
+        timeout = timeout or self.timeout
+        conn, resp = self._open("POST", "/api/generate", self._payload(prompt, system, model, False, options), timeout)
+        try:
+            data = json.loads(resp.read().decode("utf-8"))
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise OllamaError(f"Lost connection to Ollama: {e}", "connection", retryable=True)
+        except ValueError as e:
+            conn.close()
+            raise OllamaError(f"Invalid response from Ollama: {e}")
+        self._release(conn)
+        if data.get("error"):
+            raise OllamaError(data["error"], "model")
+        return data.get("response", "").strip()
+
+    def stream(self, prompt, system=None, model=DEFAULT_MODEL, timeout=None, options=None):
+        """Yield completion text piece by piece as the model produces it."""
+        timeout = timeout or self.timeout
+        conn, resp = self._open("POST", "/api/generate", self._payload(prompt, system, model, True, options), timeout)
+        finished = False
+        try:
+            for line in resp:
+                line = line.strip()
+                if not line:
+                    continue
+                data = json.loads(line.decode("utf-8"))
+                if data.get("error"):
+                    raise OllamaError(data["error"], "model")
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    resp.read()
+                    finished = True
+                    break
+        except (OSError, http.client.HTTPException) as e:
+            raise OllamaError(f"Stream from Ollama interrupted: {e}", "connection", retryable=True)
+        except ValueError as e:
+            raise OllamaError(f"Invalid stream from Ollama: {e}")
+        finally:
+            if finished:
+                self._release(conn)
+            else:
+                conn.close()
+
+
+def _subprocess_prompt(prompt, system_context):
     full_prompt = ""
     if system_context:
         full_prompt += f"<<SYS>>\n{system_context}\n<</SYS>>\n"
     full_prompt += f"{prompt}"
+    return full_prompt
+
+
+def _run_subprocess(prompt, system_context, model, timeout):
     try:
         result = subprocess.run(
-            ["ollama", "run", model, full_prompt],
+            ["ollama", "run", model, _subprocess_prompt(prompt, system_context)],
             capture_output=True,
             text=True,
             encoding="utf-8",
-            timeout=60
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise OllamaError(f"ollama run timed out after {timeout}s", "timeout", retryable=True)
+    except OSError as e:
+        raise OllamaError(f"Cannot start ollama: {e}", "subprocess")
+    if result.returncode != 0:
+        raise OllamaError(result.stderr.strip() or f"ollama exited with {result.returncode}", "subprocess")
+    return result.stdout.strip()
+
+
+def _stream_subprocess(prompt, system_context, model, timeout):
+    try:
+        proc = subprocess.Popen(
+            ["ollama", "run", model, _subprocess_prompt(prompt, system_context)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
         )
-        return result.stdout.strip()
-    except Exception as e:
-        return f"❌ Error calling LLaMA: {e}"
+    except OSError as e:
+        raise OllamaError(f"Cannot start ollama: {e}", "subprocess")
+    timer = threading.Timer(timeout, proc.kill)
+    timer.start()
+    try:
+        while True:
+            piece = proc.stdout.read(16)
+            if not piece:
+                break
+            yield piece
+        proc.wait()
+        if not timer.is_alive():
+            raise OllamaError(f"ollama run timed out after {timeout}s", "timeout", retryable=True)
+        if proc.returncode != 0:
+            raise OllamaError(proc.stderr.read().strip() or f"ollama exited with {proc.returncode}", "subprocess")
+    finally:
+        timer.cancel()
+        if proc.poll() is None:
+            proc.kill()
+
+
+_client = None
+_client_lock = threading.Lock()
+# Whether the HTTP API answered and when we last checked, so the auto
+# backend doesn't probe the server on every call.
+_http_state = (None, 0.0)
+HTTP_RECHECK_SECONDS = 30
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+        return _client
+
+
+def set_client(client):
+    """Point every caller at ``client`` (e.g. one talking to the fake server)."""
+    global _client, _http_state
+    with _client_lock:
+        _client = client
+        _http_state = (None, 0.0)
+
+
+def _use_http():
+    global _http_state
+    if OLLAMA_BACKEND == "http":
+        return True
+    if OLLAMA_BACKEND == "subprocess":
+        return False
+    ok, checked = _http_state
+    if ok is None or (not ok and time.monotonic() - checked > HTTP_RECHECK_SECONDS):
+        ok = get_client().is_available()
+        _http_state = (ok, time.monotonic())
+    return ok
+
+
+def _fall_back(error):
+    """Return True if ``error`` should send this call down the subprocess path."""
+    global _http_state
+    if OLLAMA_BACKEND != "auto" or error.kind != "connection":
+        return False
+    _http_state = (False, time.monotonic())
+    return True
+
+
+class _Slots:
+    """Counting semaphore whose size can be changed at runtime."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with metrics.span("llm_wait"), self._cond:
+            self.waiting += 1
+            while self.limit and self.active >= self.limit:
+                self._cond.wait()
+            self.waiting -= 1
+            self.active += 1
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def set_limit(self, limit):
+        with self._cond:
+            self.limit = limit
+            self._cond.notify_all()
+
+
+llm_slots = _Slots(OLLAMA_CONCURRENCY)
+
+
+def is_error_text(text):
+    """True for the error message ``query_llama(raise_errors=False)`` returns.
+
+    Older memory logs stored such messages as answers.
+    """
+    return isinstance(text, str) and text.startswith(ERROR_PREFIX)
+
+
+def stream_llama(prompt, system_context=None, model=DEFAULT_MODEL, timeout=None):
+    """Yield answer text as it is generated. Raises :class:`OllamaError`."""
+    timeout = timeout or DEFAULT_TIMEOUT
+    if _use_http():
+        started = False
+        try:
+            for piece in get_client().stream(prompt, system=system_context, model=model, timeout=timeout):
+                started = True
+                yield piece
+            return
+        except OllamaError as e:
+            if started or not _fall_back(e):
+                raise
+    yield from _stream_subprocess(prompt, system_context, model, timeout)
+
+
+def query_llama(prompt, system_context=None, model=DEFAULT_MODEL, timeout=None, on_token=None, raise_errors=True):
+    """Return the model's answer to ``prompt``.
+
+    ``on_token`` is called with each piece of text as it streams in. Errors
+    raise :class:`OllamaError`; with ``raise_errors=False`` they are returned
+    as an error message instead, for callers that still expect text.
+    """
+    timeout = timeout or DEFAULT_TIMEOUT
+    with llm_slots, metrics.span("llm", model=model):
+        return _query(prompt, system_context, model, timeout, on_token, raise_errors)
+
+
+def _query(prompt, system_context, model, timeout, on_token, raise_errors):
+    try:
+        if on_token is not None:
+            parts = []
+            for piece in stream_llama(prompt, system_context, model, timeout):
+                parts.append(piece)
+                on_token(piece)
+            return "".join(parts).strip()
+        if _use_http():
+            try:
+                return get_client().generate(prompt, system=system_context, model=model, timeout=timeout)
+            except OllamaError as e:
+                if not _fall_back(e):
+                    raise
+        return _run_subprocess(prompt, system_context, model, timeout)
+    except OllamaError as e:
+        metrics.inc("rag_llm_errors_total", help="Failed LLM calls", kind=e.kind)
+        if raise_errors:
+            raise
+        return f"{ERROR_PREFIX}: {e}"
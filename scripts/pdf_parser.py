@@ -1,46 +1,219 @@
 import os
 import json
+import hashlib
 import fitz  # PyMuPDF
 from pathlib import Path
 from uuid import uuid4
 import re
+import threading
+
+from embedding_store import write_json_atomic
+from token_budget import TOKENIZER_NAME, count_tokens
 
 PDF_DIR = Path("data/pdfs")
 CHUNK_DIR = Path("data/text_chunks")
 
+# Chunk size in tokenizer tokens; MiniLM only embeds the first 256.
+MAX_CHUNK_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "32"))
+
+def chunker_signature(max_tokens=MAX_CHUNK_TOKENS, overlap=CHUNK_OVERLAP_TOKENS):
+    """Identifies the chunking settings, so changed settings force re-ingestion."""
+    return f"tokens={max_tokens};overlap={overlap};tokenizer={TOKENIZER_NAME}"
+
 def clean_text(text):
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
-def chunk_text(text, max_tokens=500):
-    sentences = re.split(r'(?<=[.?!])\s+', text)
-    chunks = []
-    current_chunk = ""
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) <= max_tokens:
-            current_chunk += sentence + " "
-        else:
-            chunks.append(current_chunk.strip())
-            current_chunk = sentence + " "
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    return chunks
-
-def parse_pdf_to_chunks(pdf_path):
-    doc = fitz.open(pdf_path)
-    full_text = ""
-    for page in doc:
-        full_text += page.get_text()
-    full_text = clean_text(full_text)
-    return chunk_text(full_text)
-
-def save_chunks_to_json(source_filename, chunks):
-    CHUNK_DIR.mkdir(parents=True, exist_ok=True)
-    out_path = CHUNK_DIR / f"{Path(source_filename).stem}_chunks.json"
-    data = [{
-        "id": str(uuid4()),
-        "source": source_filename,
-        "text": chunk
-    } for chunk in chunks]
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def iter_pages(pdf_path, on_page=None):
+    """Yield ``(page_number, text)`` one page at a time (1-based).
+
+    ``on_page(number, total)`` is called as each page is read.
+    """
+    with fitz.open(pdf_path) as doc:
+        for number, page in enumerate(doc, 1):
+            if on_page:
+                on_page(number, doc.page_count)
+            yield number, page.get_text()
+
+def _units(text, page, offset, max_tokens, count):
+    """Split cleaned page text into sentence units of at most ``max_tokens``.
+
+    Yields ``(text, page, char_start, char_end, tokens)``. Sentences that are
+    too long on their own (e.g. unpunctuated text) are split on word
+    boundaries.
+    """
+    for match in re.finditer(r'\S.*?(?:[.?!](?=\s|$)|$)', text):
+        sentence = match.group().strip()
+        if not sentence:
+            continue
+        start = offset + match.start()
+        tokens = count(sentence)
+        if tokens <= max_tokens:
+            yield sentence, page, start, start + len(sentence), tokens
+            continue
+        piece_start, piece_words, piece_tokens = None, [], 0
+        for word in re.finditer(r'\S+', sentence):
+            word_tokens = count(word.group())
+            if piece_words and piece_tokens + word_tokens > max_tokens:
+                piece = " ".join(piece_words)
+                yield piece, page, piece_start, piece_start + len(piece), piece_tokens
+                piece_start, piece_words, piece_tokens = None, [], 0
+            if piece_start is None:
+                piece_start = start + word.start()
+            piece_words.append(word.group())
+            piece_tokens += word_tokens
+        if piece_words:
+            piece = " ".join(piece_words)
+            yield piece, page, piece_start, piece_start + len(piece), piece_tokens
+
+def iter_chunks(pages, max_tokens=MAX_CHUNK_TOKENS, overlap=CHUNK_OVERLAP_TOKENS, count=count_tokens):
+    """Chunk ``(page_number, text)`` pairs lazily into token-capped chunks.
+
+    Only the chunk being built is held in memory, so peak memory does not
+    grow with the document. Each chunk carries its page range, character
+    offsets into the cleaned document text (pages joined by single spaces)
+    and token count. Consecutive chunks share up to ``overlap`` tokens of
+    trailing sentences.
+    """
+    overlap = max(0, min(overlap, max_tokens // 2))
+    current, current_tokens = [], 0
+    offset = 0
+
+    def build(units):
+        return {
+            "text": " ".join(u[0] for u in units),
+            "page_start": units[0][1],
+            "page_end": units[-1][1],
+            "char_start": units[0][2],
+            "char_end": units[-1][3],
+            "tokens": sum(u[4] for u in units),
+        }
+
+    for page, raw in pages:
+        text = clean_text(raw)
+        if not text:
+            continue
+        for unit in _units(text, page, offset, max_tokens, count):
+            if current and current_tokens + unit[4] > max_tokens:
+                yield build(current)
+                tail, tail_tokens = [], 0
+                for prev in reversed(current):
+                    if tail_tokens + prev[4] > overlap or tail_tokens + prev[4] + unit[4] > max_tokens:
+                        break
+                    tail.insert(0, prev)
+                    tail_tokens += prev[4]
+                current, current_tokens = tail, tail_tokens
+            current.append(unit)
+            current_tokens += unit[4]
+        offset += len(text) + 1
+    if current:
+        yield build(current)
+
+def chunk_text(text, max_tokens=MAX_CHUNK_TOKENS):
+    """Split ``text`` into chunk strings; kept for callers of the old API.
+
+    ``max_tokens`` is now a real token cap (it used to count characters).
+    New code should use ``iter_chunks``, which also returns page ranges.
+    """
+    return [chunk["text"] for chunk in iter_chunks([(1, text)], max_tokens)]
+
+def iter_pdf_chunks(pdf_path, max_tokens=MAX_CHUNK_TOKENS, overlap=CHUNK_OVERLAP_TOKENS, on_page=None):
+    return iter_chunks(iter_pages(pdf_path, on_page), max_tokens, overlap)
+
+def parse_pdf_to_chunks(pdf_path, max_tokens=MAX_CHUNK_TOKENS, overlap=CHUNK_OVERLAP_TOKENS):
+    return list(iter_pdf_chunks(pdf_path, max_tokens, overlap))
+
+def chunk_path_for(source_filename, chunk_dir=CHUNK_DIR):
+    # The hash keeps sources that share a stem (a.pdf, a.PDF, a.txt) apart.
+    source_filename = str(source_filename)
+    digest = hashlib.sha1(source_filename.encode("utf-8")).hexdigest()[:8]
+    return Path(chunk_dir) / f"{Path(source_filename).stem}_{digest}_chunks.json"
+
+def _legacy_chunk_path(source_filename, chunk_dir=CHUNK_DIR):
+    """The ``<stem>_chunks.json`` file older versions wrote, if it holds this source."""
+    path = Path(chunk_dir) / f"{Path(str(source_filename)).stem}_chunks.json"
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if data and isinstance(data[0], dict) and data[0].get("source") == str(source_filename):
+        return path
+    return None
+
+def delete_document(source_filename, chunk_files=None, chunk_dir=CHUNK_DIR, pdf_dir=PDF_DIR):
+    """Remove a document's chunk files and PDF; False if it was never ingested.
+
+    ``chunk_files`` are the files recorded for the source in the corpus
+    (``rag_engine.document_files``); by default its own chunk file.
+    Only that document's shard changes: the next corpus sync drops its
+    manifest entries and leaves every other file's vectors untouched.
+    """
+    if chunk_files is None:
+        chunk_files = [p for p in (chunk_path_for(source_filename, chunk_dir),
+                                   _legacy_chunk_path(source_filename, chunk_dir)) if p and p.exists()]
+    removed = False
+    for path in chunk_files:
+        try:
+            Path(path).unlink()
+            removed = True
+        except FileNotFoundError:
+            pass
+    if not removed:
+        return False
+    pdf_path = Path(pdf_dir) / Path(source_filename).name
+    if pdf_path.exists():
+        pdf_path.unlink()
+    return True
+
+def _chunk_record(source_filename, chunk):
+    if isinstance(chunk, str):
+        chunk = {"text": chunk}
+    return {"id": str(uuid4()), "source": source_filename, **chunk}
+
+def save_chunks_to_json(source_filename, chunks, chunk_dir=CHUNK_DIR):
+    """Write chunks (dicts from the chunker, or plain strings) for one source.
+
+    ``chunks`` may be any iterable, including a generator; records are
+    streamed to a temp file that is renamed into place, so readers never
+    see a partial file. Returns ``(path, count)``.
+    """
+    out_path = chunk_path_for(source_filename, chunk_dir)
+    if isinstance(chunks, list):
+        data = [_chunk_record(source_filename, c) for c in chunks]
+        write_json_atomic(out_path, data, indent=2)
+        _drop_legacy(source_filename, chunk_dir)
+        return out_path, len(data)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(f"{out_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    count = 0
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("[")
+            for chunk in chunks:
+                record = json.dumps(_chunk_record(source_filename, chunk), indent=2, ensure_ascii=False)
+                f.write(("," if count else "") + "\n  " + record.replace("\n", "\n  "))
+                count += 1
+            f.write("\n]" if count else "]")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, out_path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    _drop_legacy(source_filename, chunk_dir)
+    return out_path, count
+
+def _drop_legacy(source_filename, chunk_dir=CHUNK_DIR):
+    """Re-ingesting replaces an old-style chunk file instead of duplicating it."""
+    legacy = _legacy_chunk_path(source_filename, chunk_dir)
+    if legacy is not None:
+        legacy.unlink()
+
+def ingest_pdf(pdf_path, source_filename=None, chunk_dir=CHUNK_DIR, on_page=None):
+    """Stream a PDF straight into its chunk file; returns the chunk count."""
+    source_filename = source_filename or Path(pdf_path).name
+    chunks = iter_pdf_chunks(pdf_path, on_page=on_page)
+    _, count = save_chunks_to_json(source_filename, chunks, chunk_dir)
+    return count
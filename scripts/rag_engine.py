@@ -1,30 +1,238 @@
 import os
-import json
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 from pathlib import Path
 
+from embedding_store import get_store as _get_store
+from embedding_model import MODEL_NAME, encode_texts, encode_queries, warm_up
+import ann_index
+import lexical_index
+import memory_chunker
+import metrics
+
 CHUNK_DIR = Path("data/text_chunks")
-model = SentenceTransformer('all-MiniLM-L6-v2')
+
+# Retrieval backend: "exact" (default), "ivf" or "hnsw". See ann_index.py.
+RETRIEVAL_BACKEND = os.environ.get("RAG_BACKEND", ann_index.DEFAULT_BACKEND)
+
+# Retrieval mode:
+#   dense     - embedding similarity only (default)
+#   lexical   - BM25 only
+#   hybrid    - reciprocal-rank fusion of the dense and BM25 rankings
+#   prefilter - BM25 picks up to PREFILTER_CANDIDATES chunks, which are then
+#               ranked by embedding similarity (falls back to dense when no
+#               chunk shares a term with the query)
+RETRIEVAL_MODE = os.environ.get("RAG_MODE", "dense")
+MODES = ("dense", "lexical", "hybrid", "prefilter")
+# How deep each ranking goes before fusion, as a multiple of top_k.
+HYBRID_DEPTH = 4
+PREFILTER_CANDIDATES = int(os.environ.get("RAG_PREFILTER_CANDIDATES", "1000"))
+
+_row_lookup = (None, {})
+_corpus = (None, 0, {}, {})  # (rows, version, shards, files)
+_corpus_lock = threading.Lock()
+
+
+def get_store():
+    return _get_store(MODEL_NAME)
+
+
+def _sync():
+    """``(metadata, rows, (version, shards, files))`` for the current corpus."""
+    with metrics.span("chunk_load"):
+        metadata, rows, spans = get_store().sync(encode_texts, CHUNK_DIR, spans=True)
+    return metadata, rows, _corpus_state(metadata, rows, spans)
+
+
+def load_corpus():
+    """Return chunk metadata and their store rows, encoding only new chunks."""
+    metadata, rows, _ = _sync()
+    return metadata, rows
+
 
 def load_chunks():
-    texts = []
-    metadata = []
-    for file in CHUNK_DIR.glob("*.json"):
-        with open(file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            for entry in data:
-                texts.append(entry["text"])
-                metadata.append(entry)
-    return texts, metadata
-
-def get_relevant_chunks(query, top_k=5):
-    texts, metadata = load_chunks()
-    if not texts:
+    """Return ``(texts, metadata)`` for every chunk; kept for callers of the old API.
+
+    Goes through ``load_corpus``, so new chunks are encoded into the store.
+    """
+    metadata, _ = load_corpus()
+    return [entry["text"] for entry in metadata], metadata
+
+
+def _corpus_state(metadata, rows, spans):
+    """Version, shards and chunk files of the corpus whose rows are ``rows``.
+
+    The version goes up whenever the assembled corpus changes (a chunk file
+    was added, edited or deleted), so indexes keyed on it are never reused
+    for another corpus. Shards map each source to its ``(start, stop)``
+    spans of the corpus; a document's chunks are consecutive within its
+    chunk file. ``files`` maps each source to the chunk files holding it.
+    """
+    global _corpus
+    with _corpus_lock:
+        if _corpus[0] is not rows:
+            shards, files = {}, {}
+            for name, first, last in spans:
+                start = first
+                for i in range(first + 1, last + 1):
+                    if i == last or metadata[i].get("source") != metadata[start].get("source"):
+                        source = metadata[start].get("source")
+                        shards.setdefault(source, []).append((start, i))
+                        files.setdefault(source, set()).add(name)
+                        start = i
+            _corpus = (rows, _corpus[1] + 1, shards, files)
+        return _corpus[1:]
+
+
+def _lookup(rows):
+    global _row_lookup
+    if _row_lookup[0] is not rows:
+        lookup = {}
+        for i, r in enumerate(rows.tolist()):
+            lookup.setdefault(r, i)
+        _row_lookup = (rows, lookup)
+    return _row_lookup[1]
+
+
+def _scope(shards, rows, sources):
+    """Spans, sorted store rows and a row -> chunk lookup for ``sources`` only."""
+    if isinstance(sources, str):
+        sources = [sources]
+    ranges = sorted(span for source in set(sources) for span in shards.get(source, ()))
+    if not ranges:
+        return [], np.zeros(0, dtype=np.int64), {}
+    positions = np.concatenate([np.arange(start, stop) for start, stop in ranges])
+    scoped = rows[positions]
+    lookup = {}
+    for pos, r in zip(positions.tolist(), scoped.tolist()):
+        lookup.setdefault(r, pos)
+    return ranges, np.unique(scoped), lookup
+
+
+def list_documents():
+    """``[{"source", "chunks", "chunk_files"}]`` for every ingested document.
+
+    Memory-log chunks are part of the corpus but not a document, so they are
+    not listed (and cannot be deleted here).
+    """
+    _, _, (_, shards, files) = _sync()
+    return [
+        {
+            "source": source,
+            "chunks": sum(stop - start for start, stop in spans),
+            "chunk_files": sorted(files[source]),
+        }
+        for source, spans in shards.items()
+        if not any(memory_chunker.is_memory_chunk_file(name) for name in files[source])
+    ]
+
+
+def document_files(source):
+    """Paths of the chunk files holding ``source``, or ``None`` if it is not a document."""
+    _, _, (_, _, files) = _sync()
+    names = files.get(source)
+    if not names or any(memory_chunker.is_memory_chunk_file(name) for name in names):
+        return None
+    return [CHUNK_DIR / name for name in sorted(names)]
+
+
+def _dense_on(vectors, candidates, query_vec, k):
+    """Rank ``candidates`` (store rows) by similarity to one query vector."""
+    candidates = np.sort(candidates)
+    scores = np.asarray(vectors[candidates], dtype=np.float32) @ query_vec
+    return candidates[ann_index.top_k_indices(scores, k)[0]]
+
+
+def get_relevant_chunks_batch(queries, top_k=5, backend=None, mode=None, sources=None, **search_params):
+    """Return the ``top_k`` chunks for each query in ``queries``.
+
+    All queries are encoded in one model call and scored together.
+    ``backend`` selects the nearest-neighbour index (default
+    ``RETRIEVAL_BACKEND``); ``search_params`` such as ``nprobe``, ``ef`` or
+    ``block_size`` are passed through to it to trade recall for latency.
+    ``mode`` picks dense, lexical, hybrid or prefilter retrieval (default
+    ``RETRIEVAL_MODE``).
+
+    ``sources`` limits the search to those documents (chunk ``source``
+    values such as PDF file names). Each document is a shard: scoped and
+    exact searches score the shards in parallel and merge a global top-k,
+    so a scoped query costs the size of its documents, not the library.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    queries = list(queries)
+    if not queries:
         return []
-    query_vec = model.encode([query])
-    text_vecs = model.encode(texts)
-    sims = cosine_similarity(query_vec, text_vecs)[0]
-    top_indices = np.argsort(sims)[-top_k:][::-1]
-    return [metadata[i] for i in top_indices]
+    metadata, rows, (version, shards, _) = _sync()
+    if not metadata:
+        return [[] for _ in queries]
+    store = get_store()
+    fingerprint = (store.generation, store.count, version)
+    backend = backend or RETRIEVAL_BACKEND
+    if sources is not None:
+        ranges, allowed, lookup = _scope(shards, rows, sources)
+        if not ranges:
+            return [[] for _ in queries]
+    else:
+        allowed, lookup = None, _lookup(rows)
+        ranges = [(0, len(rows))] if backend == "exact" else None
+
+    lexical = None
+    if mode != "dense":
+        lexical = lexical_index.get_lexical_index(metadata, rows, fingerprint, store.generation)
+    if mode == "lexical":
+        with metrics.span("lexical"):
+            results = [lexical.search(q, top_k, allowed)[0].tolist() for q in queries]
+        return [[metadata[lookup[r]] for r in row if r in lookup] for row in results]
+
+    query_vecs = encode_queries(queries)
+    if mode == "prefilter":
+        vectors = store.vectors()
+        results, fallback = [None] * len(queries), []
+        with metrics.span("similarity", backend="prefilter"):
+            for i, (q, vec) in enumerate(zip(queries, query_vecs)):
+                candidates, _ = lexical.search(q, PREFILTER_CANDIDATES, allowed)
+                if len(candidates):
+                    results[i] = _dense_on(vectors, candidates, vec, top_k).tolist()
+                else:
+                    fallback.append(i)
+        if fallback:
+            query_vecs = query_vecs[fallback]
+    else:
+        results, fallback = None, list(range(len(queries)))
+
+    if fallback:
+        depth = top_k * HYBRID_DEPTH if mode == "hybrid" else top_k
+        if ranges is not None:
+            # Scoped queries always search their shards exactly.
+            with metrics.span("similarity", backend="shards"):
+                ids, _ = ann_index.search_shards(store.vectors(), rows, ranges, query_vecs, depth,
+                                                 block_size=search_params.get("block_size") or 65536)
+        else:
+            index = ann_index.get_index(
+                backend,
+                store.vectors(),
+                rows,
+                fingerprint=fingerprint,
+                generation=store.generation,
+            )
+            with metrics.span("similarity", backend=index.name):
+                ids, _ = index.search(query_vecs, depth, **search_params)
+        dense = ids.tolist()
+        if mode == "hybrid":
+            with metrics.span("lexical"):
+                dense = [
+                    lexical_index.rrf([ranking, lexical.search(queries[i], depth, allowed)[0].tolist()], top_k)
+                    for i, ranking in zip(fallback, dense)
+                ]
+        if results is None:
+            results = dense
+        else:
+            for i, ranking in zip(fallback, dense):
+                results[i] = ranking
+    return [[metadata[lookup[r]] for r in row if r in lookup] for row in results]
+
+
+def get_relevant_chunks(query, top_k=5, backend=None, mode=None, sources=None, **search_params):
+    return get_relevant_chunks_batch([query], top_k, backend, mode, sources, **search_params)[0]
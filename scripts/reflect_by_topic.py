@@ -1,39 +1,23 @@
 #!/usr/bin/env python3
 """Summarize memory entries by topic."""
 import argparse
-import json
-from collections import defaultdict
 from pathlib import Path
 
-from memory_manager import extract_topic
+import memory_store
+import topic_service
 
-def filter_entries(entries, threshold):
-    """Return entries with impact_score >= threshold."""
-    if threshold <= 0:
-        return entries
-    return [e for e in entries if e.get("impact_score", 0) >= threshold]
-
-def load_entries(path: Path):
-    if not path.exists():
-        print(f"No memory file found at {path}")
-        return []
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        print("Memory file contains invalid JSON")
-        return []
 
+def load_groups(path: Path, threshold=0):
+    """``{topic: entries}`` for entries scoring at least ``threshold``.
 
-def group_by_topic(entries):
-    groups = defaultdict(list)
-    for e in entries:
-        topic = e.get("topic")
-        if not topic:
-            text = f"{e.get('question', '')} {e.get('summary', '')} {e.get('answer', '')}"
-            topic = extract_topic(text) or "misc"
-        groups[topic].append(e)
-    return groups
+    Topics come from the store's aggregates and each topic's entries are
+    read through the topic index, so the log is never loaded as a whole.
+    """
+    if not path.exists() and not memory_store.db_path_for(path).exists():
+        print(f"No memory file found at {path}")
+        return {}
+    topic_service.label_pending(path)
+    return memory_store.get_store(path).topic_groups(threshold if threshold > 0 else None)
 
 
 def topic_summary(topic, entries):
@@ -56,7 +40,7 @@ def main():
         "--memory-file",
         type=Path,
         default=Path("data/memory/memory.json"),
-        help="Path to memory JSON file",
+        help="Path to the memory log (memory.json or memory.db)",
     )
     parser.add_argument(
         "--show-top",
@@ -71,14 +55,12 @@ def main():
     )
 
     args = parser.parse_args()
-    entries = load_entries(args.memory_file)
-    entries = filter_entries(entries, args.score_threshold)
+    groups = load_groups(args.memory_file, args.score_threshold)
 
-    if not entries:
+    if not groups:
         print("No memory entries to reflect on.")
         return
 
-    groups = group_by_topic(entries)
     for topic, items in groups.items():
         print("\n" + topic_summary(topic, items))
         if args.show_top:
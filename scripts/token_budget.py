@@ -0,0 +1,71 @@
+"""Token counting shared by the chunker and prompt assembly.
+
+Two budgets are counted, with different tokenizers:
+
+* chunk sizes use the retrieval model's own tokenizer (``TOKENIZER_NAME``,
+  loaded on its own via ``transformers`` without the model weights), so
+  chunks match what the embedding model actually sees;
+* the prompt context is counted for the LLM. Set ``PROMPT_TOKENIZER_NAME``
+  to the Hugging Face name of the LLM's tokenizer for exact counts.
+  Otherwise embedding-tokenizer counts are scaled by
+  ``PROMPT_TOKEN_MARGIN`` (default 1.25), because LLM tokenizers are
+  case-sensitive and split numbers into more pieces than MiniLM's
+  lower-cased WordPiece.
+
+If a tokenizer cannot be loaded a word/punctuation estimate is used instead.
+"""
+import math
+import os
+import re
+import threading
+
+TOKENIZER_NAME = os.environ.get("TOKENIZER_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+PROMPT_TOKENIZER_NAME = os.environ.get("PROMPT_TOKENIZER_NAME", "")
+PROMPT_TOKEN_MARGIN = float(os.environ.get("PROMPT_TOKEN_MARGIN", "1.25"))
+
+_tokenizers = {}
+_tokenizer_lock = threading.Lock()
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def get_tokenizer(name=TOKENIZER_NAME):
+    """Return the shared tokenizer ``name``, or ``False`` if it is unavailable."""
+    tokenizer = _tokenizers.get(name)
+    if tokenizer is None:
+        with _tokenizer_lock:
+            tokenizer = _tokenizers.get(name)
+            if tokenizer is None:
+                try:
+                    from transformers import AutoTokenizer
+
+                    tokenizer = AutoTokenizer.from_pretrained(name)
+                except Exception:
+                    tokenizer = False
+                _tokenizers[name] = tokenizer
+    return tokenizer
+
+
+def estimate_tokens(text):
+    # Sub-word tokenizers split long words; ~1.3 pieces per word is typical.
+    return int(len(_PIECES.findall(text)) * 1.3 + 0.5)
+
+
+def count_tokens(text, tokenizer=TOKENIZER_NAME):
+    if not text:
+        return 0
+    loaded = get_tokenizer(tokenizer)
+    if loaded:
+        return len(loaded.encode(text, add_special_tokens=False))
+    return estimate_tokens(text)
+
+
+def prompt_tokens(embedding_tokens):
+    """LLM prompt tokens for text counted at ``embedding_tokens`` without ``PROMPT_TOKENIZER_NAME``."""
+    return math.ceil(embedding_tokens * PROMPT_TOKEN_MARGIN)
+
+
+def count_prompt_tokens(text):
+    """Tokens ``text`` costs in the LLM prompt (exact or with the safety margin)."""
+    if PROMPT_TOKENIZER_NAME:
+        return count_tokens(text, PROMPT_TOKENIZER_NAME)
+    return prompt_tokens(count_tokens(text))
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""Semantic topic clusters over the memory log.
+
+Keyword topics (``topic_service``) give every entry its single strongest
+keyword, which splits one subject into many small topics. This module
+groups entries by meaning instead: entries are embedded in batches (reusing
+the vectors of their memory chunks when the embedding store already has
+them) and assigned with a threshold clusterer done in NumPy. Each new
+vector joins the most similar centroid if the cosine similarity is at
+least ``threshold``; the rest are grouped among themselves, leader-style,
+into new clusters. Centroids are running means, so the state only holds
+per-cluster vector sums and counts.
+
+Updates are incremental like ``memory_chunker``: the state records the
+log's ``rev`` watermark and a content hash per entry, so a run embeds only
+entries added or edited since the last one. An edited entry is moved out
+of its old cluster by subtracting that cluster's mean (the old vector is
+not kept) and its own term counts, which are kept per entry; ``--full``
+re-clusters from scratch.
+
+Clusters are labelled by their most distinctive terms (class-based TF-IDF
+over the question and summary term counts kept per cluster).
+
+    python scripts/topic_clusters.py            # catch up and list clusters
+    python scripts/topic_clusters.py --full
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+from embedding_model import MODEL_NAME, encode_texts
+from embedding_store import FileLock, normalize, write_json_atomic
+import embedding_store
+import memory_chunker
+import memory_store
+import metrics
+
+STATE_FILE = Path("data/memory/topic_clusters.json")
+THRESHOLD = float(os.environ.get("CLUSTER_THRESHOLD", "0.5"))
+BATCH_SIZE = 1024
+LABEL_TERMS = 3
+
+
+def vectors_path(state_file=STATE_FILE):
+    return Path(state_file).with_suffix(".npy")
+
+
+def entry_text(entry):
+    return memory_chunker.create_chunk(entry)["text"]
+
+
+def label_text(entry):
+    return f"{entry.get('question') or ''} {entry.get('summary') or ''}"
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def embed(texts):
+    """Unit vectors for ``texts``, taken from the embedding store where possible."""
+    try:
+        stored = embedding_store.get_store(MODEL_NAME).vectors_for(texts)
+    except Exception:
+        stored = [None] * len(texts)
+    missing = [i for i, v in enumerate(stored) if v is None]
+    if missing:
+        encoded = encode_texts([texts[i] for i in missing])
+        for i, vec in zip(missing, encoded):
+            stored[i] = vec
+    return normalize(np.vstack(stored)) if texts else np.zeros((0, 0), dtype=np.float32)
+
+
+class TopicClusters:
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+        self.sums = None                # (clusters, dim) float32
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.terms = []                 # per cluster: {term: count}
+        self.entries = {}               # entry id -> [cluster, text hash, {term: count}]
+        self.rev = 0
+
+    def __len__(self):
+        return int((self.counts > 0).sum())
+
+    def centroids(self):
+        if self.sums is None:
+            return None
+        return normalize(self.sums / np.maximum(self.counts, 1)[:, None])
+
+    # -- assignment ----------------------------------------------------------
+
+    def _new_clusters(self, vectors):
+        """Group ``vectors`` leader-style; returns a local cluster index per row."""
+        n = len(vectors)
+        local = np.full(n, -1, dtype=np.int64)
+        sims = vectors @ vectors.T
+        k = 0
+        for i in range(n):
+            if local[i] >= 0:
+                continue
+            members = (local < 0) & (sims[i] >= self.threshold)
+            members[i] = True
+            local[members] = k
+            k += 1
+        return local, k
+
+    def assign(self, vectors):
+        """Cluster index for each row of ``vectors``, creating clusters as needed."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.sums is None:
+            self.sums = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        labels = np.full(len(vectors), -1, dtype=np.int64)
+        if len(self.counts):
+            sims = vectors @ self.centroids().T
+            sims[:, self.counts == 0] = -np.inf
+            best = sims.argmax(axis=1)
+            hit = sims[np.arange(len(vectors)), best] >= self.threshold
+            labels[hit] = best[hit]
+        rest = np.flatnonzero(labels < 0)
+        if len(rest):
+            local, k = self._new_clusters(vectors[rest])
+            labels[rest] = len(self.counts) + local
+            self.sums = np.vstack([self.sums, np.zeros((k, self.sums.shape[1]), dtype=np.float32)])
+            self.counts = np.concatenate([self.counts, np.zeros(k, dtype=np.int64)])
+            self.terms.extend({} for _ in range(k))
+        np.add.at(self.sums, labels, vectors)
+        self.counts += np.bincount(labels, minlength=len(self.counts))
+        return labels
+
+    def remove(self, cluster, terms=None):
+        """Take one (edited) entry out of ``cluster``, approximating its vector by the mean.
+
+        ``terms`` are the entry's own term counts, as returned by ``add_terms``.
+        """
+        if self.counts[cluster] > 1:
+            self.sums[cluster] -= self.sums[cluster] / self.counts[cluster]
+        else:
+            self.sums[cluster] = 0
+        self.counts[cluster] -= 1
+        cluster_terms = self.terms[cluster]
+        for term, c in (terms or {}).items():
+            left = cluster_terms.get(term, 0) - c
+            if left > 0:
+                cluster_terms[term] = left
+            else:
+                cluster_terms.pop(term, None)
+
+    def add_terms(self, labels, texts):
+        """Add the batch's term counts to each entry's cluster; returns each entry's counts."""
+        vectorizer = CountVectorizer(token_pattern=r"(?u)\b[a-zA-Z]{3,}\b", stop_words="english")
+        try:
+            counts = vectorizer.fit_transform(texts).tocsr()
+        except ValueError:  # no terms at all
+            return [{} for _ in texts]
+        vocab = vectorizer.get_feature_names_out()
+        per_entry = [
+            {vocab[j]: int(c) for j, c in zip(counts.indices[counts.indptr[i]:counts.indptr[i + 1]],
+                                              counts.data[counts.indptr[i]:counts.indptr[i + 1]])}
+            for i in range(len(texts))
+        ]
+        clusters, inverse = np.unique(labels, return_inverse=True)
+        onehot = sparse.csr_matrix(
+            (np.ones(len(labels)), (inverse, np.arange(len(labels)))), shape=(len(clusters), len(labels))
+        )
+        per_cluster = (onehot @ counts).tocsr()
+        for row, cluster in enumerate(clusters):
+            start, end = per_cluster.indptr[row], per_cluster.indptr[row + 1]
+            terms = self.terms[cluster]
+            for j, c in zip(per_cluster.indices[start:end], per_cluster.data[start:end]):
+                term = vocab[j]
+                terms[term] = terms.get(term, 0) + int(c)
+        return per_entry
+
+    # -- labels --------------------------------------------------------------
+
+    def labels(self, n_terms=LABEL_TERMS):
+        """``{cluster: "term1 / term2 / term3"}`` for non-empty clusters."""
+        live = np.flatnonzero(self.counts > 0)
+        df = {}
+        for c in live:
+            for term in self.terms[c]:
+                df[term] = df.get(term, 0) + 1
+        out = {}
+        for c in live:
+            terms = self.terms[c]
+            total = sum(terms.values()) or 1
+            scored = sorted(
+                terms.items(),
+                key=lambda kv: (-(kv[1] / total) * math.log(1 + len(live) / df[kv[0]]), kv[0]),
+            )
+            out[int(c)] = " / ".join(t for t, _ in scored[:n_terms]) or f"cluster {c}"
+        return out
+
+    # -- persistence ---------------------------------------------------------
+
+    def save(self, state_file=STATE_FILE):
+        state_file = Path(state_file)
+        state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = vectors_path(state_file).with_suffix(".tmp.npy")
+        np.save(tmp, self.sums if self.sums is not None else np.zeros((0, 0), dtype=np.float32))
+        os.replace(tmp, vectors_path(state_file))
+        write_json_atomic(state_file, {
+            "threshold": self.threshold,
+            "rev": self.rev,
+            "counts": self.counts.tolist(),
+            "terms": self.terms,
+            "entries": self.entries,
+        })
+
+    @classmethod
+    def load(cls, state_file=STATE_FILE, threshold=THRESHOLD):
+        """The saved clusters, or an empty set if missing or built with another threshold."""
+        clusters = cls(threshold)
+        try:
+            with open(state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            sums = np.load(vectors_path(state_file))
+        except (OSError, ValueError):
+            return clusters
+        if state.get("threshold") != threshold or len(sums) != len(state["counts"]):
+            return clusters
+        clusters.sums = sums.astype(np.float32) if len(sums) else None
+        clusters.counts = np.asarray(state["counts"], dtype=np.int64)
+        clusters.terms = state["terms"]
+        clusters.entries = state["entries"]
+        clusters.rev = state["rev"]
+        return clusters
+
+
+def _apply(clusters, batch):
+    """Cluster a batch of changed entries."""
+    fresh_ids, fresh_texts, term_texts, hashes = [], [], [], []
+    for entry in batch:
+        text = entry_text(entry)
+        h = _text_hash(text)
+        known = clusters.entries.get(entry["id"])
+        if known is not None:
+            if known[1] == h:
+                continue  # only the topic, score or timestamp changed
+            # State saved before per-entry terms were kept has no counts to subtract.
+            clusters.remove(known[0], known[2] if len(known) > 2 else None)
+        fresh_ids.append(entry["id"])
+        fresh_texts.append(text)
+        term_texts.append(label_text(entry))
+        hashes.append(h)
+    if not fresh_ids:
+        return 0
+    labels = clusters.assign(embed(fresh_texts))
+    terms = clusters.add_terms(labels, term_texts)
+    for entry_id, label, h, entry_terms in zip(fresh_ids, labels.tolist(), hashes, terms):
+        clusters.entries[entry_id] = [label, h, entry_terms]
+    return len(fresh_ids)
+
+
+def update(memory_file=memory_store.MEMORY_FILE, state_file=STATE_FILE, threshold=THRESHOLD,
+           full=False, batch_size=BATCH_SIZE):
+    """Bring the clusters up to date with the memory log; returns ``(clusters, changed)``."""
+    store = memory_store.get_store(memory_file)
+    state_file = Path(state_file)
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    with FileLock(state_file.with_suffix(".lock")):
+        clusters = TopicClusters(threshold) if full else TopicClusters.load(state_file, threshold)
+        changed, batch, rev = 0, [], clusters.rev
+        with metrics.span("topic_cluster"):
+            for rev, entry in store.changes_since(clusters.rev):
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    changed += _apply(clusters, batch)
+                    batch = []
+            if batch:
+                changed += _apply(clusters, batch)
+        if rev != clusters.rev or full:
+            clusters.rev = rev
+            clusters.save(state_file)
+    return clusters, changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster memory entries by meaning")
+    parser.add_argument("--memory-file", type=Path, default=memory_store.MEMORY_FILE)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Minimum cosine similarity to join a cluster")
+    parser.add_argument("--full", action="store_true", help="Re-cluster the whole log")
+    args = parser.parse_args()
+
+    clusters, changed = update(args.memory_file, threshold=args.threshold, full=args.full)
+    print(f"✅ Clustered {changed} new or edited entries into {len(clusters)} clusters")
+    labels = clusters.labels()
+    for c in sorted(labels, key=lambda c: -clusters.counts[c]):
+        print(f"  {clusters.counts[c]:>6}  {labels[c]}")
+
+
+if __name__ == "__main__":
+    main()
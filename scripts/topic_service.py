@@ -0,0 +1,201 @@
+"""Topic labels for memory entries.
+
+Keywords are extracted with KeyBERT on top of the shared retrieval model,
+many entries per call, and the resulting label is written back to the
+entry's ``topic`` column. The database is therefore the cache: an entry is
+labelled once, and later runs of the reflection, analytics and gap scripts
+do no model inference for it. A bounded in-process LRU keyed by entry id
+(``TOPIC_CACHE_SIZE`` entries) covers entries that have no database row
+(e.g. logs passed in by hand).
+
+New entries are labelled off the request path by :class:`TopicLabeler`, a
+background thread that drains a queue in batches; :func:`label_pending`
+catches up on anything it has not reached before a report is generated.
+"""
+import atexit
+import os
+import queue
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from embedding_model import get_model
+import memory_store
+import metrics
+
+BATCH_SIZE = 64
+CACHE_SIZE = int(os.environ.get("TOPIC_CACHE_SIZE", "10000"))
+
+_kw_model = None
+_kw_lock = threading.Lock()
+_cache = OrderedDict()     # entry id -> topic, least recently used first
+_cache_lock = threading.Lock()
+
+
+def _keybert():
+    global _kw_model
+    if _kw_model is None:
+        with _kw_lock:
+            if _kw_model is None:
+                try:
+                    from keybert import KeyBERT
+
+                    _kw_model = KeyBERT(model=get_model())
+                except Exception:
+                    _kw_model = False
+    return _kw_model
+
+
+def _cached_topic(entry_id):
+    with _cache_lock:
+        topic = _cache.get(entry_id)
+        if topic is not None:
+            _cache.move_to_end(entry_id)
+        return topic
+
+
+def _remember_topic(entry_id, topic):
+    with _cache_lock:
+        _cache[entry_id] = topic
+        _cache.move_to_end(entry_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def entry_text(entry):
+    return f"{entry.get('question', '')} {entry.get('summary', '')} {entry.get('answer', '')}"
+
+
+def fallback_topic(text):
+    """Most frequent non-stopword, for when KeyBERT is unavailable."""
+    words = re.findall(r"\b[a-zA-Z]{3,}\b", text.lower())
+    words = [w for w in words if w not in ENGLISH_STOP_WORDS]
+    if not words:
+        return ""
+    return Counter(words).most_common(1)[0][0]
+
+
+def extract_topics(texts, batch_size=BATCH_SIZE):
+    """Return one topic label per text ("" if none could be found)."""
+    texts = list(texts)
+    topics = []
+    model = _keybert()
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        keywords = None
+        if model:
+            try:
+                keywords = model.extract_keywords(batch, stop_words="english", top_n=1)
+                # KeyBERT unwraps the result when given a single document.
+                if len(batch) == 1 and (not keywords or isinstance(keywords[0], tuple)):
+                    keywords = [keywords]
+            except Exception:
+                keywords = None
+        if keywords is None:
+            topics.extend(fallback_topic(t) for t in batch)
+        else:
+            topics.extend(kw[0][0] if kw else fallback_topic(t) for kw, t in zip(keywords, batch))
+    return topics
+
+
+def extract_topic(text):
+    return extract_topics([text])[0]
+
+
+def label_entries(entries, memory_file=None, batch_size=BATCH_SIZE):
+    """Fill in ``topic`` on entries that lack one, in place, and return them.
+
+    With ``memory_file`` the computed labels are also stored in that log.
+    Entries without any extractable keyword are labelled ``"misc"``.
+    """
+    missing, updates = [], []
+    for entry in entries:
+        if entry.get("topic"):
+            continue
+        cached = _cached_topic(entry.get("id"))
+        if cached:
+            entry["topic"] = cached
+            updates.append((entry["id"], cached))
+        else:
+            missing.append(entry)
+    if missing:
+        with metrics.span("topic_extract"):
+            topics = extract_topics([entry_text(e) for e in missing], batch_size)
+    else:
+        topics = []
+    for entry, topic in zip(missing, topics):
+        entry["topic"] = topic or "misc"
+        if entry.get("id"):
+            _remember_topic(entry["id"], entry["topic"])
+            updates.append((entry["id"], entry["topic"]))
+    if memory_file is not None and updates:
+        memory_store.get_store(memory_file).set_topics(updates)
+    return entries
+
+
+def label_pending(memory_file=memory_store.MEMORY_FILE, batch_size=BATCH_SIZE):
+    """Label every stored entry that has no topic yet; returns how many."""
+    store = memory_store.get_store(memory_file)
+    entries = store.unlabelled()
+    label_entries(entries, memory_file, batch_size)
+    return len(entries)
+
+
+class TopicLabeler:
+    """Background worker that labels newly added entries in batches."""
+
+    def __init__(self, memory_file=memory_store.MEMORY_FILE, batch_size=BATCH_SIZE):
+        self.memory_file = memory_file
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, entry):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="topic-labeler", daemon=True)
+                self._thread.start()
+        self._queue.put(entry)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                label_entries(batch, self.memory_file, self.batch_size)
+            except Exception as e:
+                # Unlabelled entries are picked up by the next analytics run.
+                print(f"⚠️ Topic labelling failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def wait(self):
+        """Block until every submitted entry has been labelled."""
+        if self._thread is not None:
+            self._queue.join()
+
+
+_labelers = {}
+_labelers_lock = threading.Lock()
+
+
+def get_labeler(memory_file=memory_store.MEMORY_FILE):
+    with _labelers_lock:
+        labeler = _labelers.get(str(memory_file))
+        if labeler is None:
+            labeler = _labelers[str(memory_file)] = TopicLabeler(memory_file)
+        return labeler
+
+
+@atexit.register
+def _drain():
+    for labeler in list(_labelers.values()):
+        labeler.wait()